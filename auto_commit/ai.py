@@ -1,18 +1,53 @@
 """AI-powered commit message generation using Google Gemini API - refactored."""
 
+import asyncio
+import functools
 import os
-import signal
-from contextlib import contextmanager
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import Optional
+from typing import Callable, Optional
+from .circuit import CircuitOpen, allow_request, record_failure, record_success, retry_in
+from .deadline import Deadline, DeadlineExceeded, call_with_timeout
 from .logger import get_logger
+from .ratelimit import (
+    QUOTA_RETRIES, RateLimited, acquire, backoff_delay, is_quota_error,
+    report_rate_limited, retry_after_hint
+)
+from .models import (
+    get_model_order, record_model_success, record_model_unavailable, record_model_failure,
+    record_model_latency
+)
+from .cache import file_summary_key, get_file_summaries, store_file_summaries
+from .prompt_builder import (
+    SYSTEM_INSTRUCTION, build_diff_prompt, diff_paths, estimate_tokens, parse_diff, render_files, split_diff
+)
+from .providers import Provider, get_provider, register_provider
+from .tokens import PromptTooLarge, prompt_budget, record_size_error, record_token_count, size_error
 
 # Load .env file from current working directory if it exists
 load_dotenv()
 
 logger = get_logger()
 
+
+class ResponseRejected(Exception):
+    """Raised when a model answered but its response can't be used (blocked or empty)."""
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default."""
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+
 # Default API key for dev.mk - hardcoded for all users
 # Users can override with their own key via GEMINI_API_KEY environment variable if needed
 # This key is shared for all installations
@@ -21,311 +56,213 @@ DEFAULT_API_KEY = os.getenv("DEV_MK_GEMINI_API_KEY", "AIzaSyDTkoEzqL1JUji-i3MYdX
 # Timeout for API requests (seconds)
 API_TIMEOUT = 30
 
+# Overall time budget for generating one commit message (seconds)
+# Every request gets the remaining time; 0 or less means no overall limit
+GENERATION_DEADLINE = _env_float("AUTOCOMMIT_AI_DEADLINE", 60.0)
+
 # Maximum diff length to process (characters)
 # Gemini models have token limits, so we truncate very long diffs
 MAX_DIFF_LENGTH = 50000
 
+# Maximum diff size to read from git (bytes). Hunks are ranked over everything
+# read before being packed into the token budget, and map-reduce packs every
+# chunk into its own budget, so this is far more than one prompt holds
+MAX_DIFF_BYTES = 4 * 1024 * 1024
 
-@contextmanager
-def timeout_handler(seconds):
-    """Context manager for handling timeouts using signal (Unix/Linux only)."""
-    # Check if SIGALRM is available (Unix/Linux only)
-    if not hasattr(signal, 'SIGALRM'):
-        # On Windows or systems without SIGALRM, just yield without timeout
-        # This is a limitation, but most users are on Linux/Mac
-        logger.warning("SIGALRM not available on this platform. Timeout protection disabled.")
-        yield
-        return
+# Token budget for the diff part of the prompt (real tokens; lowered to fit
+# the model's input limit and converted with its calibrated estimate)
+MAX_DIFF_TOKENS = 12000
+
+# Map-reduce mode for very large diffs: chunks are summarized concurrently,
+# then combined into one subject line
+# Set AUTOCOMMIT_MAP_REDUCE=0 to always send a single packed request instead
+MAP_REDUCE_ENABLED = os.getenv("AUTOCOMMIT_MAP_REDUCE", "1") != "0"
+MAP_REDUCE_THRESHOLD = 2  # Diffs larger than this many MAX_DIFF_TOKENS use map-reduce
+MAP_CHUNK_TOKENS = 4000
+MAP_MAX_CHUNKS = 16
+MAP_WORKERS = 4
+
+# Staged files missing from a diff cut short by the read limit are named in
+# the prompt, up to this many
+UNREAD_PATHS_MAX = 50
+
+# Errors that would hit every chunk alike; they abort the whole generation
+# instead of dropping one chunk (which would hide them from the fallbacks)
+CHUNK_SHARED_ERRORS = (DeadlineExceeded, RateLimited, CircuitOpen, PromptTooLarge)
+
+# Incremental regeneration for multi-file commits: per-file summaries are cached
+# by (path, old blob, new blob), so re-runs only send the files that changed
+SUMMARY_CACHE_MIN_FILES = 10
+SUMMARY_BATCH_FILES = 8
+INCREMENTAL_MAX_NEW_FILES = 5
+# A first run sends one request and summarizes the files afterwards, in the
+# background, for the next run; this bounds that work (seconds)
+SUMMARY_WARM_TIMEOUT = 20.0
+
+# Hedged requests: if the first model hasn't answered within this many seconds,
+# ask the next one too and take whichever answers first (0 disables)
+HEDGE_DELAY = _env_float("AUTOCOMMIT_HEDGE_DELAY", 0.0)
+HEDGE_MAX_IN_FLIGHT = 2
+
+# Models that rejected a system instruction (older models); they get it inline
+_INLINE_INSTRUCTION_MODELS: set[str] = set()
+
+# Background summary runs started by _warm_summaries
+_background: list[threading.Thread] = []
+
+# Batched generation (see batch.py): answer lines look like "3: fix(api): ..."
+BATCH_LINE_PATTERN = re.compile(r'^\s*\[?(\d+)\]?\s*[:.)-]\s*(.+?)\s*$')
+BATCH_OUTPUT_TOKENS = 40  # per item
+
+# Candidate messages requested at once for the interactive preview (1 disables)
+CANDIDATE_COUNT = max(1, int(_env_float("AUTOCOMMIT_CANDIDATES", 3)))
+
+# Task prompts: the fixed rules and the diff format are explained once in
+# SYSTEM_INSTRUCTION, so every request only carries the task and its data
+COMMIT_PROMPT = """Write the commit message for this diff.
+
+{diff}
+
+Commit message:"""
+
+MAP_PROMPT = """Summarize what this part of a diff changes in one short sentence, naming the affected component.
+
+{diff}
+
+Summary:"""
+
+FILE_SUMMARY_PROMPT = """Summarize the change to each file in this diff in one short sentence.
+Answer with exactly one line per file in the form "path: summary" and nothing else.
+
+{diff}
+
+Summaries:"""
+
+INCREMENTAL_PROMPT = """Write the commit message for a change to several files, describing its overall intent.
+Some files are described by a summary of their change, the others by their diff.
+
+File summaries:
+{summaries}
+
+Diff:
+{diff}
+
+Commit message:"""
+
+BATCH_PROMPT = """Write one commit message for each of the {count} unrelated changes below.
+Answer with exactly one line per change in the form "N: commit message" and nothing else.
+
+{changes}
+
+Commit messages:"""
+
+REDUCE_PROMPT = """Combine these summaries of parts of one change into its commit message, describing its overall intent.
+
+{summaries}
+
+Commit message:"""
+
+
+def generate_commit_message(
+    diff_text: str,
+    callback=None,
+    file_blobs: Optional[dict] = None,
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    Generate a commit message from git diff using Gemini API.
     
-    def timeout_signal(signum, frame):
-        raise TimeoutError(f"API request timed out after {seconds} seconds")
+    See generate_commit_messages for arguments and errors.
     
-    # Save the old signal handler
-    old_handler = signal.signal(signal.SIGALRM, timeout_signal)
-    signal.alarm(seconds)
-    try:
-        yield
-    finally:
-        # Restore the old handler and cancel the alarm
-        signal.alarm(0)
-        signal.signal(signal.SIGALRM, old_handler)
+    Returns:
+        A clean commit message string
+    """
+    return generate_commit_messages(diff_text, callback, file_blobs, deadline)[0]
 
 
-def generate_commit_message(diff_text: str, callback=None) -> str:
+def generate_commit_messages(
+    diff_text: str,
+    callback=None,
+    file_blobs: Optional[dict] = None,
+    deadline: Optional[Deadline] = None,
+    count: int = 1,
+    changed_paths: Optional[list[str]] = None,
+) -> list[str]:
     """
-    Generate a commit message from git diff using Gemini API.
+    Generate candidate commit messages from git diff using Gemini API.
+    
+    Candidates come from a single request (candidate_count); for very large
+    diffs, which go through map-reduce or the summary cache, that is the
+    final request combining the summaries.
     
     Args:
         diff_text: The git diff text to analyze
-        callback: Optional callback function for progress updates
+        callback: Optional callback receiving the partial commit message as
+            it streams in (called from a worker thread)
+        file_blobs: Optional dict of path to (old_blob, new_blob) for the staged
+            files; enables the per-file summary cache for large commits
+        deadline: Time budget for the whole generation (defaults to
+            GENERATION_DEADLINE seconds from now)
+        count: Number of candidates to ask for
+        changed_paths: Optional paths of every staged file; those missing
+            from diff_text (read only up to MAX_DIFF_BYTES) are named in the
+            prompt so the message still covers them
         
     Returns:
-        A clean commit message string
+        Distinct clean commit messages (at least one), best first
         
     Raises:
         ValueError: If GEMINI_API_KEY is not set
+        CircuitOpen: If the backend failed repeatedly and is being skipped
+        DeadlineExceeded: If the time budget ran out
         Exception: If API call fails
     """
-    # Try to load API key in order of priority:
-    # 1. User's own key (GEMINI_API_KEY)
-    # 2. Default shared key (DEV_MK_GEMINI_API_KEY)
-    api_key = os.getenv("GEMINI_API_KEY") or DEFAULT_API_KEY
-    
-    using_default_key = not os.getenv("GEMINI_API_KEY") and DEFAULT_API_KEY
-    
-    if not api_key:
-        error_msg = (
-            "GEMINI_API_KEY not found\n\n"
-            "To set it up, use one of these methods:\n\n"
-            "Option 1: Create a .env file in your project directory:\n"
-            "   echo 'GEMINI_API_KEY=your-api-key-here' > .env\n\n"
-            "Option 2: Export it as an environment variable:\n"
-            "   export GEMINI_API_KEY='your-api-key-here'\n\n"
-            "Option 3: Add it to ~/.bashrc or ~/.zshrc for persistence:\n"
-            "   echo 'export GEMINI_API_KEY=\"your-api-key-here\"' >> ~/.bashrc\n"
-            "   source ~/.bashrc\n\n"
-            "Get your API key from: https://makersuite.google.com/app/apikey\n\n"
-            "Note: For unlimited usage, get your own API key. The default key has rate limits."
-        )
-        raise ValueError(error_msg)
+    provider = _prepare_provider()
+    unread_paths = _unread_paths(diff_text, changed_paths)
     
-    if using_default_key:
-        logger.warning("Using default shared API key. For unlimited usage, set your own GEMINI_API_KEY")
+    if deadline is None:
+        deadline = Deadline(GENERATION_DEADLINE if GENERATION_DEADLINE > 0 else None)
     
     try:
-        genai.configure(api_key=api_key)
-        logger.info("Configured Gemini API")
-        
-        # Truncate diff if it's too long to avoid timeout and token limit issues
-        if len(diff_text) > MAX_DIFF_LENGTH:
-            logger.warning(f"Diff is very long ({len(diff_text)} chars). Truncating to {MAX_DIFF_LENGTH} chars for processing.")
-            diff_text = diff_text[:MAX_DIFF_LENGTH] + "\n\n... (diff truncated for processing)"
-        
-        # Prepare the prompt
-        prompt = f"""Analyze the following git diff and generate a concise, professional commit message.
-        
-The commit message should:
-- Be clear and descriptive
-- Follow conventional commit format if applicable
-- Be no longer than 72 characters for the subject line
-- Not include explanations or meta-commentary, just the commit message itself
-
-Git diff:
-{diff_text}
-
-Commit message:"""
-        
-        # Generation config with timeout and token limits
-        # Safety settings are set to BLOCK_NONE to avoid blocking commit messages
-        generation_config = {
-            'max_output_tokens': 100,  # Commit messages should be short
-            'temperature': 0.7,  # Balanced creativity
-            'top_p': 0.95,
-            'top_k': 40,
-        }
-        
-        # Safety settings - allow all content for commit message generation
-        # We disable safety filters since we're generating commit messages, not harmful content
-        safety_settings = {
-            'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
-            'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
-            'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE',
-            'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE',
-        }
-        
-        # Try common model names directly (faster than listing)
-        # Order: try faster/cheaper models first
-        model_names = [
-            'gemini-1.5-flash',
-            'gemini-1.5-flash-latest',
-            'gemini-1.5-pro',
-            'gemini-1.5-pro-latest',
-            'gemini-1.0-pro',
-            'gemini-1.0-pro-latest',
-        ]
-        
-        response = None
-        used_model = None
-        last_error = None
-        
-        # Try each model until one works (with timeout protection)
-        for model_name in model_names:
-            try:
-                logger.ai_request(model_name, len(prompt))
-                model = genai.GenerativeModel(
-                    model_name,
-                    generation_config=generation_config,
-                    safety_settings=safety_settings
-                )
-                
-                # Use timeout handler to prevent hanging
-                try:
-                    with timeout_handler(API_TIMEOUT):
-                        response = model.generate_content(prompt)
-                        used_model = model_name
-                        logger.info(f"Using model: {model_name}")
-                        break  # Success!
-                except TimeoutError as te:
-                    logger.warning(f"Model {model_name} timed out after {API_TIMEOUT}s: {str(te)}")
-                    last_error = te
-                    continue
-                except Exception as api_error:
-                    # Re-raise to be caught by outer except
-                    raise api_error
-                    
-            except TimeoutError:
-                # Already handled above, continue to next model
-                continue
-            except Exception as e:
-                last_error = e
-                error_str = str(e).lower()
-                # If it's a 404/model not found, try next model
-                if "404" in error_str or "not found" in error_str or "not supported" in error_str:
-                    logger.debug(f"Model {model_name} not available: {error_str[:100]}")
-                    continue
-                # For other errors, log and try next model
-                logger.warning(f"Error with model {model_name}: {str(e)[:100]}")
-                continue
-        
-        if response is None:
-            # If all models failed, try listing available models as last resort
-            try:
-                logger.debug("Discovering available models...")
-                with timeout_handler(API_TIMEOUT):
-                    models = genai.list_models()
-                    for model in models:
-                        if 'generateContent' in model.supported_generation_methods:
-                            model_name = model.name.replace('models/', '')
-                            try:
-                                logger.ai_request(model_name, len(prompt))
-                                model_obj = genai.GenerativeModel(
-                                    model_name,
-                                    generation_config=generation_config,
-                                    safety_settings=safety_settings
-                                )
-                                with timeout_handler(API_TIMEOUT):
-                                    response = model_obj.generate_content(prompt)
-                                    used_model = model_name
-                                    logger.info(f"Using discovered model: {model_name}")
-                                    break
-                            except (TimeoutError, Exception):
-                                continue
-            except TimeoutError:
-                logger.error(f"Failed to list models: Request timed out after {API_TIMEOUT}s")
-            except Exception as list_error:
-                logger.error(f"Failed to list models: {str(list_error)}")
-        
-        if response is None:
-            error_details = str(last_error) if last_error else "Unknown error"
-            logger.error(f"Could not find available Gemini model: {error_details}")
-            
-            # Check if it's an API key issue
-            is_api_key_error = "api key" in error_details.lower() or "API_KEY_INVALID" in error_details or "invalid" in error_details.lower()
-            
-            if is_api_key_error:
-                raise Exception(
-                    f"❌ API Key Error: The API key is invalid or expired.\n\n"
-                    f"🔑 To fix this, set your own Gemini API key:\n\n"
-                    f"Option 1 (Recommended): Export it in your terminal:\n"
-                    f"   export GEMINI_API_KEY='your-api-key-here'\n\n"
-                    f"Option 2: Create a .env file in your project:\n"
-                    f"   echo 'GEMINI_API_KEY=your-api-key-here' > .env\n\n"
-                    f"Option 3: Add to your shell config (~/.bashrc or ~/.zshrc):\n"
-                    f"   echo 'export GEMINI_API_KEY=\"your-api-key-here\"' >> ~/.bashrc\n"
-                    f"   source ~/.bashrc\n\n"
-                    f"📝 Get your API key from: https://makersuite.google.com/app/apikey\n\n"
-                    f"💡 The default shared key may have expired. Setting your own key ensures unlimited usage.\n"
-                )
-            else:
-                # Check if it's a timeout issue
-                is_timeout = "timeout" in error_details.lower() or "timed out" in error_details.lower()
-                if is_timeout:
-                    raise Exception(
-                        f"⏱️ Request Timeout: The API request took longer than {API_TIMEOUT} seconds.\n\n"
-                        f"This might be due to:\n"
-                        f"1. Very large diff (over {MAX_DIFF_LENGTH} chars) - try committing smaller changes\n"
-                        f"2. Slow network connection\n"
-                        f"3. API service issues\n\n"
-                        f"💡 Try:\n"
-                        f"- Breaking your changes into smaller commits\n"
-                        f"- Checking your internet connection\n"
-                        f"- Retrying the operation\n"
-                    )
-                else:
-                    raise Exception(
-                        f"Could not find an available Gemini model.\n\n"
-                        f"Tried models: {', '.join(model_names)}\n"
-                        f"Last error: {error_details[:200]}\n\n"
-                        f"This might be due to:\n"
-                        f"1. API key doesn't have access to Gemini models\n"
-                        f"2. API key is invalid or expired\n"
-                        f"3. Network/connectivity issues\n\n"
-                        f"Please verify your API key at: https://makersuite.google.com/app/apikey\n"
-                        f"And check available models at: https://ai.google.dev/models/gemini"
-                    )
-        
-        # Check if response was blocked by safety filters
-        if not response.candidates or len(response.candidates) == 0:
-            raise Exception(
-                f"❌ No response candidates returned from the API.\n"
-                f"This might be due to content being blocked by safety filters."
-            )
+        # Every request made below shares the same provider and deadline; only
+        # the final request streams to the callback (chunk summaries would
+        # overwrite each other there)
+        request = functools.partial(_request_text, deadline=deadline, provider=provider)
         
-        candidate = response.candidates[0]
-        
-        # Check finish reason
-        finish_reason = candidate.finish_reason
-        if finish_reason == 2:  # SAFETY - content blocked
-            raise Exception(
-                f"⚠️ Content blocked by safety filters.\n\n"
-                f"The commit message generation was blocked due to safety concerns.\n"
-                f"This can happen if your code changes contain sensitive content.\n\n"
-                f"💡 Try:\n"
-                f"- Committing smaller changes\n"
-                f"- Using manual commit message: autocommit --skip-ai\n"
-                f"- Checking if your code contains sensitive information\n"
-            )
-        elif finish_reason == 3:  # RECITATION - content recitation detected
-            raise Exception(
-                f"⚠️ Content recitation detected.\n\n"
-                f"The API detected potential recitation of copyrighted content.\n"
-                f"Please try with a different set of changes or use a manual commit message.\n"
-            )
-        elif finish_reason != 1:  # 1 = STOP (normal completion)
-            raise Exception(
-                f"⚠️ Unexpected finish reason: {finish_reason}\n\n"
-                f"The API response had an unexpected finish reason.\n"
-                f"Please try again or use a manual commit message.\n"
-            )
-        
-        # Extract the commit message from the response
+        generate = functools.partial(
+            _generate_messages, diff_text, file_blobs, request, provider, deadline, callback, count, unread_paths
+        )
         try:
-            commit_message = response.text.strip()
-        except ValueError as e:
-            # If response.text fails, try to get it from parts
-            candidate = response.candidates[0]
-            if candidate.content and candidate.content.parts:
-                commit_message = candidate.content.parts[0].text.strip()
-            else:
-                raise Exception(
-                    f"❌ Could not extract commit message from API response.\n\n"
-                    f"Error: {str(e)}\n\n"
-                    f"Please try again or use a manual commit message.\n"
-                )
-        
-        # Take only the first line if multiple lines, and clean it up
-        if '\n' in commit_message:
-            commit_message = commit_message.split('\n')[0].strip()
+            messages = generate()
+        except PromptTooLarge:
+            # The model's limit is now known; budgets computed again will fit
+            messages = generate()
         
-        # Remove quotes if present
-        if commit_message.startswith('"') and commit_message.endswith('"'):
-            commit_message = commit_message[1:-1]
-        elif commit_message.startswith("'") and commit_message.endswith("'"):
-            commit_message = commit_message[1:-1]
-        
-        logger.ai_response(commit_message)
-        return commit_message
+        logger.ai_response(messages[0])
+        return messages
         
+    except DeadlineExceeded as e:
+        logger.error(f"Failed to generate commit message: {str(e)}")
+        if deadline.cancelled:
+            raise
+        record_failure(provider.circuit_key, deadline)
+        raise DeadlineExceeded(
+            f"⏱️ AI generation deadline exceeded: no commit message within {deadline.seconds:g} seconds.\n\n"
+            f"💡 Try:\n"
+            f"- Raising the limit: autocommit --ai-timeout SECONDS (or AUTOCOMMIT_AI_DEADLINE)\n"
+            f"- Using an instant offline message: autocommit --offline\n"
+            f"- Using manual commit message: autocommit --skip-ai\n"
+        )
+    except RateLimited as e:
+        logger.error(f"Failed to generate commit message: {str(e)}")
+        wait_hint = f" Retry in about {e.retry_after:.0f} seconds." if e.retry_after else ""
+        raise Exception(
+            f"🚦 Rate limit: the API quota for this key is exhausted.{wait_hint}\n\n"
+            f"💡 Try:\n"
+            f"- Setting your own key: export GEMINI_API_KEY='your-api-key-here'\n"
+            f"- Setting AUTOCOMMIT_RATE_LIMIT (requests per minute) for concurrent jobs\n"
+            f"- Using manual commit message: autocommit --skip-ai\n"
+        )
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Failed to generate commit message: {error_msg}")
@@ -386,3 +323,1202 @@ Commit message:"""
         
         raise Exception(f"Failed to generate commit message: {error_msg}")
 
+
+async def generate_commit_message_async(
+    diff_text: str,
+    file_blobs: Optional[dict] = None,
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    Async variant of generate_commit_message for use inside event loops.
+    
+    Generation runs on the loop's default executor. Cancelling the awaiting
+    task cancels the deadline, so in-flight waits stop at their next check.
+    
+    Args:
+        diff_text: The git diff text to analyze
+        file_blobs: Optional dict of path to (old_blob, new_blob)
+        deadline: Time budget for the whole generation
+        
+    Returns:
+        A clean commit message string
+    """
+    if deadline is None:
+        deadline = Deadline(GENERATION_DEADLINE if GENERATION_DEADLINE > 0 else None)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            None,
+            functools.partial(generate_commit_message, diff_text, None, file_blobs, deadline),
+        )
+    except asyncio.CancelledError:
+        deadline.cancel()
+        raise
+
+
+def generate_commit_message_batch(
+    diff_texts: list[str],
+    deadline: Optional[Deadline] = None,
+) -> list[Optional[str]]:
+    """
+    Generate commit messages for several unrelated diffs with a single request.
+    
+    The diffs share one token budget and the model answers one numbered line
+    per diff, so a batch costs one request of quota instead of one per diff.
+    
+    Args:
+        diff_texts: Diffs to describe
+        deadline: Time budget for the request (defaults to GENERATION_DEADLINE)
+        
+    Returns:
+        One clean commit message per diff, or None for diffs the answer did
+        not cover (callers fall back to generate_commit_message for those)
+        
+    Raises:
+        ValueError: If GEMINI_API_KEY is not set
+        CircuitOpen: If the backend failed repeatedly and is being skipped
+        RateLimited: If the API quota stayed exhausted
+        DeadlineExceeded: If the time budget ran out
+        Exception: If the request failed
+    """
+    if not diff_texts:
+        return []
+    provider = _prepare_provider()
+    if deadline is None:
+        deadline = Deadline(GENERATION_DEADLINE if GENERATION_DEADLINE > 0 else None)
+    
+    max_output_tokens = BATCH_OUTPUT_TOKENS * len(diff_texts)
+    budget = prompt_budget(
+        provider.token_model, SYSTEM_INSTRUCTION + BATCH_PROMPT, max_output_tokens,
+        MAX_DIFF_TOKENS, provider.input_token_limit,
+    )
+    item_tokens = budget // len(diff_texts)
+    changes = '\n\n'.join(
+        f"=== Change {i} ===\n{build_diff_prompt(diff_text, item_tokens)}"
+        for i, diff_text in enumerate(diff_texts, 1)
+    )
+    logger.info(f"Batch: {len(diff_texts)} diff(s) in one request")
+    text = _request_text(
+        BATCH_PROMPT.format(count=len(diff_texts), changes=changes), max_output_tokens, deadline,
+        provider=provider,
+    )
+    
+    messages: list[Optional[str]] = [None] * len(diff_texts)
+    for line in text.splitlines():
+        match = BATCH_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        message = _clean_message(match.group(2))
+        if 0 <= index < len(messages) and messages[index] is None and message:
+            messages[index] = message
+    
+    missing = messages.count(None)
+    if missing:
+        logger.warning(f"Batch: answer covered {len(messages) - missing}/{len(messages)} diff(s)")
+    return messages
+
+
+def _prepare_provider() -> Provider:
+    """
+    Get the generation provider, ready to send requests.
+    
+    Raises:
+        ValueError: If GEMINI_API_KEY is not set
+        CircuitOpen: If the backend failed repeatedly and is being skipped
+    """
+    provider = get_provider()
+    is_gemini = isinstance(provider, GeminiProvider)
+    api_key = _current_api_key()
+    
+    using_default_key = is_gemini and not os.getenv("GEMINI_API_KEY") and DEFAULT_API_KEY
+    
+    if is_gemini and not api_key:
+        error_msg = (
+            "GEMINI_API_KEY not found\n\n"
+            "To set it up, use one of these methods:\n\n"
+            "Option 1: Create a .env file in your project directory:\n"
+            "   echo 'GEMINI_API_KEY=your-api-key-here' > .env\n\n"
+            "Option 2: Export it as an environment variable:\n"
+            "   export GEMINI_API_KEY='your-api-key-here'\n\n"
+            "Option 3: Add it to ~/.bashrc or ~/.zshrc for persistence:\n"
+            "   echo 'export GEMINI_API_KEY=\"your-api-key-here\"' >> ~/.bashrc\n"
+            "   source ~/.bashrc\n\n"
+            "Get your API key from: https://makersuite.google.com/app/apikey\n\n"
+            "Note: For unlimited usage, get your own API key. The default key has rate limits."
+        )
+        raise ValueError(error_msg)
+    
+    if using_default_key:
+        logger.warning("Using default shared API key. For unlimited usage, set your own GEMINI_API_KEY")
+    
+    # Skip a backend that keeps failing instead of waiting out its timeouts
+    if not allow_request(provider.circuit_key):
+        raise CircuitOpen(retry_in(provider.circuit_key))
+    
+    if is_gemini:
+        genai.configure(api_key=api_key)
+        logger.info("Configured Gemini API")
+    else:
+        logger.info(f"Using provider: {provider.name}")
+    return provider
+
+
+def _generate_messages(
+    diff_text: str,
+    file_blobs: Optional[dict],
+    request: Callable[..., str],
+    provider: Provider,
+    deadline: Deadline,
+    callback,
+    count: int,
+    unread_paths: list[str],
+) -> list[str]:
+    """
+    Pick the generation strategy for a diff and run it.
+    
+    Diff budgets come from the model's input limit and calibrated token
+    estimate, so prompts use the window fully without overrunning it.
+    
+    Returns:
+        Distinct clean commit messages (at least one), best first
+    """
+    model, limit = provider.token_model, provider.input_token_limit
+    diff_tokens = prompt_budget(
+        model, SYSTEM_INSTRUCTION + INCREMENTAL_PROMPT, 100 * count, MAX_DIFF_TOKENS, limit
+    )
+    chunk_tokens = prompt_budget(
+        model, SYSTEM_INSTRUCTION + FILE_SUMMARY_PROMPT, 40 * SUMMARY_BATCH_FILES, MAP_CHUNK_TOKENS, limit
+    )
+    
+    # The request that produces the commit message itself asks for every candidate
+    final_request = functools.partial(
+        _request_candidates, max_output_tokens=100, deadline=deadline, first_line=True,
+        on_partial=callback, candidate_count=count, provider=provider,
+    )
+    diff_size = estimate_tokens(diff_text)
+    
+    # Per-file summaries only pay off when some are cached already or the diff
+    # doesn't fit; a small first run is cheaper as one request, and its
+    # summaries are made afterwards in the background
+    per_file = bool(file_blobs) and len(file_blobs) >= SUMMARY_CACHE_MIN_FILES
+    if per_file and (diff_size > diff_tokens or _has_cached_summaries(file_blobs)):
+        return _incremental_messages(
+            diff_text, file_blobs, request, final_request, diff_tokens=diff_tokens, chunk_tokens=chunk_tokens,
+            unread_paths=unread_paths,
+        )
+    if MAP_REDUCE_ENABLED and diff_size > MAP_REDUCE_THRESHOLD * diff_tokens:
+        logger.warning(f"Diff is very long ({len(diff_text)} chars). Summarizing it in parallel chunks.")
+        return _map_reduce_messages(
+            diff_text, request, final_request, chunk_tokens=chunk_tokens, unread_paths=unread_paths
+        )
+    
+    # Pack the most informative hunks into the token budget to avoid timeout and token limit issues
+    if diff_size > diff_tokens:
+        logger.warning(f"Diff is very long ({len(diff_text)} chars). Packing the most informative hunks into the {model} token budget.")
+    messages = _clean_messages(
+        final_request(COMMIT_PROMPT.format(diff=build_diff_prompt(diff_text, diff_tokens, unread_paths)))
+    )
+    if per_file:
+        _warm_summaries(diff_text, file_blobs, provider, chunk_tokens)
+    return messages
+
+
+def _clean_messages(texts: list[str]) -> list[str]:
+    """Clean candidate responses, dropping duplicates."""
+    return list(dict.fromkeys(map(_clean_message, texts)))
+
+
+def _unread_paths(diff_text: str, changed_paths: Optional[list[str]]) -> list[str]:
+    """Get the staged paths missing from a diff cut short by the read limit."""
+    if not changed_paths:
+        return []
+    read = diff_paths(diff_text)
+    unread = [path for path in changed_paths if path not in read]
+    if unread:
+        logger.warning(f"Diff was cut short: {len(unread)} staged file(s) are only named to the model")
+    return unread
+
+
+def _unread_note(unread_paths: list[str]) -> str:
+    """Name the files whose diff was not read (up to UNREAD_PATHS_MAX)."""
+    names = ', '.join(unread_paths[:UNREAD_PATHS_MAX])
+    more = len(unread_paths) - UNREAD_PATHS_MAX
+    if more > 0:
+        names += f" and {more} more"
+    return f"Also changed (diff too long to read): {names}"
+
+
+def _has_cached_summaries(file_blobs: dict) -> bool:
+    """Check whether any staged file's change summary is cached."""
+    keys = [file_summary_key(path, *blobs) for path, blobs in file_blobs.items()]
+    return bool(get_file_summaries(keys))
+
+
+def _single_request(request: Callable[..., str]) -> Callable[[str], list[str]]:
+    """Turn a text request function into a final request returning one candidate."""
+    return lambda prompt: [request(prompt, 100, first_line=True)]
+
+
+def generate_commit_message_map_reduce(
+    diff_text: str,
+    request: Optional[Callable[..., str]] = None,
+    max_workers: int = MAP_WORKERS,
+    chunk_tokens: int = MAP_CHUNK_TOKENS,
+    changed_paths: Optional[list[str]] = None,
+) -> str:
+    """
+    Generate a commit message for a very large diff using map-reduce.
+    
+    The diff is split into per-directory chunks which are summarized
+    concurrently, then a single short request combines the summaries.
+    
+    Args:
+        diff_text: The git diff text to analyze
+        request: Function taking (prompt, max_output_tokens, first_line=False)
+            and returning the response text (defaults to the Gemini API; pass
+            a stub for tests)
+        max_workers: Maximum number of concurrent map requests
+        chunk_tokens: Token budget per chunk (estimate_tokens units)
+        changed_paths: Optional paths of every staged file; those missing
+            from diff_text are named in the reduce prompt
+        
+    Returns:
+        A clean commit message string
+        
+    Raises:
+        DeadlineExceeded, RateLimited, CircuitOpen, PromptTooLarge: From any request
+        Exception: If every chunk failed or the reduce request failed
+    """
+    if request is None:
+        request = _request_text
+    return _map_reduce_messages(
+        diff_text, request, _single_request(request), max_workers, chunk_tokens,
+        _unread_paths(diff_text, changed_paths),
+    )[0]
+
+
+def _map_reduce_messages(
+    diff_text: str,
+    request: Callable[..., str],
+    final_request: Callable[[str], list[str]],
+    max_workers: int = MAP_WORKERS,
+    chunk_tokens: int = MAP_CHUNK_TOKENS,
+    unread_paths: Optional[list[str]] = None,
+) -> list[str]:
+    """
+    Map-reduce generation (see generate_commit_message_map_reduce).
+    
+    Args:
+        final_request: Function taking the reduce prompt and returning the
+            candidate texts
+        unread_paths: Staged files beyond the diff that was read, named in
+            the reduce prompt
+        
+    Returns:
+        Distinct clean commit messages (at least one), best first
+    """
+    chunks = split_diff(diff_text, chunk_tokens, MAP_MAX_CHUNKS)
+    logger.info(f"Map-reduce: summarizing {len(chunks)} chunk(s) with up to {max_workers} workers")
+    
+    def summarize(chunk: str) -> Optional[str]:
+        try:
+            prompt = MAP_PROMPT.format(diff=build_diff_prompt(chunk, chunk_tokens))
+            return _clean_message(request(prompt, 60, first_line=True))
+        except CHUNK_SHARED_ERRORS:
+            raise
+        except Exception as e:
+            logger.warning(f"Map-reduce: chunk summary failed: {str(e)[:100]}")
+            return None
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        summaries = [summary for summary in executor.map(summarize, chunks) if summary]
+    
+    if not summaries:
+        raise Exception("Failed to generate commit message: every diff chunk failed to summarize")
+    
+    if len(summaries) == 1 and not unread_paths:
+        return summaries
+    
+    summary_text = '\n'.join(f"- {summary}" for summary in summaries)
+    if unread_paths:
+        summary_text += f"\n- {_unread_note(unread_paths)}"
+    return _clean_messages(final_request(REDUCE_PROMPT.format(summaries=summary_text)))
+
+
+def generate_commit_message_incremental(
+    diff_text: str,
+    file_blobs: dict,
+    request: Optional[Callable[..., str]] = None,
+    max_workers: int = MAP_WORKERS,
+    diff_tokens: int = MAX_DIFF_TOKENS,
+    chunk_tokens: int = MAP_CHUNK_TOKENS,
+) -> str:
+    """
+    Generate a commit message reusing cached per-file change summaries.
+    
+    Files whose (path, old blob, new blob) was summarized before are sent as
+    their one-line summary. If only a few files are new, their diff and the
+    cached summaries go out in a single request; otherwise the new files are
+    summarized in batches (and cached) and the summaries are combined.
+    
+    Args:
+        diff_text: The git diff text to analyze
+        file_blobs: Dict of path to (old_blob, new_blob)
+        request: Function taking (prompt, max_output_tokens, first_line=False)
+            and returning the response text (defaults to the Gemini API)
+        max_workers: Maximum number of concurrent summary requests
+        diff_tokens: Token budget for a diff sent whole (estimate_tokens units)
+        chunk_tokens: Token budget per summary batch (estimate_tokens units)
+        
+    Returns:
+        A clean commit message string
+    """
+    if request is None:
+        request = _request_text
+    return _incremental_messages(
+        diff_text, file_blobs, request, _single_request(request), max_workers, diff_tokens, chunk_tokens
+    )[0]
+
+
+def _incremental_messages(
+    diff_text: str,
+    file_blobs: dict,
+    request: Callable[..., str],
+    final_request: Callable[[str], list[str]],
+    max_workers: int = MAP_WORKERS,
+    diff_tokens: int = MAX_DIFF_TOKENS,
+    chunk_tokens: int = MAP_CHUNK_TOKENS,
+    unread_paths: Optional[list[str]] = None,
+) -> list[str]:
+    """
+    Incremental generation (see generate_commit_message_incremental).
+    
+    Args:
+        final_request: Function taking the prompt that produces the commit
+            message and returning the candidate texts
+        unread_paths: Staged files beyond the diff that was read, named in
+            the final prompt
+        
+    Returns:
+        Distinct clean commit messages (at least one), best first
+    """
+    files, keys, summaries = _cached_summaries(diff_text, file_blobs)
+    new_files = [f for f in files if f.path not in summaries]
+    if not files:
+        prompt = COMMIT_PROMPT.format(diff=build_diff_prompt(diff_text, diff_tokens, unread_paths))
+        return _clean_messages(final_request(prompt))
+    logger.info(f"Summary cache: {len(summaries)} cached, {len(new_files)} new file(s)")
+    
+    if summaries and len(new_files) <= INCREMENTAL_MAX_NEW_FILES:
+        summary_text = '\n'.join(f"- {path}: {summary}" for path, summary in summaries.items())
+        if unread_paths:
+            summary_text += f"\n- {_unread_note(unread_paths)}"
+        new_diff = build_diff_prompt(render_files(new_files), diff_tokens) if new_files else "(none)"
+        prompt = INCREMENTAL_PROMPT.format(summaries=summary_text, diff=new_diff)
+        return _clean_messages(final_request(prompt))
+    
+    summaries.update(_summarize_files(new_files, keys, request, max_workers, chunk_tokens))
+    if not summaries:
+        raise Exception("Failed to generate commit message: could not summarize any file")
+    
+    summary_text = '\n'.join(f"- {path}: {summary}" for path, summary in summaries.items())
+    if unread_paths:
+        summary_text += f"\n- {_unread_note(unread_paths)}"
+    return _clean_messages(final_request(REDUCE_PROMPT.format(summaries=summary_text)))
+
+
+def _cached_summaries(diff_text: str, file_blobs: dict) -> tuple[list, dict[str, str], dict[str, str]]:
+    """
+    Look up the cached summaries of a diff's files.
+    
+    Returns:
+        Tuple of (files with blob ids, path to cache key, path to cached summary)
+    """
+    files = [f for f in parse_diff(diff_text) if f.path in file_blobs]
+    keys = {f.path: file_summary_key(f.path, *file_blobs[f.path]) for f in files}
+    cached = get_file_summaries(list(keys.values()))
+    return files, keys, {path: cached[key] for path, key in keys.items() if key in cached}
+
+
+def _summarize_files(
+    files: list,
+    keys: dict[str, str],
+    request: Callable[..., str],
+    max_workers: int,
+    chunk_tokens: int,
+) -> dict[str, str]:
+    """
+    Summarize files in concurrent batches and cache the summaries.
+    
+    Only summaries of files sent whole are cached, since the key stands for
+    the whole change: files cut off by the diff read limit, or larger than a
+    batch's budget on their own, are summarized but not stored.
+    
+    Returns:
+        Dict of path to summary (files of failed batches are missing)
+    """
+    costs = {f.path: estimate_tokens(render_files([f], compact=True)) for f in files}
+    batches, batch, used = [], [], 0
+    for f in files:
+        if batch and (len(batch) == SUMMARY_BATCH_FILES or used + 1 + costs[f.path] > chunk_tokens):
+            batches.append(batch)
+            batch, used = [], 0
+        used += costs[f.path] + (1 if batch else 0)
+        batch.append(f)
+    if batch:
+        batches.append(batch)
+    
+    def summarize(batch: list) -> dict:
+        try:
+            diff = build_diff_prompt(render_files(batch), chunk_tokens)
+            text = request(FILE_SUMMARY_PROMPT.format(diff=diff), 40 * len(batch))
+        except CHUNK_SHARED_ERRORS:
+            raise
+        except Exception as e:
+            logger.warning(f"Summary cache: batch summary failed: {str(e)[:100]}")
+            return {}
+        return _parse_file_summaries(text, [f.path for f in batch])
+    
+    summaries = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+        for batch_summaries in executor.map(summarize, batches):
+            summaries.update(batch_summaries)
+    
+    whole = {f.path for f in files if f.complete() and costs[f.path] <= chunk_tokens}
+    store_file_summaries({keys[path]: summary for path, summary in summaries.items() if path in whole})
+    return summaries
+
+
+def _warm_summaries(diff_text: str, file_blobs: dict, provider: Provider, chunk_tokens: int) -> None:
+    """
+    Summarize and cache a diff's files in the background, for the next run.
+    
+    Used after a message came from a single request, so the next commit
+    touching these files can reuse their summaries. Failures are only logged;
+    wait_for_background() lets the caller finish the work before exiting.
+    """
+    files, keys, summaries = _cached_summaries(diff_text, file_blobs)
+    new_files = [f for f in files if f.path not in summaries]
+    if not new_files:
+        return
+    request = functools.partial(_request_text, deadline=Deadline(SUMMARY_WARM_TIMEOUT), provider=provider)
+    
+    def run() -> None:
+        try:
+            stored = _summarize_files(new_files, keys, request, MAP_WORKERS, chunk_tokens)
+            logger.debug(f"Summary cache: summarized {len(stored)} file(s) for the next run")
+        except Exception as e:
+            logger.debug(f"Summary cache: background summaries failed: {str(e)[:100]}")
+    
+    thread = threading.Thread(target=run, name="summary-cache", daemon=True)
+    thread.start()
+    _background.append(thread)
+
+
+def wait_for_background(timeout: float = SUMMARY_WARM_TIMEOUT) -> None:
+    """Wait (at most ``timeout`` seconds in total) for background summaries to be cached."""
+    wait = Deadline(timeout)
+    while _background:
+        _background.pop().join(wait.remaining())
+
+
+def _parse_file_summaries(text: str, paths: list[str]) -> dict[str, str]:
+    """Parse "path: summary" lines, keeping only paths that were asked for."""
+    wanted = set(paths)
+    summaries = {}
+    for line in text.split('\n'):
+        path, sep, summary = line.strip().lstrip('-*').strip().partition(': ')
+        path = path.strip('`"\'')
+        if sep and path in wanted and summary.strip():
+            summaries[path] = summary.strip()
+    return summaries
+
+
+def _attempt_model(
+    model_name: str,
+    prompt: str,
+    generation_config: dict,
+    safety_settings: dict,
+    api_key: str,
+    timeout: float = API_TIMEOUT,
+    deadline: Optional[Deadline] = None,
+    first_line: bool = False,
+    on_partial: Optional[Callable[[str], None]] = None,
+):
+    """
+    Send one request to one model, recording its latency and availability.
+    
+    Requests go through the shared rate limiter. Quota errors (429) are
+    retried on the same model with the server's retry hint or jittered
+    exponential backoff, since another model would draw on the same quota.
+    
+    Args:
+        timeout: Seconds to wait for this request
+        deadline: Optional deadline bounding waits and retries
+        first_line: Stream the response and stop at the first complete line
+        on_partial: Optional callback receiving the streamed line so far
+        
+    Returns:
+        The API response, or the streamed text of each candidate if first_line is set
+        
+    Raises:
+        RateLimited: If the quota stayed exhausted after QUOTA_RETRIES retries
+        DeadlineExceeded: If the deadline ran out (or was cancelled)
+        Exception: The API error (TimeoutError if the request timed out)
+    """
+    if deadline is None:
+        deadline = Deadline()
+    
+    logger.ai_request(model_name, len(prompt))
+    model, contents = _build_model(model_name, prompt, generation_config, safety_settings)
+    
+    def counted_text() -> str:
+        """The text the API counts as the prompt (system instruction included)."""
+        if model_name in _INLINE_INSTRUCTION_MODELS:
+            return contents
+        return f"{SYSTEM_INSTRUCTION}\n\n{contents}"
+    
+    def on_usage(usage) -> None:
+        _record_usage(model_name, counted_text(), usage)
+    
+    retry = 0
+    while True:
+        acquire(api_key, deadline, shared=api_key == DEFAULT_API_KEY)
+        timeout = deadline.timeout(timeout)
+        
+        # Wait at most `timeout` to prevent hanging; works from any thread
+        started = time.monotonic()
+        try:
+            if first_line:
+                response = call_with_timeout(
+                    _stream_first_line, timeout, model, contents, timeout, on_partial,
+                    generation_config.get('candidate_count', 1), on_usage, deadline=deadline,
+                )
+            else:
+                response = call_with_timeout(
+                    model.generate_content, timeout, contents,
+                    request_options={"timeout": timeout}, deadline=deadline,
+                )
+                on_usage(getattr(response, 'usage_metadata', None))
+            break
+        except DeadlineExceeded:
+            raise
+        except ResponseRejected:
+            # The model answered (with blocked or empty content); another model won't do better
+            record_model_latency(model_name, time.monotonic() - started, True)
+            record_success(api_key)
+            raise
+        except TimeoutError as te:
+            logger.warning(f"Model {model_name} timed out after {timeout:g}s: {str(te)}")
+            record_model_latency(model_name, time.monotonic() - started, False)
+            record_model_failure(api_key, model_name)
+            raise
+        except Exception as e:
+            if _is_system_instruction_unsupported(e) and model_name not in _INLINE_INSTRUCTION_MODELS:
+                logger.debug(f"Model {model_name} rejects system instructions, sending them inline")
+                _INLINE_INSTRUCTION_MODELS.add(model_name)
+                model, contents = _build_model(model_name, prompt, generation_config, safety_settings)
+                continue
+            too_large = size_error(e)
+            if too_large:
+                # The model is fine, the prompt must shrink (see _generate_messages)
+                record_model_latency(model_name, time.monotonic() - started, True)
+                record_size_error(model_name, counted_text(), too_large)
+                raise too_large
+            if is_quota_error(e):
+                retry_after = retry_after_hint(e)
+                report_rate_limited(api_key, retry_after, shared=api_key == DEFAULT_API_KEY)
+                if retry == QUOTA_RETRIES:
+                    raise RateLimited(f"API quota exhausted: {str(e)[:200]}", retry_after)
+                delay = retry_after if retry_after is not None else backoff_delay(retry)
+                logger.warning(f"Model {model_name} rate limited, retrying in {delay:.1f}s")
+                deadline.sleep(delay)
+                retry += 1
+                continue
+            # If it's a 404/model not found, the next model is tried
+            if _is_model_unavailable(e):
+                logger.debug(f"Model {model_name} not available: {str(e).lower()[:100]}")
+                record_model_unavailable(api_key, model_name)
+            else:
+                logger.warning(f"Error with model {model_name}: {str(e)[:100]}")
+                record_model_latency(model_name, time.monotonic() - started, False)
+                record_model_failure(api_key, model_name)
+            raise
+    
+    record_model_latency(model_name, time.monotonic() - started, True)
+    record_model_success(api_key, model_name)
+    return response
+
+
+def _build_model(model_name: str, prompt: str, generation_config: dict, safety_settings: dict):
+    """
+    Create the model with SYSTEM_INSTRUCTION as its system instruction.
+    
+    Models known to reject system instructions get them prepended to the
+    prompt instead.
+    
+    Returns:
+        Tuple of (model, contents to send)
+    """
+    if model_name in _INLINE_INSTRUCTION_MODELS:
+        model = genai.GenerativeModel(
+            model_name,
+            generation_config=generation_config,
+            safety_settings=safety_settings
+        )
+        return model, f"{SYSTEM_INSTRUCTION}\n\n{prompt}"
+    model = genai.GenerativeModel(
+        model_name,
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+        system_instruction=SYSTEM_INSTRUCTION,
+    )
+    return model, prompt
+
+
+def _is_system_instruction_unsupported(error: Exception) -> bool:
+    """Check whether an API error means the model doesn't take a system instruction."""
+    error_str = str(error).lower()
+    return (
+        ("developer instruction" in error_str or "system instruction" in error_str
+         or "system_instruction" in error_str)
+        and ("not enabled" in error_str or "not supported" in error_str or "unsupported" in error_str)
+    )
+
+
+def _record_usage(model_name: str, counted_text: str, usage) -> None:
+    """
+    Log the prompt tokens the API billed (including any served from its cache)
+    and calibrate the model's token estimate with them.
+    """
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    if not prompt_tokens:
+        return
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+    logger.debug(f"Model {model_name} usage: {prompt_tokens} prompt token(s), {cached_tokens} cached")
+    record_token_count(model_name, counted_text, prompt_tokens)
+
+
+def _stream_first_line(
+    model,
+    prompt: str,
+    timeout: float,
+    on_partial: Optional[Callable[[str], None]] = None,
+    candidate_count: int = 1,
+    on_usage: Optional[Callable[[object], None]] = None,
+) -> list[str]:
+    """
+    Stream a response and stop reading as soon as every candidate's first line is complete.
+    
+    Args:
+        model: Gemini model
+        prompt: Prompt to send
+        timeout: Request timeout passed to the API
+        on_partial: Optional callback receiving the first candidate's line so far
+        candidate_count: Number of candidates requested
+        on_usage: Optional callback receiving the response's usage metadata once
+        
+    Returns:
+        The text received per usable candidate (each first line is complete
+        unless the stream ended)
+        
+    Raises:
+        ResponseRejected: If every candidate was blocked or empty
+    """
+    texts: dict[int, str] = {}
+    rejected: dict[int, ResponseRejected] = {}
+    for chunk in model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+        usage = getattr(chunk, 'usage_metadata', None)
+        if on_usage and getattr(usage, 'prompt_token_count', None):
+            on_usage(usage)
+            on_usage = None
+        if not chunk.candidates:
+            _check_response(chunk)  # Raises: nothing came back
+        for candidate in chunk.candidates:
+            index = getattr(candidate, 'index', 0) or 0
+            try:
+                _check_candidate(candidate, streaming=True)
+            except ResponseRejected as e:
+                rejected[index] = e
+            texts[index] = texts.get(index, "") + _candidate_text(candidate)
+        
+        line = texts.get(min(texts), "").lstrip() if texts else ""
+        if on_partial and line:
+            on_partial(line.split('\n', 1)[0].strip())
+        
+        pending = [i for i in texts if i not in rejected and '\n' not in texts[i].lstrip()]
+        if len(texts) >= candidate_count and not pending:
+            break  # Subject lines complete; abandon the rest of the stream
+    
+    usable = [texts[i] for i in sorted(texts) if i not in rejected and texts[i].strip()]
+    if not usable:
+        if rejected:
+            raise next(iter(rejected.values()))
+        raise ResponseRejected("❌ Could not extract commit message from API response: empty stream.")
+    return usable
+
+
+def _candidate_text(candidate) -> str:
+    """Get the text of a candidate (empty for candidates without parts)."""
+    if not candidate.content or not candidate.content.parts:
+        return ""
+    return ''.join(getattr(part, 'text', '') for part in candidate.content.parts)
+
+
+def _first_streamer(on_partial: Optional[Callable[[str], None]]) -> Callable[[str], Optional[Callable[[str], None]]]:
+    """
+    Share a partial-text callback between concurrent (hedged) requests.
+    
+    Returns:
+        Function taking a model name and returning its callback; only the
+        first model to stream any text reaches on_partial, so concurrent
+        streams don't overwrite each other
+    """
+    lock = threading.Lock()
+    owner: list[str] = []
+    
+    def for_model(model_name: str) -> Optional[Callable[[str], None]]:
+        if on_partial is None:
+            return None
+        
+        def update(text: str) -> None:
+            with lock:
+                if not owner:
+                    owner.append(model_name)
+            if owner[0] == model_name:
+                on_partial(text)
+        return update
+    return for_model
+
+
+def _request_hedged(model_names: list[str], send: Callable[[str], object], deadline: Deadline) -> tuple:
+    """
+    Try models with hedging: if the request in flight hasn't answered within
+    HEDGE_DELAY, the next model is asked as well and the first answer wins.
+    
+    Requests run on daemon threads; the loser is abandoned (it ends on its
+    own request timeout) so it never delays the result or interpreter exit.
+    
+    Args:
+        model_names: Models in the order to try
+        send: Function sending the prompt to one model and returning the response
+        deadline: Overall time budget; waiting stops when it runs out
+        
+    Returns:
+        Tuple of (response, used_model, last_error); response is None if every model failed
+    """
+    results: queue.Queue = queue.Queue()
+    next_index = 0
+    in_flight = 0
+    last_error = None
+    
+    def launch() -> None:
+        nonlocal next_index, in_flight
+        model_name = model_names[next_index]
+        next_index += 1
+        in_flight += 1
+        
+        def run() -> None:
+            try:
+                results.put((model_name, send(model_name), None))
+            except Exception as e:
+                results.put((model_name, None, e))
+        
+        threading.Thread(target=run, name=f"autocommit-{model_name}", daemon=True).start()
+    
+    launch()
+    while in_flight:
+        can_hedge = next_index < len(model_names) and in_flight < HEDGE_MAX_IN_FLIGHT
+        wait = deadline.timeout(HEDGE_DELAY if can_hedge else API_TIMEOUT + 1)
+        try:
+            model_name, response, error = results.get(timeout=wait)
+        except queue.Empty:
+            if deadline.expired():
+                raise DeadlineExceeded(f"Time budget of {deadline.seconds:g}s exhausted")
+            if can_hedge:
+                logger.info(f"No answer after {HEDGE_DELAY}s, hedging with {model_names[next_index]}")
+                launch()
+                continue
+            break  # Every request in flight is past its own timeout
+        
+        in_flight -= 1
+        if error is None:
+            logger.info(f"Using model: {model_name}")
+            return response, model_name, last_error
+        if isinstance(error, (RateLimited, DeadlineExceeded, ResponseRejected, PromptTooLarge)):
+            raise error  # Other models share the quota and the deadline
+        
+        last_error = error
+        if not in_flight and next_index < len(model_names):
+            launch()
+    
+    return None, None, last_error
+
+
+def _is_model_unavailable(error: Exception) -> bool:
+    """Check whether an API error means the model doesn't exist for this key."""
+    error_str = str(error).lower()
+    return "404" in error_str or "not found" in error_str or "not supported" in error_str
+
+
+def _current_api_key() -> str:
+    """
+    Get the API key in order of priority:
+    1. User's own key (GEMINI_API_KEY)
+    2. Default shared key (DEV_MK_GEMINI_API_KEY)
+    """
+    return os.getenv("GEMINI_API_KEY") or DEFAULT_API_KEY
+
+
+def _clean_message(text: str) -> str:
+    """Reduce a model response to a single-line commit message."""
+    commit_message = text.strip()
+    
+    # Take only the first line if multiple lines, and clean it up
+    if '\n' in commit_message:
+        commit_message = commit_message.split('\n')[0].strip()
+    
+    # Remove quotes if present
+    if commit_message.startswith('"') and commit_message.endswith('"'):
+        commit_message = commit_message[1:-1]
+    elif commit_message.startswith("'") and commit_message.endswith("'"):
+        commit_message = commit_message[1:-1]
+    
+    return commit_message
+
+
+def _request_text(
+    prompt: str,
+    max_output_tokens: int = 100,
+    deadline: Optional[Deadline] = None,
+    first_line: bool = False,
+    on_partial: Optional[Callable[[str], None]] = None,
+    provider: Optional[Provider] = None,
+) -> str:
+    """
+    Send a prompt to the generation provider and return the response text.
+    
+    Args:
+        prompt: Prompt to send
+        max_output_tokens: Maximum number of tokens to generate
+        deadline: Optional overall time budget; each attempt gets the time
+            that is left, capped at API_TIMEOUT
+        first_line: Only the first line is needed: stream the response and
+            stop reading once that line is complete
+        on_partial: Optional callback receiving the streamed first line so far
+        provider: Provider to use (defaults to get_provider())
+        
+    Returns:
+        Raw response text (possibly cut after its first line if first_line is set)
+        
+    Raises:
+        DeadlineExceeded: If the time budget ran out
+        Exception: If no model could produce a usable response
+    """
+    return _request_candidates(prompt, max_output_tokens, deadline, first_line, on_partial, 1, provider)[0]
+
+
+def _request_candidates(
+    prompt: str,
+    max_output_tokens: int = 100,
+    deadline: Optional[Deadline] = None,
+    first_line: bool = False,
+    on_partial: Optional[Callable[[str], None]] = None,
+    candidate_count: int = 1,
+    provider: Optional[Provider] = None,
+) -> list[str]:
+    """
+    Like _request_text, but ask for several candidate responses in one request.
+    
+    Args:
+        candidate_count: Number of candidates to request
+        
+    Returns:
+        Text of every usable candidate (at least one), first candidate first
+    """
+    if provider is None:
+        provider = get_provider()
+    return provider.request(
+        prompt, max_output_tokens, deadline or Deadline(), first_line, on_partial, candidate_count
+    )
+
+
+def _gemini_request_candidates(
+    prompt: str,
+    max_output_tokens: int,
+    deadline: Deadline,
+    first_line: bool = False,
+    on_partial: Optional[Callable[[str], None]] = None,
+    candidate_count: int = 1,
+) -> list[str]:
+    """Send a prompt to the first available Gemini model (see _request_candidates)."""
+    
+    # Generation config with timeout and token limits
+    # Safety settings are set to BLOCK_NONE to avoid blocking commit messages
+    generation_config = {
+        'max_output_tokens': max_output_tokens,
+        'temperature': 0.7,  # Balanced creativity
+        'top_p': 0.95,
+        'top_k': 40,
+    }
+    if candidate_count > 1:
+        generation_config['candidate_count'] = candidate_count
+    
+    # Safety settings - allow all content for commit message generation
+    # We disable safety filters since we're generating commit messages, not harmful content
+    safety_settings = {
+        'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
+        'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
+        'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE',
+        'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE',
+    }
+    
+    # Known-good and measured-fastest models first, known-unavailable models skipped
+    api_key = _current_api_key()
+    model_names = get_model_order(api_key)
+    
+    response = None
+    used_model = None
+    last_error = None
+    
+    if HEDGE_DELAY > 0 and len(model_names) > 1:
+        stream_to = _first_streamer(on_partial)
+        response, used_model, last_error = _request_hedged(
+            model_names,
+            lambda name: _attempt_model(
+                name, prompt, generation_config, safety_settings, api_key,
+                deadline.timeout(API_TIMEOUT), deadline, first_line, stream_to(name),
+            ),
+            deadline,
+        )
+    else:
+        # Try each model until one works (with timeout protection)
+        for model_name in model_names:
+            timeout = deadline.timeout(API_TIMEOUT)
+            try:
+                response = _attempt_model(
+                    model_name, prompt, generation_config, safety_settings, api_key, timeout, deadline,
+                    first_line, on_partial,
+                )
+                used_model = model_name
+                logger.info(f"Using model: {model_name}")
+                break  # Success!
+            except (RateLimited, DeadlineExceeded, ResponseRejected, PromptTooLarge):
+                raise  # Other models share the quota, the deadline and the content rules
+            except Exception as e:
+                last_error = e
+    
+    if response is None:
+        # If all models failed, try listing available models as last resort
+        try:
+            logger.debug("Discovering available models...")
+            models = call_with_timeout(
+                lambda: list(genai.list_models()), deadline.timeout(API_TIMEOUT), deadline=deadline
+            )
+            for model in models:
+                if 'generateContent' in model.supported_generation_methods:
+                    model_name = model.name.replace('models/', '')
+                    if model_name in model_names:
+                        continue  # Already tried above
+                    try:
+                        response = _attempt_model(
+                            model_name, prompt, generation_config, safety_settings, api_key,
+                            deadline.timeout(API_TIMEOUT), deadline, first_line, on_partial,
+                        )
+                        used_model = model_name
+                        logger.info(f"Using discovered model: {model_name}")
+                        break
+                    except (RateLimited, DeadlineExceeded, ResponseRejected, PromptTooLarge):
+                        raise
+                    except Exception:
+                        continue
+        except (RateLimited, DeadlineExceeded, ResponseRejected, PromptTooLarge):
+            raise
+        except TimeoutError:
+            logger.error(f"Failed to list models: Request timed out after {API_TIMEOUT}s")
+        except Exception as list_error:
+            logger.error(f"Failed to list models: {str(list_error)}")
+    
+    if response is None:
+        error_details = str(last_error) if last_error else "Unknown error"
+        logger.error(f"Could not find available Gemini model: {error_details}")
+        
+        # Check if it's an API key issue
+        is_api_key_error = "api key" in error_details.lower() or "API_KEY_INVALID" in error_details or "invalid" in error_details.lower()
+        
+        # A bad key is not an outage; anything else counts towards the circuit breaker
+        if not is_api_key_error:
+            record_failure(api_key, deadline)
+        
+        if is_api_key_error:
+            raise Exception(
+                f"❌ API Key Error: The API key is invalid or expired.\n\n"
+                f"🔑 To fix this, set your own Gemini API key:\n\n"
+                f"Option 1 (Recommended): Export it in your terminal:\n"
+                f"   export GEMINI_API_KEY='your-api-key-here'\n\n"
+                f"Option 2: Create a .env file in your project:\n"
+                f"   echo 'GEMINI_API_KEY=your-api-key-here' > .env\n\n"
+                f"Option 3: Add to your shell config (~/.bashrc or ~/.zshrc):\n"
+                f"   echo 'export GEMINI_API_KEY=\"your-api-key-here\"' >> ~/.bashrc\n"
+                f"   source ~/.bashrc\n\n"
+                f"📝 Get your API key from: https://makersuite.google.com/app/apikey\n\n"
+                f"💡 The default shared key may have expired. Setting your own key ensures unlimited usage.\n"
+            )
+        else:
+            # Check if it's a timeout issue
+            is_timeout = "timeout" in error_details.lower() or "timed out" in error_details.lower()
+            if is_timeout:
+                raise Exception(
+                    f"⏱️ Request Timeout: The API request took longer than {API_TIMEOUT} seconds.\n\n"
+                    f"This might be due to:\n"
+                    f"1. Very large diff (over {MAX_DIFF_LENGTH} chars) - try committing smaller changes\n"
+                    f"2. Slow network connection\n"
+                    f"3. API service issues\n\n"
+                    f"💡 Try:\n"
+                    f"- Breaking your changes into smaller commits\n"
+                    f"- Checking your internet connection\n"
+                    f"- Retrying the operation\n"
+                )
+            else:
+                raise Exception(
+                    f"Could not find an available Gemini model.\n\n"
+                    f"Tried models: {', '.join(model_names)}\n"
+                    f"Last error: {error_details[:200]}\n\n"
+                    f"This might be due to:\n"
+                    f"1. API key doesn't have access to Gemini models\n"
+                    f"2. API key is invalid or expired\n"
+                    f"3. Network/connectivity issues\n\n"
+                    f"Please verify your API key at: https://makersuite.google.com/app/apikey\n"
+                    f"And check available models at: https://ai.google.dev/models/gemini"
+                )
+    
+    record_success(api_key)
+    
+    if first_line:
+        return [text.strip() for text in response]  # Streamed, checked chunk by chunk
+    
+    _check_response(response)
+    
+    # Extract the commit message from the response
+    try:
+        text = response.text.strip()
+    except ValueError as e:
+        # If response.text fails, try to get it from parts
+        candidate = response.candidates[0]
+        if candidate.content and candidate.content.parts:
+            text = candidate.content.parts[0].text.strip()
+        else:
+            raise ResponseRejected(
+                f"❌ Could not extract commit message from API response.\n\n"
+                f"Error: {str(e)}\n\n"
+                f"Please try again or use a manual commit message.\n"
+            )
+    
+    # Extra candidates are optional: keep the ones that finished normally
+    texts = [text]
+    for candidate in response.candidates[1:]:
+        try:
+            _check_candidate(candidate)
+        except ResponseRejected:
+            continue
+        if _candidate_text(candidate).strip():
+            texts.append(_candidate_text(candidate).strip())
+    return texts
+
+
+def _check_response(response, streaming: bool = False) -> None:
+    """
+    Check that a response (or streamed chunk) was not blocked.
+    
+    Only the first candidate is checked; extra candidates are checked
+    (and dropped if blocked) where their text is read.
+    
+    Args:
+        response: API response or stream chunk
+        streaming: Whether this is a chunk of a stream still in progress
+            (its finish reason may still be unset)
+        
+    Raises:
+        ResponseRejected: If the content was blocked or the response is unusable
+    """
+    # Check if response was blocked by safety filters
+    if not response.candidates or len(response.candidates) == 0:
+        raise ResponseRejected(
+            f"❌ No response candidates returned from the API.\n"
+            f"This might be due to content being blocked by safety filters."
+        )
+    
+    _check_candidate(response.candidates[0], streaming)
+
+
+def _check_candidate(candidate, streaming: bool = False) -> None:
+    """
+    Check the finish reason of one response candidate.
+    
+    Raises:
+        ResponseRejected: If the candidate was blocked or did not finish normally
+    """
+    # Check finish reason
+    finish_reason = candidate.finish_reason
+    if streaming and not finish_reason:
+        return  # 0 = unspecified: more chunks follow
+    if finish_reason == 2:  # SAFETY - content blocked
+        raise ResponseRejected(
+            f"⚠️ Content blocked by safety filters.\n\n"
+            f"The commit message generation was blocked due to safety concerns.\n"
+            f"This can happen if your code changes contain sensitive content.\n\n"
+            f"💡 Try:\n"
+            f"- Committing smaller changes\n"
+            f"- Using manual commit message: autocommit --skip-ai\n"
+            f"- Checking if your code contains sensitive information\n"
+        )
+    elif finish_reason == 3:  # RECITATION - content recitation detected
+        raise ResponseRejected(
+            f"⚠️ Content recitation detected.\n\n"
+            f"The API detected potential recitation of copyrighted content.\n"
+            f"Please try with a different set of changes or use a manual commit message.\n"
+        )
+    elif finish_reason != 1:  # 1 = STOP (normal completion)
+        raise ResponseRejected(
+            f"⚠️ Unexpected finish reason: {finish_reason}\n\n"
+            f"The API response had an unexpected finish reason.\n"
+            f"Please try again or use a manual commit message.\n"
+        )
+
+
+class GeminiProvider(Provider):
+    """Google Gemini through google.generativeai (the default provider)."""
+    
+    name = "gemini"
+    
+    def configured(self) -> bool:
+        return bool(_current_api_key())
+    
+    @property
+    def circuit_key(self) -> str:
+        return _current_api_key()
+    
+    @property
+    def token_model(self) -> str:
+        return (get_model_order(_current_api_key()) or [self.name])[0]
+    
+    def ping(self, timeout: float) -> None:
+        genai.configure(api_key=_current_api_key())
+        call_with_timeout(lambda: next(iter(genai.list_models())), timeout)
+    
+    def request(
+        self,
+        prompt: str,
+        max_output_tokens: int,
+        deadline: Deadline,
+        first_line: bool = False,
+        on_partial: Optional[Callable[[str], None]] = None,
+        candidate_count: int = 1,
+    ) -> list[str]:
+        return _gemini_request_candidates(
+            prompt, max_output_tokens, deadline, first_line, on_partial, candidate_count
+        )
+
+
+register_provider(GeminiProvider.name, GeminiProvider)
@@ -0,0 +1,191 @@
+"""Coalesce commit message requests into batched model calls (for bots committing in many repositories)."""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from .ai import generate_commit_message, generate_commit_message_batch
+from .circuit import CircuitOpen
+from .deadline import DeadlineExceeded
+from .logger import get_logger
+from .prompt_builder import estimate_tokens
+from .ratelimit import RateLimited
+
+logger = get_logger()
+
+# A batch is sent when the first request has waited BATCH_WINDOW seconds, or
+# earlier once it holds BATCH_MAX_ITEMS diffs or BATCH_MAX_TOKENS of diff
+try:
+    BATCH_WINDOW = float(os.getenv("AUTOCOMMIT_BATCH_WINDOW", "0.5"))
+except ValueError:
+    BATCH_WINDOW = 0.5
+BATCH_MAX_ITEMS = 8
+BATCH_MAX_TOKENS = 8000
+
+# Diffs larger than this get a request of their own (estimate_tokens units)
+BATCH_ITEM_MAX_TOKENS = 2000
+
+BATCH_WORKERS = 4
+
+# Errors that would hit every item alike, so falling back per item won't help
+SHARED_ERRORS = (CircuitOpen, RateLimited, DeadlineExceeded, ValueError)
+
+
+class CommitMessageBatcher:
+    """
+    Collects diffs from any number of threads and answers them in batches.
+
+    Usage:
+        with CommitMessageBatcher() as batcher:
+            message = batcher.generate(diff_text)  # from each worker thread
+    """
+
+    def __init__(
+        self,
+        window: float = BATCH_WINDOW,
+        max_items: int = BATCH_MAX_ITEMS,
+        max_tokens: int = BATCH_MAX_TOKENS,
+    ):
+        """
+        Initialize batcher.
+
+        Args:
+            window: Seconds to wait for more diffs after the first one arrives
+            max_items: Maximum diffs per request
+            max_tokens: Maximum estimated diff tokens per request
+        """
+        self.window = window
+        self.max_items = max(1, max_items)
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, Future]] = []
+        self._pending_tokens = 0
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="autocommit-batch")
+
+    def submit(self, diff_text: str) -> Future:
+        """
+        Queue a diff for the next batch.
+
+        Returns:
+            Future resolving to the commit message (or the generation error)
+
+        Raises:
+            RuntimeError: If the batcher was closed
+        """
+        future: Future = Future()
+        tokens = estimate_tokens(diff_text)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("CommitMessageBatcher is closed")
+            if tokens > BATCH_ITEM_MAX_TOKENS:
+                self._dispatch([(diff_text, future)])  # A batch of one is a single request
+                return future
+            if self._pending and self._pending_tokens + tokens > self.max_tokens:
+                self._dispatch(self._take())
+            self._pending.append((diff_text, future))
+            self._pending_tokens += tokens
+            if len(self._pending) >= self.max_items:
+                self._dispatch(self._take())
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def generate(self, diff_text: str, timeout: Optional[float] = None) -> str:
+        """Generate a commit message for a diff, waiting for its batch."""
+        return self.submit(diff_text).result(timeout)
+
+    def flush(self) -> None:
+        """Send the pending diffs now."""
+        with self._lock:
+            self._dispatch(self._take())
+
+    def close(self) -> None:
+        """Send the pending diffs and wait for every answer."""
+        with self._lock:
+            # Batches are only dispatched under the lock, so a timer firing
+            # after this finds nothing pending
+            self._closed = True
+            self._dispatch(self._take())
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _take(self) -> list[tuple[str, Future]]:
+        """Remove and return the pending batch (caller holds the lock or owns the batcher)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        return batch
+
+    def _dispatch(self, batch: list[tuple[str, Future]]) -> None:
+        """Answer a batch on a worker thread (caller holds the lock)."""
+        if not batch:
+            return
+        try:
+            self._executor.submit(self._run, batch)
+        except RuntimeError as e:
+            # Executor already shut down: fail the batch rather than leave it waiting
+            for _, future in batch:
+                future.set_exception(e)
+
+    def _run(self, batch: list[tuple[str, Future]]) -> None:
+        """Send one batched request, falling back per item for diffs it didn't answer."""
+        if len(batch) == 1:
+            self._generate_single(*batch[0])
+            return
+
+        try:
+            messages = generate_commit_message_batch([diff_text for diff_text, _ in batch])
+        except SHARED_ERRORS as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        except Exception as e:
+            logger.warning(f"Batch: request failed, generating {len(batch)} message(s) one by one: {str(e)[:100]}")
+            messages = [None] * len(batch)
+
+        missing = []
+        for (diff_text, future), message in zip(batch, messages):
+            if message:
+                future.set_result(message)
+            else:
+                missing.append((diff_text, future))
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(missing))) as executor:
+                for diff_text, future in missing:
+                    executor.submit(self._generate_single, diff_text, future)
+
+    @staticmethod
+    def _generate_single(diff_text: str, future: Future) -> None:
+        """Answer one diff with its own request."""
+        try:
+            future.set_result(generate_commit_message(diff_text))
+        except Exception as e:
+            future.set_exception(e)
+
+
+def generate_commit_messages_batched(diff_texts: list[str]) -> list[str]:
+    """
+    Generate commit messages for many diffs using as few requests as possible.
+
+    Args:
+        diff_texts: Diffs to describe
+
+    Returns:
+        One commit message per diff, in order
+
+    Raises:
+        Exception: The first generation error, if any diff failed
+    """
+    with CommitMessageBatcher() as batcher:
+        futures = [batcher.submit(diff_text) for diff_text in diff_texts]
+    return [future.result() for future in futures]
@@ -0,0 +1,121 @@
+"""Content-addressed cache of generated commit messages."""
+
+import os
+import time
+from typing import Optional
+from .logger import get_logger
+from .storage import read_json, update_json
+
+logger = get_logger()
+
+MESSAGE_CACHE_FILE = "messages.json"
+SUMMARY_CACHE_FILE = "summaries.json"
+
+# Eviction limits
+MESSAGE_CACHE_MAX_ENTRIES = 500
+MESSAGE_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+SUMMARY_CACHE_MAX_ENTRIES = 5000
+SUMMARY_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+
+# Bump when prompt or generation changes would make old entries stale
+CACHE_VERSION = "1"
+
+
+def cache_enabled() -> bool:
+    """Check whether caching is enabled (set AUTOCOMMIT_NO_CACHE=1 to opt out)."""
+    return os.getenv("AUTOCOMMIT_NO_CACHE", "0") in ("", "0")
+
+
+def message_cache_key(head_tree: str, staged_tree: str) -> str:
+    """Build a cache key from the HEAD tree id and the staged tree id."""
+    return f"v{CACHE_VERSION}:{head_tree}:{staged_tree}"
+
+
+def get_cached_message(key: str) -> Optional[str]:
+    """
+    Look up a cached commit message.
+
+    Args:
+        key: Key from message_cache_key
+
+    Returns:
+        The cached message, or None on a miss or expired entry
+    """
+    entry = read_json(MESSAGE_CACHE_FILE).get(key)
+    if not isinstance(entry, dict):
+        return None
+    if time.time() - entry.get("time", 0) > MESSAGE_CACHE_MAX_AGE:
+        return None
+    logger.debug(f"Message cache hit: {key}")
+    return entry.get("message")
+
+
+def store_message(key: str, message: str) -> None:
+    """
+    Store a generated commit message, evicting old entries.
+
+    Args:
+        key: Key from message_cache_key
+        message: Generated commit message
+    """
+    now = time.time()
+    try:
+        with update_json(MESSAGE_CACHE_FILE) as entries:
+            entries[key] = {"message": message, "time": now}
+            _evict(entries, now, MESSAGE_CACHE_MAX_ENTRIES, MESSAGE_CACHE_MAX_AGE)
+    except OSError as e:
+        logger.debug(f"Could not write message cache: {str(e)}")
+
+
+def file_summary_key(path: str, old_blob: str, new_blob: str) -> str:
+    """Build a cache key for one file's change."""
+    return f"v{CACHE_VERSION}:{path}:{old_blob}:{new_blob}"
+
+
+def get_file_summaries(keys: list[str]) -> dict[str, str]:
+    """
+    Look up cached per-file change summaries.
+
+    Args:
+        keys: Keys from file_summary_key
+
+    Returns:
+        Dict of key to summary for every non-expired hit
+    """
+    entries = read_json(SUMMARY_CACHE_FILE)
+    now = time.time()
+    summaries = {}
+    for key in keys:
+        entry = entries.get(key)
+        if isinstance(entry, dict) and now - entry.get("time", 0) <= SUMMARY_CACHE_MAX_AGE:
+            summaries[key] = entry.get("summary", "")
+    return summaries
+
+
+def store_file_summaries(summaries: dict[str, str]) -> None:
+    """
+    Store per-file change summaries, evicting old entries.
+
+    Args:
+        summaries: Dict of key (from file_summary_key) to summary
+    """
+    if not summaries:
+        return
+    now = time.time()
+    try:
+        with update_json(SUMMARY_CACHE_FILE) as entries:
+            for key, summary in summaries.items():
+                entries[key] = {"summary": summary, "time": now}
+            _evict(entries, now, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_AGE)
+    except OSError as e:
+        logger.debug(f"Could not write summary cache: {str(e)}")
+
+
+def _evict(entries: dict, now: float, max_entries: int, max_age: float) -> None:
+    """Drop expired entries, then the oldest ones until at most max_entries remain."""
+    for key in [k for k, v in entries.items() if now - v.get("time", 0) > max_age]:
+        del entries[key]
+    if len(entries) > max_entries:
+        oldest = sorted(entries, key=lambda k: entries[k].get("time", 0))
+        for key in oldest[:len(entries) - max_entries]:
+            del entries[key]
@@ -0,0 +1,150 @@
+"""Persistent circuit breaker around the Gemini backend."""
+
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+from .logger import get_logger
+from .models import api_key_id
+from .storage import read_json, update_json
+
+logger = get_logger()
+
+CIRCUIT_FILE = "circuit.json"
+
+# Open the circuit after this many consecutive failed generations (0 disables)
+try:
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("AUTOCOMMIT_CIRCUIT_THRESHOLD", "3"))
+except ValueError:
+    CIRCUIT_FAILURE_THRESHOLD = 3
+
+# Seconds to skip the backend once the circuit is open
+try:
+    CIRCUIT_COOLDOWN = float(os.getenv("AUTOCOMMIT_CIRCUIT_COOLDOWN", "300"))
+except ValueError:
+    CIRCUIT_COOLDOWN = 300.0
+
+# How long a half-open probe may take before another process may probe
+PROBE_TIMEOUT = 120.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Generations (their Deadline objects) that have already counted a failure
+_counted_lock = threading.Lock()
+_counted: "weakref.WeakSet[object]" = weakref.WeakSet()
+
+
+class CircuitOpen(Exception):
+    """Raised when the backend is skipped because the circuit is open."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(
+            f"AI backend skipped after repeated failures (circuit open), next attempt in {retry_in:.0f}s"
+        )
+        self.retry_in = retry_in
+
+
+def allow_request(api_key: str) -> bool:
+    """
+    Check whether a generation may call the backend.
+
+    Closed: always. Open: never until the cool-down has passed; then the
+    circuit half-opens and exactly one caller (across processes) is let
+    through as a probe.
+
+    Args:
+        api_key: Gemini API key
+
+    Returns:
+        True if the caller may proceed
+    """
+    if CIRCUIT_FAILURE_THRESHOLD <= 0:
+        return True
+
+    # Fast path without taking the lock
+    state = read_json(CIRCUIT_FILE).get(api_key_id(api_key), {})
+    if state.get("state", CLOSED) == CLOSED:
+        return True
+
+    now = time.time()
+    try:
+        with update_json(CIRCUIT_FILE) as data:
+            state = data.get(api_key_id(api_key), {})
+            status = state.get("state", CLOSED)
+            if status == CLOSED:
+                return True
+            if status == OPEN and now < state.get("opened_at", 0) + CIRCUIT_COOLDOWN:
+                return False
+            if status == HALF_OPEN and now < state.get("probe_until", 0):
+                return False  # Another process is probing
+            state["state"] = HALF_OPEN
+            state["probe_until"] = now + PROBE_TIMEOUT
+            data[api_key_id(api_key)] = state
+    except OSError as e:
+        logger.debug(f"Circuit breaker unavailable: {str(e)}")
+        return True
+
+    logger.info("Circuit half-open: probing the AI backend")
+    return True
+
+
+def retry_in(api_key: str) -> float:
+    """Seconds until the open circuit allows a probe."""
+    state = read_json(CIRCUIT_FILE).get(api_key_id(api_key), {})
+    if state.get("state") == OPEN:
+        return max(0.0, state.get("opened_at", 0) + CIRCUIT_COOLDOWN - time.time())
+    return max(0.0, state.get("probe_until", 0) - time.time())
+
+
+def record_success(api_key: str) -> None:
+    """Close the circuit after the backend answered."""
+    if CIRCUIT_FAILURE_THRESHOLD <= 0:
+        return
+    state = read_json(CIRCUIT_FILE).get(api_key_id(api_key), {})
+    if state.get("state", CLOSED) == CLOSED and not state.get("failures"):
+        return
+    try:
+        with update_json(CIRCUIT_FILE) as data:
+            data[api_key_id(api_key)] = {"state": CLOSED, "failures": 0}
+    except OSError as e:
+        logger.debug(f"Circuit breaker unavailable: {str(e)}")
+    if state.get("state", CLOSED) != CLOSED:
+        logger.info("Circuit closed: AI backend is answering again")
+
+
+def record_failure(api_key: str, generation: Optional[object] = None) -> None:
+    """
+    Count a failed generation, opening the circuit at the threshold.
+
+    Args:
+        api_key: Gemini API key
+        generation: Optional object identifying the generation the failed
+            request belongs to (its Deadline); a generation sending many
+            requests (map-reduce chunks, summary batches) counts once
+    """
+    if CIRCUIT_FAILURE_THRESHOLD <= 0:
+        return
+    if generation is not None:
+        with _counted_lock:
+            if generation in _counted:
+                return
+            _counted.add(generation)
+    now = time.time()
+    try:
+        with update_json(CIRCUIT_FILE) as data:
+            state = data.get(api_key_id(api_key), {})
+            failures = state.get("failures", 0) + 1
+            if state.get("state") == HALF_OPEN or failures >= CIRCUIT_FAILURE_THRESHOLD:
+                state = {"state": OPEN, "failures": failures, "opened_at": now}
+                logger.warning(
+                    f"Circuit open: AI backend failed {failures} time(s), "
+                    f"skipping it for {CIRCUIT_COOLDOWN:.0f}s"
+                )
+            else:
+                state["failures"] = failures
+            data[api_key_id(api_key)] = state
+    except OSError as e:
+        logger.debug(f"Circuit breaker unavailable: {str(e)}")
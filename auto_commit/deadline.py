@@ -0,0 +1,138 @@
+"""Deadline budget and signal-free timeouts shared by every step of a generation run."""
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+# How often a blocked wait re-checks for cancellation (seconds)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the overall time budget has run out."""
+
+
+class Deadline:
+    """A point in time after which work should stop."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Initialize deadline.
+
+        Args:
+            seconds: Time budget from now (None for no deadline)
+        """
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Cancel the run: every later check behaves as if the deadline passed."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancel() was called."""
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None if there is no deadline."""
+        if self.cancelled:
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Check whether the deadline has passed."""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, cap: float) -> float:
+        """
+        Get the timeout for the next step: the remaining time, at most ``cap``.
+
+        Raises:
+            DeadlineExceeded: If no time is left
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if remaining <= 0:
+            raise self.exceeded()
+        return min(cap, remaining)
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Sleep for ``seconds`` unless that would outlast the deadline.
+
+        Raises:
+            DeadlineExceeded: Right away if the sleep can't finish in time, or
+                as soon as the deadline is cancelled
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            raise self.exceeded()
+        if self._cancelled.wait(seconds):
+            raise self.exceeded()
+
+    def exceeded(self) -> DeadlineExceeded:
+        """Build the exception describing why no time is left."""
+        if self.cancelled:
+            return DeadlineExceeded("Generation was cancelled")
+        return DeadlineExceeded(f"Time budget of {self.seconds:g}s exhausted")
+
+
+def call_with_timeout(
+    func: Callable[..., Any],
+    timeout: float,
+    *args,
+    deadline: Optional[Deadline] = None,
+    **kwargs,
+) -> Any:
+    """
+    Call a blocking function, giving up after ``timeout`` seconds.
+
+    The call runs on a daemon thread and the caller waits for it, so this works
+    from any thread or executor and never touches signal handlers. A call that
+    times out is abandoned (the function should carry its own timeout so the
+    thread ends on its own).
+
+    Args:
+        func: Function to call
+        timeout: Seconds to wait
+        deadline: Optional deadline; cancelling it stops the wait early
+
+    Returns:
+        Whatever func returns
+
+    Raises:
+        TimeoutError: If func didn't finish within timeout
+        DeadlineExceeded: If the deadline was cancelled while waiting
+        Exception: Whatever func raised
+    """
+    done = threading.Event()
+    outcome: dict = {}
+
+    def run() -> None:
+        try:
+            outcome["result"] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name="autocommit-call", daemon=True).start()
+
+    give_up_at = time.monotonic() + timeout
+    while not done.is_set():
+        left = give_up_at - time.monotonic()
+        if left <= 0:
+            raise TimeoutError(f"API request timed out after {timeout:g} seconds")
+        if deadline is not None and deadline.cancelled:
+            raise deadline.exceeded()
+        done.wait(min(left, CANCEL_POLL_INTERVAL))
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
@@ -1,11 +1,11 @@
 """Git operations handler using subprocess."""
 
-import subprocess
+from .gitexec import execute
 
 
 def run_cmd(cmd: list[str]) -> str:
     """
-    Run a git command safely using subprocess.
+    Run a git command through the central executor (see gitexec).
     
     Args:
         cmd: List of command and arguments (e.g., ['git', 'add', '.'])
@@ -16,18 +16,10 @@ def run_cmd(cmd: list[str]) -> str:
     Raises:
         Exception: If command fails
     """
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stdout.strip() if e.stdout else str(e)
-        raise Exception(f" Git command failed: {' '.join(cmd)}\n{error_msg}")
+    result = execute(cmd)
+    if not result.ok:
+        raise Exception(f" Git command failed: {' '.join(cmd)}\n{result.error_message}")
+    return result.stdout.strip()
 
 
 def add_all() -> None:
@@ -1,15 +1,28 @@
 """Git operations handler - refactored to return values instead of printing."""
 
-import subprocess
-from typing import Optional, Tuple
+import os
+from typing import Iterable, Optional, Tuple
+from .gitexec import execute, stream
+from .gitmeta import find_repository
 from .logger import get_logger
 
 logger = get_logger()
 
+# Read size for streaming `git diff` output (bytes)
+DIFF_CHUNK_SIZE = 64 * 1024
+
+# Pathspec batches for targeted staging: bounded in count and in command-line
+# length (Windows allows 32k characters per command line)
+STAGE_BATCH_PATHS = 1000
+STAGE_BATCH_CHARS = 16 * 1024
+
+# Tree id of an empty tree, used as HEAD tree before the first commit
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
 
 def run_cmd(cmd: list[str], check: bool = True) -> Tuple[str, bool]:
     """
-    Run a git command safely using subprocess.
+    Run a git command through the central executor (see gitexec).
     
     Args:
         cmd: List of command and arguments (e.g., ['git', 'add', '.'])
@@ -18,52 +31,182 @@ def run_cmd(cmd: list[str], check: bool = True) -> Tuple[str, bool]:
     Returns:
         Tuple of (output: str, success: bool)
     """
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            check=check,
-        )
+    result = execute(cmd)
+    if result.ok:
         output = result.stdout.strip()
         logger.git_command(' '.join(cmd), output)
         return output, True
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stdout.strip() if e.stdout else str(e)
-        logger.error(f"Git command failed: {' '.join(cmd)} - {error_msg}")
-        if check:
-            raise Exception(f"Git command failed: {' '.join(cmd)}\n{error_msg}")
-        return error_msg, False
+    
+    error_msg = result.error_message
+    logger.error(f"Git command failed: {' '.join(cmd)} - {error_msg}")
+    if check:
+        raise Exception(f"Git command failed: {' '.join(cmd)}\n{error_msg}")
+    return error_msg, False
 
 
-def add_all() -> bool:
+def add_all(snapshot: Optional["RepoSnapshot"] = None) -> bool:
     """
-    Stage all changes in the repository.
+    Stage all changes in the current directory (like `git add .`).
+    
+    Only the paths git status reports as changed are added, so the cost
+    follows the number of changed files rather than the size of the tree.
     
+    Args:
+        snapshot: Optional repository snapshot whose status listing is used
+            instead of asking git again
+        
     Returns:
         True if successful, False otherwise
     """
     logger.step("Staging all changes")
-    output, success = run_cmd(['git', 'add', '.'])
+    if snapshot is not None and snapshot.is_repo:
+        paths = snapshot.unstaged_paths
+    else:
+        paths = get_unstaged_paths()
+    success = stage_paths(paths, filter_paths=False)
     if success:
         logger.step("Staging all changes", "completed")
     return success
 
 
-def get_diff() -> str:
+def get_unstaged_paths() -> list[str]:
+    """
+    Get the paths `git add -A` would stage: modified, deleted, untracked and
+    conflicted, relative to the repository root (ignored files excluded).
+    
+    Untracked directories are listed as the directory, which `git add` expands.
+    """
+    output, success = run_cmd(['git', 'status', '--porcelain=v2', '--untracked-files=normal', '-z'], check=False)
+    if not success:
+        return []
+    snapshot = RepoSnapshot()
+    snapshot._parse_status(output)
+    return snapshot.unstaged_paths
+
+
+def stage_paths(paths: Iterable[str], filter_paths: bool = True) -> bool:
+    """
+    Stage exactly the given paths (additions, modifications and deletions).
+    
+    Paths outside the current directory are skipped, matching `git add .`.
+    
+    Args:
+        paths: Paths relative to the repository root, e.g. from a file watcher
+        filter_paths: Drop paths with nothing to stage and paths ignored by
+            .gitignore first (one `git ls-files` call); not needed for paths
+            that came from git status
+        
+    Returns:
+        True if every batch was staged
+    """
+    toplevel = get_toplevel()
+    if not toplevel:
+        return False
+    prefix = os.path.relpath(os.getcwd(), toplevel).replace(os.sep, '/')
+    paths = list(dict.fromkeys(
+        path for path in paths
+        if prefix == '.' or path == prefix or path.startswith(prefix + '/')
+    ))
+    if paths and filter_paths:
+        paths = _filter_stageable(toplevel, paths)
+    if not paths:
+        logger.debug("Nothing to stage")
+        return True
+    
+    logger.debug(f"Staging {len(paths)} path(s)")
+    for batch in _pathspec_batches(paths):
+        # Literal pathspecs: file names with *, ? or [ are not globs
+        _, success = run_cmd(['git', '-C', toplevel, '--literal-pathspecs', 'add', '-A', '--'] + batch, check=False)
+        if not success:
+            return False
+    return True
+
+
+def _filter_stageable(toplevel: str, paths: list[str]) -> list[str]:
+    """Keep the paths git would stage: changed, deleted or new and not ignored."""
+    stageable = []
+    for batch in _pathspec_batches(paths):
+        output, success = run_cmd(
+            ['git', '-C', toplevel, '--literal-pathspecs', 'ls-files', '-z', '--modified', '--deleted',
+             '--others', '--exclude-standard', '--'] + batch,
+            check=False,
+        )
+        if success:
+            stageable.extend(path for path in output.split('\0') if path)
+    return list(dict.fromkeys(stageable))
+
+
+def _pathspec_batches(paths: list[str]) -> Iterable[list[str]]:
+    """Split paths into batches that fit on a command line."""
+    batch: list[str] = []
+    size = 0
+    for path in paths:
+        if batch and (len(batch) >= STAGE_BATCH_PATHS or size + len(path) + 1 > STAGE_BATCH_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(path)
+        size += len(path) + 1
+    if batch:
+        yield batch
+
+
+def get_toplevel() -> Optional[str]:
+    """Get the top-level directory of the current working tree."""
+    repo = find_repository()
+    if repo:
+        return repo.worktree
+    output, success = run_cmd(['git', 'rev-parse', '--show-toplevel'], check=False)
+    return output if success and output else None
+
+
+def get_diff(max_bytes: Optional[int] = None) -> str:
     """
     Get the cached diff (staged changes).
     
+    The diff is streamed from git as raw bytes. When ``max_bytes`` is set,
+    reading stops as soon as the budget is exceeded and git is killed, so a
+    huge staged diff is never fully buffered or decoded.
+    
+    Args:
+        max_bytes: Optional maximum number of diff bytes to keep
+        
     Returns:
         Diff text as string (empty if no staged changes)
     """
     logger.step("Getting diff")
-    diff_output, _ = run_cmd(['git', 'diff', '--cached'], check=False)
+    cmd = ['git', 'diff', '--cached']
+    data, truncated, success = _read_stream(cmd, max_bytes)
+    if not success:
+        return ""
+    
+    if truncated:
+        # Cut back to the last complete line so we never split a line
+        # (or a multi-byte character) in half
+        cut = data.rfind(b'\n')
+        if cut > 0:
+            data = data[:cut]
+        logger.warning(f"Diff exceeds {max_bytes} bytes. Stopped reading after {len(data)} bytes.")
+    
+    diff_output = data.decode('utf-8', errors='replace').strip()
+    logger.git_command(' '.join(cmd), diff_output)
     logger.step("Getting diff", "completed")
     return diff_output
 
 
+def _read_stream(cmd: list[str], max_bytes: Optional[int] = None) -> Tuple[bytes, bool, bool]:
+    """
+    Read a command's stdout incrementally, stopping once ``max_bytes`` is exceeded.
+    
+    Args:
+        cmd: List of command and arguments
+        max_bytes: Optional maximum number of bytes to keep
+        
+    Returns:
+        Tuple of (data: bytes, truncated: bool, success: bool)
+    """
+    return stream(cmd, max_bytes, DIFF_CHUNK_SIZE)
+
+
 def commit(message: str) -> bool:
     """
     Commit staged changes with the given message.
@@ -81,13 +224,19 @@ def commit(message: str) -> bool:
     return success
 
 
-def push(branch: Optional[str] = None, dry_run: bool = False) -> Tuple[bool, str]:
+def push(
+    branch: Optional[str] = None,
+    dry_run: bool = False,
+    snapshot: Optional["RepoSnapshot"] = None,
+) -> Tuple[bool, str]:
     """
     Push commits to the current branch.
     
     Args:
         branch: Optional branch name to push to
         dry_run: If True, simulate push without actually pushing
+        snapshot: Optional repository snapshot providing the remote, the
+            current branch and its upstream (otherwise git is asked)
         
     Returns:
         Tuple of (success: bool, message: str)
@@ -99,23 +248,24 @@ def push(branch: Optional[str] = None, dry_run: bool = False) -> Tuple[bool, str
     logger.step("Pushing to remote")
     
     # Check if remote exists
-    remote_output, remote_exists = run_cmd(['git', 'remote', 'get-url', 'origin'], check=False)
-    if not remote_exists:
+    remote_url = snapshot.remote_url if snapshot is not None else get_remote_url()
+    if not remote_url:
         msg = "No remote repository configured"
         logger.warning(msg)
         return False, msg
     
     # Get current branch if not specified
     if not branch:
-        branch_output, success = run_cmd(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], check=False)
-        if success:
-            branch = branch_output
+        branch = snapshot.branch if snapshot is not None else get_current_branch()
     
-    # Try to push
-    output, success = run_cmd(['git', 'push'], check=False)
-    if success:
-        logger.step("Push", "completed")
-        return True, "Changes pushed successfully"
+    # Try to push (a branch known to have no upstream goes straight to -u)
+    output = ""
+    has_upstream = snapshot is None or (snapshot.upstream is not None and branch == snapshot.branch)
+    if has_upstream:
+        output, success = run_cmd(['git', 'push'], check=False)
+        if success:
+            logger.step("Push", "completed")
+            return True, "Changes pushed successfully"
     
     # Try with upstream setup
     if branch:
@@ -136,6 +286,8 @@ def is_git_repo() -> bool:
     Returns:
         True if it's a git repo, False otherwise
     """
+    if find_repository() is not None:
+        return True
     _, success = run_cmd(['git', 'rev-parse', '--git-dir'], check=False)
     return success
 
@@ -176,17 +328,48 @@ def init_git_repo(remote_url: Optional[str] = None) -> Tuple[bool, str]:
 
 
 def get_current_branch() -> Optional[str]:
-    """Get current git branch name."""
+    """Get current git branch name ("HEAD" when detached)."""
+    repo = find_repository()
+    head = repo.read_head() if repo else None
+    if head:
+        return head[len('refs/heads/'):] if head.startswith('refs/heads/') else 'HEAD'
     output, success = run_cmd(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], check=False)
     return output if success else None
 
 
 def get_remote_url() -> Optional[str]:
     """Get remote origin URL."""
+    repo = find_repository()
+    url = repo.remote_url('origin') if repo else None
+    if url is not None:
+        return url or None
     output, success = run_cmd(['git', 'remote', 'get-url', 'origin'], check=False)
     return output if success else None
 
 
+def get_upstream(branch: Optional[str] = None) -> Optional[str]:
+    """
+    Get the upstream of a branch, e.g. "origin/main".
+    
+    Args:
+        branch: Branch name (defaults to the current branch)
+        
+    Returns:
+        The upstream, or None if the branch has none
+    """
+    branch = branch or get_current_branch()
+    if not branch or branch == 'HEAD':
+        return None
+    repo = find_repository()
+    upstream = repo.upstream(branch) if repo else None
+    if upstream is not None:
+        return upstream or None
+    output, success = run_cmd(
+        ['git', 'rev-parse', '--abbrev-ref', '--symbolic-full-name', f'{branch}@{{upstream}}'], check=False
+    )
+    return output if success else None
+
+
 def checkout_branch(branch: str, create: bool = False) -> bool:
     """
     Checkout a branch.
@@ -205,6 +388,113 @@ def checkout_branch(branch: str, create: bool = False) -> bool:
     return success
 
 
+def get_tree_ids() -> Optional[Tuple[str, str]]:
+    """
+    Get the tree ids of HEAD and of the staged index.
+    
+    `git write-tree` hashes the index without reading any diff, so the pair
+    identifies the staged change by content.
+    
+    Returns:
+        Tuple of (head_tree: str, staged_tree: str), or None if the index
+        cannot be written as a tree (e.g. unresolved merge conflicts)
+    """
+    staged_tree, success = run_cmd(['git', 'write-tree'], check=False)
+    if not success:
+        return None
+    head_tree, success = run_cmd(['git', 'rev-parse', '--verify', '-q', 'HEAD^{tree}'], check=False)
+    if not success:
+        head_tree = EMPTY_TREE
+    return head_tree, staged_tree
+
+
+def get_staged_blobs() -> dict[str, Tuple[str, str]]:
+    """
+    Get the old and new blob ids of every staged file.
+    
+    Uses `git diff --cached --raw`, which compares index entries without
+    producing any patch text.
+    
+    Returns:
+        Dict mapping path to (old_blob: str, new_blob: str)
+    """
+    output, success = run_cmd(['git', 'diff', '--cached', '--raw', '--no-abbrev', '-z'], check=False)
+    if not success or not output:
+        return {}
+    
+    blobs = {}
+    fields = output.split('\0')
+    i = 0
+    while i < len(fields):
+        meta = fields[i]
+        if not meta.startswith(':'):
+            i += 1
+            continue
+        parts = meta[1:].split()
+        status = parts[4] if len(parts) > 4 else ""
+        # Renames and copies list both the source and the destination path
+        if status[:1] in ('R', 'C'):
+            path = fields[i + 2] if i + 2 < len(fields) else ""
+            i += 3
+        else:
+            path = fields[i + 1] if i + 1 < len(fields) else ""
+            i += 2
+        if path and len(parts) > 3:
+            blobs[path] = (parts[2], parts[3])
+    return blobs
+
+
+def get_staged_changes() -> list[Tuple[str, str, int, int]]:
+    """
+    Get the status and line counts of every staged file.
+
+    One `git diff --cached --raw --numstat` call gives both the name-status
+    records and the numstat records, without any patch text.
+
+    Returns:
+        List of (status: str, path: str, added: int, deleted: int); status is
+        the name-status letter (A, M, D, R, C, T) and binary files count 0 lines
+    """
+    output, success = run_cmd(['git', 'diff', '--cached', '--raw', '--numstat', '-z'], check=False)
+    if not success or not output:
+        return []
+
+    statuses = {}
+    counts = {}
+    fields = output.split('\0')
+    i = 0
+    while i < len(fields):
+        field = fields[i]
+        if field.startswith(':'):
+            parts = field[1:].split()
+            status = parts[4][:1] if len(parts) > 4 else "M"
+            # Renames and copies list both the source and the destination path
+            if status in ('R', 'C'):
+                path = fields[i + 2] if i + 2 < len(fields) else ""
+                i += 3
+            else:
+                path = fields[i + 1] if i + 1 < len(fields) else ""
+                i += 2
+            if path:
+                statuses[path] = status
+        elif '\t' in field:
+            added, deleted, path = (field.split('\t', 2) + ["", ""])[:3]
+            if not path:
+                # Rename: source and destination follow as separate fields
+                path = fields[i + 2] if i + 2 < len(fields) else ""
+                i += 3
+            else:
+                i += 1
+            counts[path] = (
+                int(added) if added.isdigit() else 0,
+                int(deleted) if deleted.isdigit() else 0,
+            )
+        else:
+            i += 1
+
+    return [(status, path, *counts.get(path, (0, 0))) for path, status in statuses.items()]
+
+
 def get_diff_summary() -> str:
     """Get a summary of changes (file names only)."""
     output, success = run_cmd(['git', 'diff', '--cached', '--name-status'], check=False)
@@ -214,6 +504,116 @@ def get_diff_summary() -> str:
     return "No changes"
 
 
+class RepoSnapshot:
+    """
+    Repository state from one `git status --porcelain=v2 --branch` call and
+    one read of the repository config (straight from .git/config when
+    possible), shared by every workflow step instead of asking git for
+    each fact separately.
+    """
+
+    def __init__(self):
+        self.is_repo = False
+        self.head: Optional[str] = None  # Commit id (None before the first commit)
+        self.branch: Optional[str] = None  # None when detached
+        self.upstream: Optional[str] = None  # e.g. "origin/main"
+        self.ahead = 0
+        self.behind = 0
+        self.remotes: dict[str, str] = {}  # Remote name to URL
+        self.config: dict[str, str] = {}
+        self.staged = 0  # Paths with index changes
+        self.unstaged = 0  # Tracked paths with worktree changes
+        self.untracked = 0
+        self.conflicted = 0
+        self.changed = 0  # Paths that `git add .` would stage (with those already staged)
+        self.unstaged_paths: list[str] = []  # Paths with something to stage (root-relative)
+
+    @classmethod
+    def capture(cls) -> "RepoSnapshot":
+        """Read the current repository's state (is_repo is False outside a repository)."""
+        snapshot = cls()
+        # Untracked files are listed whatever status.showUntrackedFiles says,
+        # since add_all() stages from this listing
+        output, success = run_cmd(
+            ['git', 'status', '--porcelain=v2', '--branch', '--untracked-files=normal', '-z'], check=False
+        )
+        if not success:
+            return snapshot
+        snapshot.is_repo = True
+        snapshot._parse_status(output)
+
+        repo = find_repository()
+        config = repo.config() if repo else None
+        if config is not None:
+            snapshot._set_config(config)
+        else:
+            output, success = run_cmd(['git', 'config', '--list', '--local', '-z'], check=False)
+            if success:
+                snapshot._parse_config(output)
+        return snapshot
+
+    @property
+    def remote_url(self) -> Optional[str]:
+        """URL of the 'origin' remote."""
+        return self.remotes.get('origin')
+
+    def _parse_status(self, output: str) -> None:
+        """Parse NUL-separated `git status --porcelain=v2 --branch` records."""
+        fields = output.split('\0')
+        i = 0
+        while i < len(fields):
+            record = fields[i]
+            i += 1
+            if record.startswith('# '):
+                key, _, value = record[2:].partition(' ')
+                if key == 'branch.oid':
+                    self.head = None if value == '(initial)' else value
+                elif key == 'branch.head':
+                    self.branch = None if value == '(detached)' else value
+                elif key == 'branch.upstream':
+                    self.upstream = value
+                elif key == 'branch.ab':
+                    ahead, _, behind = value.partition(' ')
+                    self.ahead, self.behind = abs(int(ahead or 0)), abs(int(behind or 0))
+            elif record[:2] in ('1 ', '2 '):
+                index_status, worktree_status = record[2], record[3]
+                self.staged += index_status != '.'
+                self.unstaged += worktree_status != '.'
+                self.changed += 1
+                # "1 XY sub mH mI mW hH hI path", "2 ... hI Xscore path" + original path
+                path = record.split(' ', 8 if record[0] == '1' else 9)[-1]
+                if worktree_status != '.':
+                    self.unstaged_paths.append(path)
+                if record[0] == '2':
+                    if worktree_status in ('R', 'C') and i < len(fields):
+                        self.unstaged_paths.append(fields[i])
+                    i += 1  # Renames and copies are followed by the original path
+            elif record.startswith('u '):
+                self.conflicted += 1
+                self.changed += 1
+                self.unstaged_paths.append(record.split(' ', 10)[-1])
+            elif record.startswith('? '):
+                self.untracked += 1
+                self.changed += 1
+                self.unstaged_paths.append(record[2:])
+
+    def _parse_config(self, output: str) -> None:
+        """Parse NUL-separated `git config --list` entries ("key\\nvalue")."""
+        config = {}
+        for entry in output.split('\0'):
+            key, _, value = entry.partition('\n')
+            if key:
+                config[key] = value
+        self._set_config(config)
+
+    def _set_config(self, config: dict[str, str]) -> None:
+        """Take the repository config and the remotes it defines."""
+        self.config = config
+        for key, value in config.items():
+            if key.startswith('remote.') and key.endswith('.url'):
+                self.remotes[key[len('remote.'):-len('.url')]] = value
+
+
 def setup_git_repo_if_needed(prompt_callback=None) -> tuple[bool, str]:
     """
     Check if git repo exists, if not prompt user for URL and initialize.
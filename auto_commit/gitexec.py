@@ -0,0 +1,408 @@
+"""Central git executor: timeouts, per-command timing and memoization of read-only queries.
+
+Every git process the tool starts goes through execute() or stream().
+Within a run (between start_run() and end_run()), read-only queries are
+answered from memory until a mutating command runs; outside a run nothing is
+memoized. Each command is timed and killed, with its whole process group,
+when it exceeds its timeout.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger()
+
+
+def _env_seconds(name: str, default: float) -> float:
+    """Read a timeout from the environment (0 or less disables it)."""
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# Per-command timeouts in seconds; network commands may wait for a slow remote
+GIT_TIMEOUT = _env_seconds("AUTOCOMMIT_GIT_TIMEOUT", 60.0)
+GIT_NETWORK_TIMEOUT = _env_seconds("AUTOCOMMIT_GIT_NETWORK_TIMEOUT", 120.0)
+# Grace period between asking a timed-out process group to stop and killing it
+KILL_GRACE = 2.0
+
+NETWORK_COMMANDS = {"push", "fetch", "pull", "clone", "ls-remote"}
+
+# Commands that run hooks (pre-commit, commit-msg, ...). Hooks may lint or
+# test for minutes and may need the terminal (GPG pinentry), so these get no
+# default timeout and stay attached to the caller's terminal.
+HOOK_COMMANDS = {"commit", "merge", "rebase", "am"}
+# Network commands that also run hooks (pre-push, post-merge): no timeout only
+# when run from a terminal, where the user can answer a prompt or interrupt.
+# Otherwise GIT_NETWORK_TIMEOUT applies and git may not prompt at all.
+NETWORK_HOOK_COMMANDS = {"push", "pull"}
+
+# Commands that never change the repository (write-tree only adds an object
+# for the current index, so its answer also only changes with the index)
+READ_ONLY_COMMANDS = {
+    "rev-parse", "status", "diff", "diff-index", "diff-files", "log", "show", "ls-files",
+    "ls-remote", "cat-file", "merge-base", "rev-list", "describe", "for-each-ref",
+    "write-tree", "var", "version", "check-ignore", "count-objects",
+}
+# Read-only, but answered by the remote, so never reused
+UNCACHED_COMMANDS = {"ls-remote"}
+
+# Global options that take a separate value (`git -C dir`, `git -c key=value`)
+OPTIONS_WITH_VALUE = {"-C", "-c", "--git-dir", "--work-tree", "--namespace"}
+
+_lock = threading.Lock()
+_memo: dict[tuple, "GitResult"] = {}
+_run_active = False  # Whether read-only answers are memoized (inside a run)
+_config_overrides: list[str] = []  # "-c key=value" arguments added to every command
+_timings: dict[str, list] = {}  # Subcommand to [count, total seconds, max seconds]
+
+
+class GitResult:
+    """Outcome of one git command."""
+
+    def __init__(self, returncode: int, stdout: str, stderr: str = "", duration: float = 0.0, timed_out: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.timed_out = timed_out
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command succeeded."""
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def error_message(self) -> str:
+        """Describe why the command failed (its output, a timeout or the exit status)."""
+        if self.timed_out:
+            return f"timed out after {self.duration:.0f}s"
+        return self.stdout.strip() or self.stderr.strip() or f"exit status {self.returncode}"
+
+
+def subcommand(cmd: list[str]) -> str:
+    """Get the git subcommand of a command line (e.g. "status"), skipping global options."""
+    i = 1
+    while i < len(cmd):
+        arg = cmd[i]
+        if arg in OPTIONS_WITH_VALUE:
+            i += 2
+        elif arg.startswith("-"):
+            i += 1
+        else:
+            return arg
+    return ""
+
+
+def is_read_only(cmd: list[str]) -> bool:
+    """
+    Check whether a git command leaves the repository unchanged.
+
+    config, remote and branch are read-only only in their query forms.
+    """
+    name = subcommand(cmd)
+    if name in READ_ONLY_COMMANDS:
+        return True
+    args = cmd[cmd.index(name) + 1:] if name else []
+    positional = [arg for arg in args if not arg.startswith("-")]
+    if name == "config":
+        queries = {"--get", "--get-all", "--get-regexp", "--list", "-l", "--get-urlmatch"}
+        return bool(queries & set(args)) or (len(positional) == 1 and not set(args) & {"--unset", "--unset-all"})
+    if name == "remote":
+        return not positional or positional[0] in ("get-url", "show")
+    if name == "branch":
+        return not positional or bool({"--list", "-l", "--show-current"} & set(args))
+    return False
+
+
+def start_run() -> None:
+    """Start a run: forget memoized answers, timings and config overrides, and memoize from now on."""
+    global _run_active
+    with _lock:
+        _memo.clear()
+        _timings.clear()
+        _config_overrides.clear()
+        _run_active = True
+
+
+def end_run() -> None:
+    """
+    End a run: forget memoized answers and config overrides and stop memoizing.
+
+    Memoized answers are only valid while nothing else touches the
+    repository, which a long-lived process can't assume between runs.
+    Timings are kept for timing_report().
+    """
+    global _run_active
+    with _lock:
+        _memo.clear()
+        _config_overrides.clear()
+        _run_active = False
+
+
+def invalidate() -> None:
+    """Forget memoized answers (the repository changed outside this executor)."""
+    with _lock:
+        _memo.clear()
+
+
+def set_config_overrides(overrides: dict[str, str]) -> None:
+    """
+    Run every following git command with these config values (`git -c key=value`).
+
+    The repository's own config is left untouched; an empty dict removes them.
+    """
+    arguments = []
+    for key, value in overrides.items():
+        arguments += ["-c", f"{key}={value}"]
+    with _lock:
+        _config_overrides[:] = arguments
+        _memo.clear()
+
+
+def execute(
+    cmd: list[str],
+    timeout: Optional[float] = None,
+    merge_stderr: bool = True,
+) -> GitResult:
+    """
+    Run a git command.
+
+    Within a run, read-only commands are answered from memory when the same
+    command ran since the last mutating one. A mutating command clears that
+    memory.
+
+    Args:
+        cmd: Command line, starting with "git"
+        timeout: Seconds before the command is killed (defaults to
+            GIT_TIMEOUT, GIT_NETWORK_TIMEOUT for network commands, and
+            no limit for commands that run hooks; see _default_timeout())
+        merge_stderr: Put stderr into stdout (like 2>&1)
+
+    Returns:
+        GitResult (returncode -1 if git couldn't start or timed out)
+    """
+    name = subcommand(cmd)
+    read_only = is_read_only(cmd)
+    key = (tuple(cmd), os.getcwd(), merge_stderr)
+    memoize = read_only and name not in UNCACHED_COMMANDS and _run_active
+    if memoize:
+        with _lock:
+            cached = _memo.get(key)
+        if cached is not None:
+            logger.debug(f"git {name}: reused ({' '.join(cmd)})")
+            return cached
+    elif not read_only:
+        invalidate()
+
+    if timeout is None:
+        timeout = _default_timeout(name)
+
+    started = time.monotonic()
+    try:
+        proc = _start(cmd, name, subprocess.STDOUT if merge_stderr else subprocess.PIPE)
+    except OSError as e:
+        return GitResult(-1, "", str(e))
+
+    with _Watchdog(proc, timeout) as watchdog:
+        stdout, stderr = proc.communicate()
+    result = GitResult(
+        proc.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        (stderr or b"").decode("utf-8", errors="replace"),
+        time.monotonic() - started,
+        watchdog.fired,
+    )
+    _record(name, result)
+
+    if memoize and result.ok:
+        with _lock:
+            if _run_active:
+                _memo[key] = result
+    elif not read_only:
+        invalidate()  # Also drop answers memoized while it ran
+    return result
+
+
+def stream(cmd: list[str], max_bytes: Optional[int] = None, chunk_size: int = 64 * 1024) -> Tuple[bytes, bool, bool]:
+    """
+    Read a command's stdout incrementally, stopping once ``max_bytes`` is exceeded.
+
+    Args:
+        cmd: Command line, starting with "git"
+        max_bytes: Optional maximum number of bytes to keep
+        chunk_size: Read size
+
+    Returns:
+        Tuple of (data: bytes, truncated: bool, success: bool)
+    """
+    name = subcommand(cmd)
+    if not is_read_only(cmd):
+        invalidate()
+    started = time.monotonic()
+    try:
+        proc = _start(cmd, name, subprocess.PIPE)
+    except OSError as e:
+        logger.error(f"Git command failed: {' '.join(cmd)} - {str(e)}")
+        return b"", False, False
+
+    # Drained alongside stdout: a command writing more than a pipe buffer of
+    # warnings would otherwise block before finishing its stdout
+    errors = []
+    stderr_reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    chunks = []
+    size = 0
+    truncated = False
+    with _Watchdog(proc, _default_timeout(name)) as watchdog:
+        try:
+            while True:
+                read_size = chunk_size
+                if max_bytes is not None:
+                    # Read at most one byte past the budget to detect truncation
+                    read_size = min(read_size, max_bytes + 1 - size)
+                chunk = proc.stdout.read(read_size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    truncated = True
+                    break
+        finally:
+            if truncated:
+                _signal_group(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+            proc.stdout.close()
+            returncode = proc.wait()
+            # A helper git spawned may still hold stderr open; don't wait on it for long
+            stderr_reader.join(KILL_GRACE)
+            if not stderr_reader.is_alive():
+                proc.stderr.close()
+    error_output = b"".join(errors)
+    _record(name, GitResult(returncode, "", duration=time.monotonic() - started, timed_out=watchdog.fired))
+
+    if watchdog.fired:
+        logger.error(f"Git command timed out: {' '.join(cmd)}")
+        return b"", False, False
+    if not truncated and returncode != 0:
+        error_msg = error_output.decode('utf-8', errors='replace').strip()
+        logger.error(f"Git command failed: {' '.join(cmd)} - {error_msg}")
+        return b"", False, False
+
+    data = b"".join(chunks)
+    if truncated:
+        data = data[:max_bytes]
+    return data, truncated, True
+
+
+def timing_report() -> str:
+    """Summarize the wall time spent per git subcommand in this run."""
+    with _lock:
+        timings = sorted(_timings.items(), key=lambda item: -item[1][1])
+    if not timings:
+        return "no git commands run"
+    return ", ".join(
+        f"{name} {count}x {total * 1000:.0f} ms (max {longest * 1000:.0f} ms)"
+        for name, (count, total, longest) in timings
+    )
+
+
+def _default_timeout(name: str) -> float:
+    """Get the default timeout of a subcommand (0 for none)."""
+    if name in HOOK_COMMANDS or (name in NETWORK_HOOK_COMMANDS and _interactive()):
+        return 0
+    return GIT_NETWORK_TIMEOUT if name in NETWORK_COMMANDS else GIT_TIMEOUT
+
+
+def _interactive() -> bool:
+    """Check whether stdin is a terminal someone can answer prompts on."""
+    return sys.stdin is not None and sys.stdin.isatty()
+
+
+def _start(cmd: list[str], name: str, stderr) -> subprocess.Popen:
+    """
+    Start a git process in its own process group, so a timeout can stop
+    everything it spawned (ssh, credential helpers).
+
+    Commands that run hooks, and network commands run from an interactive
+    terminal, stay in the caller's process group with its stdin instead: a
+    background group could not prompt for credentials or a GPG passphrase.
+    Detached network commands run with GIT_TERMINAL_PROMPT=0, so a missing
+    credential fails at once instead of waiting for the timeout.
+    """
+    if cmd and cmd[0] == "git" and _config_overrides:
+        cmd = cmd[:1] + _config_overrides + cmd[1:]
+    attached = name in HOOK_COMMANDS or (name in NETWORK_COMMANDS and _interactive())
+    kwargs = {}
+    if not attached:
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        if name in NETWORK_COMMANDS:
+            kwargs["env"] = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    return subprocess.Popen(
+        cmd, stdin=None if attached else subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr, **kwargs
+    )
+
+
+class _Watchdog:
+    """Terminates a process (and its process group) if it outlives its timeout."""
+
+    def __init__(self, proc: subprocess.Popen, timeout: float):
+        self.proc = proc
+        self.fired = False
+        self._timer = threading.Timer(timeout, self._fire) if timeout and timeout > 0 else None
+
+    def __enter__(self):
+        if self._timer:
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._timer:
+            self._timer.cancel()
+
+    def _fire(self) -> None:
+        """Ask the process group to stop, then kill it after a grace period."""
+        if self.proc.poll() is not None:
+            return
+        self.fired = True
+        logger.warning(f"Git command timed out after {self._timer.interval:g}s, stopping it (pid {self.proc.pid})")
+        _signal_group(self.proc, signal.SIGTERM)
+        try:
+            self.proc.wait(KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            _signal_group(self.proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+def _signal_group(proc: subprocess.Popen, sig: int) -> None:
+    """Send a signal to a process's group if it leads one, otherwise to the process."""
+    try:
+        if os.name != "nt" and os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except (OSError, ProcessLookupError):
+        pass  # Already gone
+
+
+def _record(name: str, result: GitResult) -> None:
+    """Add a command's wall time to the run's timings."""
+    with _lock:
+        entry = _timings.setdefault(name or "git", [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += result.duration
+        entry[2] = max(entry[2], result.duration)
+    logger.debug(f"git {name}: {result.duration * 1000:.0f} ms (exit {result.returncode})")
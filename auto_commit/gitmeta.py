@@ -0,0 +1,257 @@
+"""Read git metadata (HEAD, refs, config) straight from the .git directory, without spawning git.
+
+Every lookup returns None when the layout is anything unusual (reftable,
+config includes, GIT_DIR overrides, ...); callers then ask git itself.
+"""
+
+import os
+import re
+from typing import Optional
+
+# With any of these set, git may look somewhere else than we would
+OVERRIDE_VARIABLES = (
+    "GIT_DIR", "GIT_WORK_TREE", "GIT_COMMON_DIR", "GIT_CEILING_DIRECTORIES",
+    "GIT_DISCOVERY_ACROSS_FILESYSTEM", "GIT_CONFIG", "GIT_CONFIG_COUNT",
+)
+
+# Follow symbolic refs at most this deep
+MAX_REF_DEPTH = 5
+
+SECTION_PATTERN = re.compile(r'^\[\s*([^\]\s"]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(.*)$')
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+OBJECT_ID_PATTERN = re.compile(r'^[0-9a-f]{40}(?:[0-9a-f]{24})?$')
+
+
+class Repository:
+    """Paths of a repository found on disk."""
+
+    def __init__(self, git_dir: str, common_dir: str, worktree: str):
+        """
+        Initialize repository.
+
+        Args:
+            git_dir: The (per-worktree) git directory holding HEAD
+            common_dir: The directory holding refs, packed-refs and config
+            worktree: Top-level directory of the working tree
+        """
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.worktree = worktree
+        self._config: Optional[dict] = None
+
+    def read_head(self) -> Optional[str]:
+        """
+        Read HEAD.
+
+        Returns:
+            "refs/heads/<branch>" when on a branch, the commit id when
+            detached, or None if HEAD is unreadable
+        """
+        content = _read_file(os.path.join(self.git_dir, "HEAD"))
+        if content is None:
+            return None
+        if content.startswith("ref:"):
+            return content[4:].strip()
+        return content if OBJECT_ID_PATTERN.match(content) else None
+
+    def resolve_ref(self, ref: str) -> Optional[str]:
+        """
+        Resolve a ref (e.g. "HEAD", "refs/heads/main") to a commit id.
+
+        Loose refs win over packed-refs, as in git. Returns None if the ref
+        doesn't exist (including an unborn branch).
+        """
+        for _ in range(MAX_REF_DEPTH):
+            # HEAD and other pseudo-refs are per worktree, refs/ are shared
+            base = self.common_dir if ref.startswith("refs/") else self.git_dir
+            content = _read_file(os.path.join(base, *ref.split("/")))
+            if content is None:
+                return self._packed_refs().get(ref)
+            if content.startswith("ref:"):
+                ref = content[4:].strip()
+                continue
+            return content if OBJECT_ID_PATTERN.match(content) else None
+        return None
+
+    def config(self) -> Optional[dict[str, str]]:
+        """
+        Read the repository config as "section.subsection.key" to value.
+
+        Section and key names are lowercased (subsections keep their case)
+        and the last value of a key wins, as with `git config --get`.
+
+        Returns:
+            The config, or None if it uses includes or per-worktree config
+        """
+        if self._config is None:
+            content = _read_file(os.path.join(self.common_dir, "config"), strip=False)
+            self._config = _parse_config(content) if content is not None else None
+            if self._config and self._config.get("extensions.worktreeconfig", "").lower() == "true":
+                self._config = None
+        return self._config
+
+    def remote_url(self, remote: str = "origin") -> Optional[str]:
+        """Get a remote's URL ("" if the remote is not configured, None if unknown)."""
+        config = self.config()
+        if config is None:
+            return None
+        return config.get(f"remote.{remote}.url", "")
+
+    def upstream(self, branch: str) -> Optional[str]:
+        """Get a branch's upstream like "origin/main" ("" if none, None if unknown)."""
+        config = self.config()
+        if config is None:
+            return None
+        remote = config.get(f"branch.{branch}.remote")
+        merge = config.get(f"branch.{branch}.merge", "")
+        if not remote or not merge.startswith("refs/heads/"):
+            return ""
+        name = merge[len("refs/heads/"):]
+        return name if remote == "." else f"{remote}/{name}"
+
+    def index_entries(self) -> Optional[int]:
+        """Count the files tracked in the index (None if it's missing or unreadable)."""
+        try:
+            with open(os.path.join(self.git_dir, "index"), "rb") as f:
+                header = f.read(12)
+        except OSError:
+            return None
+        # "DIRC", version and entry count, each 4 bytes big-endian
+        if len(header) < 12 or header[:4] != b"DIRC":
+            return None
+        return int.from_bytes(header[8:12], "big")
+
+    def _packed_refs(self) -> dict[str, str]:
+        """Read packed-refs (ref name to commit id)."""
+        content = _read_file(os.path.join(self.common_dir, "packed-refs"))
+        refs = {}
+        for line in (content or "").splitlines():
+            if not line or line[0] in "#^":
+                continue  # Header and peeled tag lines
+            object_id, _, name = line.partition(" ")
+            refs[name.strip()] = object_id
+        return refs
+
+
+def find_repository(path: Optional[str] = None) -> Optional[Repository]:
+    """
+    Find the repository containing a directory, like git's discovery.
+
+    Handles .git directories, worktree and submodule `gitdir:` files and
+    `commondir` links.
+
+    Args:
+        path: Directory to start from (defaults to the current directory)
+
+    Returns:
+        The repository, or None if none was found or the setup is unusual
+    """
+    if any(os.environ.get(name) for name in OVERRIDE_VARIABLES):
+        return None
+
+    current = os.path.abspath(path or os.getcwd())
+    while True:
+        dot_git = os.path.join(current, ".git")
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+        elif os.path.isfile(dot_git):
+            content = _read_file(dot_git)
+            if not content or not content.startswith("gitdir:"):
+                return None
+            git_dir = os.path.normpath(os.path.join(current, content[7:].strip()))
+        else:
+            parent = os.path.dirname(current)
+            if parent == current:
+                return None
+            current = parent
+            continue
+        break
+
+    common_dir = git_dir
+    link = _read_file(os.path.join(git_dir, "commondir"))
+    if link:
+        common_dir = os.path.normpath(os.path.join(git_dir, link))
+
+    if not os.path.isfile(os.path.join(git_dir, "HEAD")):
+        return None
+    if os.path.exists(os.path.join(common_dir, "reftable")):
+        return None  # Refs are in a binary table only git reads
+    return Repository(git_dir, common_dir, current)
+
+
+def _read_file(path: str, strip: bool = True) -> Optional[str]:
+    """Read a small text file (None if missing or unreadable)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return content.strip() if strip else content
+
+
+def _parse_config(content: str) -> Optional[dict[str, str]]:
+    """Parse a git config file (None if it includes other files)."""
+    config = {}
+    section = None
+    lines = content.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        i += 1
+        if not line or line[0] in "#;":
+            continue
+
+        if line.startswith("["):
+            match = SECTION_PATTERN.match(line)
+            if not match:
+                return None
+            name, subsection, line = match.groups()
+            # The deprecated [section.subsection] form lowercases the subsection too
+            section = name.lower()
+            if subsection is not None:
+                section += "." + ESCAPE_PATTERN.sub(r"\1", subsection)
+            if section == "include" or section.startswith("includeif."):
+                return None
+            if not line or line[0] in "#;":
+                continue
+
+        if section is None:
+            return None
+        key, has_value, raw = line.partition("=")
+        key = key.strip().lower()
+        if not has_value:
+            config[f"{section}.{key}"] = "true"
+            continue
+        # Values may continue on the next line after a trailing backslash
+        while _continues(raw) and i < len(lines):
+            raw = raw.rstrip()[:-1] + lines[i]
+            i += 1
+        config[f"{section}.{key}"] = _parse_value(raw)
+    return config
+
+
+def _continues(raw: str) -> bool:
+    """Check whether a raw value ends with a line-continuation backslash."""
+    stripped = raw.rstrip()
+    return stripped.endswith("\\") and (len(stripped) - len(stripped.rstrip("\\"))) % 2 == 1
+
+
+def _parse_value(raw: str) -> str:
+    """Unquote a config value, dropping trailing comments."""
+    value = []
+    in_quotes = False
+    i = 0
+    while i < len(raw):
+        char = raw[i]
+        if char == "\\" and i + 1 < len(raw):
+            value.append({"n": "\n", "t": "\t", "b": "\b"}.get(raw[i + 1], raw[i + 1]))
+            i += 2
+            continue
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char in "#;" and not in_quotes:
+            break
+        else:
+            value.append(char)
+        i += 1
+    return "".join(value).strip()
@@ -0,0 +1,248 @@
+"""Reuse commit messages from the repository's own history for recurring change patterns."""
+
+import hashlib
+import re
+import time
+from collections import Counter
+from typing import Optional
+from .git_ops import get_toplevel, run_cmd
+from .gitmeta import find_repository
+from .logger import get_logger
+from .storage import read_json, update_json
+
+logger = get_logger()
+
+HISTORY_FILE = "history.json"
+# Bumped when the index layout changes, so old indexes are rebuilt
+HISTORY_INDEX_VERSION = 2
+
+# Commits read when the index is first built (later refreshes read only new commits)
+HISTORY_MAX_COMMITS = 500
+HISTORY_MAX_PATTERNS = 2000
+
+# A pattern must have recurred this often, and the staged change must share
+# at least this fraction of its path shape, before its message is reused
+HISTORY_MIN_OCCURRENCES = 2
+HISTORY_MATCH_THRESHOLD = 0.8
+
+DIGITS_PATTERN = re.compile(r'\d+')
+VERSION_PATTERN = re.compile(r'\bv?\d+(?:\.\d+){1,3}(?:[-.+][0-9A-Za-z.]+)?\b')
+
+# Files whose changes recur with the same kind of message (lockfiles,
+# translations, version files), so a path match alone is enough for them
+RECURRING_PATH_PATTERN = re.compile(
+    r'(?:^|/)(?:package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|'
+    r'Pipfile\.lock|uv\.lock|Cargo\.lock|Gemfile\.lock|composer\.lock|go\.sum|'
+    r'VERSION|_?version\.(?:py|txt|json)|[^/]+\.(?:po|pot|mo|xliff|xlf|arb))$'
+    r'|(?:^|/)(?:locales?|i18n|l10n|translations)/',
+    re.IGNORECASE,
+)
+
+
+def path_shape(changes: list) -> list[str]:
+    """
+    Reduce changed files to their shape: status and path with numbers masked.
+
+    Args:
+        changes: (status, path, ...) tuples
+
+    Returns:
+        Sorted distinct shape entries, e.g. "M:migrations/#_auto.py"
+    """
+    return sorted({f"{change[0][:1]}:{DIGITS_PATTERN.sub('#', change[1])}" for change in changes})
+
+
+def subject_template(subject: str) -> str:
+    """Reduce a commit subject to its template: versions and numbers masked, case folded."""
+    return DIGITS_PATTERN.sub('#', VERSION_PATTERN.sub('<version>', subject)).strip().lower()
+
+
+def is_recurring(changes: list) -> bool:
+    """Check whether every changed path is a file that recurs by nature (lockfiles, translations, ...)."""
+    return bool(changes) and all(RECURRING_PATH_PATTERN.search(change[1]) for change in changes)
+
+
+def _repo_key() -> Optional[str]:
+    """Identify the current repository by its top-level path."""
+    toplevel = get_toplevel()
+    if not toplevel:
+        return None
+    return hashlib.sha256(toplevel.encode("utf-8")).hexdigest()[:16]
+
+
+def _head_commit() -> Optional[str]:
+    """Get the commit id of HEAD (None before the first commit)."""
+    repo = find_repository()
+    head = repo.resolve_ref('HEAD') if repo else None
+    if head:
+        return head
+    output, success = run_cmd(['git', 'rev-parse', '--verify', '-q', 'HEAD'], check=False)
+    return output if success and output else None
+
+
+def _read_log(since: Optional[str]) -> list[tuple[str, str, list]]:
+    """
+    Read non-merge commits with their changed files, oldest first.
+
+    Args:
+        since: Last indexed commit (None reads the latest HISTORY_MAX_COMMITS)
+
+    Returns:
+        List of (sha, subject, changes)
+    """
+    cmd = ['git', 'log', '--no-merges', '--format=%x1e%H%x1f%s', '--name-status']
+    cmd += [f'{since}..HEAD'] if since else [f'--max-count={HISTORY_MAX_COMMITS}', 'HEAD']
+    output, success = run_cmd(cmd, check=False)
+    if not success or not output:
+        return []
+
+    commits = []
+    for record in output.split('\x1e'):
+        header, _, body = record.partition('\n')
+        if '\x1f' not in header:
+            continue
+        sha, subject = header.split('\x1f', 1)
+        changes = []
+        for line in body.splitlines():
+            fields = line.split('\t')
+            if len(fields) >= 2:
+                changes.append((fields[0], fields[-1]))  # Renames: keep the new path
+        if changes:
+            commits.append((sha, subject.strip(), changes))
+    commits.reverse()
+    return commits
+
+
+def refresh_index() -> Optional[dict]:
+    """
+    Bring the history index of the current repository up to date.
+
+    Only commits after the last indexed one are read; if history was
+    rewritten (the last indexed commit is no longer an ancestor of HEAD)
+    the index is rebuilt.
+
+    Returns:
+        Dict of shape key to {"message", "count", "commit", "consistent"},
+        or None outside a repository
+    """
+    repo = _repo_key()
+    head = _head_commit() if repo else None
+    if not repo or not head:
+        return None
+
+    index = read_json(HISTORY_FILE).get(repo) or {}
+    if index.get("version") != HISTORY_INDEX_VERSION:
+        index = {}
+    if index.get("head") == head:
+        return index.get("patterns", {})
+
+    since = index.get("head")
+    if since:
+        _, is_ancestor = run_cmd(['git', 'merge-base', '--is-ancestor', since, 'HEAD'], check=False)
+        if not is_ancestor:
+            logger.debug("History index: history was rewritten, rebuilding")
+            since = None
+
+    commits = _read_log(since)
+    try:
+        with update_json(HISTORY_FILE) as data:
+            index = data.get(repo) or {}
+            patterns = index.get("patterns", {}) if since else {}
+            for sha, subject, changes in commits:
+                key = "\n".join(path_shape(changes))
+                entry = patterns.pop(key, None)
+                # A pattern is consistent while all its subjects share one template
+                consistent = entry is None or (
+                    entry.get("consistent", False) and subject_template(entry["message"]) == subject_template(subject)
+                )
+                # Re-inserted last, so the dict stays ordered by most recent use
+                patterns[key] = {
+                    "message": subject,
+                    "count": (entry["count"] if entry else 0) + 1,
+                    "commit": sha,
+                    "consistent": consistent,
+                }
+            for key in list(patterns)[:max(0, len(patterns) - HISTORY_MAX_PATTERNS)]:
+                del patterns[key]
+            data[repo] = {
+                "version": HISTORY_INDEX_VERSION, "head": head, "patterns": patterns, "time": time.time(),
+            }
+    except OSError as e:
+        logger.debug(f"Could not write history index: {str(e)}")
+        return None
+
+    logger.debug(f"History index: {len(commits)} new commit(s), {len(patterns)} pattern(s)")
+    return patterns
+
+
+def find_history_message(changes: list, diff_text: str = "", strict: bool = False) -> Optional[str]:
+    """
+    Propose a past commit message if the staged change repeats a recurring pattern.
+
+    A matching path shape alone says nothing about what changed, so a pattern
+    is only reused if its past subjects all share one template, or if every
+    staged path is a file that recurs by nature (lockfiles, translations).
+
+    Args:
+        changes: Staged (status, path, ...) tuples
+        diff_text: Staged diff, used to carry a new version number into the message
+        strict: Require consistent past subjects even for recurring files
+            (for runs that commit without showing the message)
+
+    Returns:
+        Message based on the closest historical pattern, or None if none is close enough
+    """
+    if not changes:
+        return None
+    recurring = not strict and is_recurring(changes)
+    patterns = refresh_index()
+    if not patterns:
+        return None
+
+    shape = set(path_shape(changes))
+    best, best_score = None, 0.0
+    for key, entry in patterns.items():
+        if entry.get("count", 0) < HISTORY_MIN_OCCURRENCES:
+            continue
+        if not entry.get("consistent") and not recurring:
+            continue
+        other = set(key.split("\n"))
+        score = len(shape & other) / len(shape | other)
+        if score > best_score or (score == best_score and best and entry["count"] > best["count"]):
+            best, best_score = entry, score
+
+    if not best or best_score < HISTORY_MATCH_THRESHOLD:
+        return None
+    logger.info(
+        f"History match: {best_score:.0%} like {best['commit'][:8]} "
+        f"(seen {best['count']} times): {best['message']}"
+    )
+    return apply_template(best["message"], diff_text)
+
+
+def apply_template(message: str, diff_text: str) -> str:
+    """
+    Fill a historical message with the staged change's details.
+
+    A version number in the message is replaced by the version the staged
+    diff introduces (e.g. "Bump version to 1.4.0" becomes "... to 1.5.0").
+    """
+    old_versions = VERSION_PATTERN.findall(message)
+    if not old_versions or not diff_text:
+        return message
+
+    added, removed = Counter(), set()
+    for line in diff_text.splitlines():
+        if line.startswith('+') and not line.startswith('+++'):
+            added.update(VERSION_PATTERN.findall(line))
+        elif line.startswith('-') and not line.startswith('---'):
+            removed.update(VERSION_PATTERN.findall(line))
+    new_versions = [version for version, _ in added.most_common() if version not in removed]
+    if not new_versions:
+        return message
+
+    new_version = new_versions[0].lstrip('v')
+    for old_version in set(old_versions):
+        prefix = 'v' if old_version.startswith('v') else ''
+        message = message.replace(old_version, prefix + new_version)
+    return message
@@ -0,0 +1,154 @@
+"""Large-repository mode: git settings that stop status, add and diff from stat-ing the whole tree."""
+
+import os
+from typing import Optional, Tuple
+from .gitexec import execute, invalidate, set_config_overrides
+from .gitmeta import find_repository
+from .logger import get_logger
+
+logger = get_logger()
+
+# Repositories tracking at least this many files get the large-repo settings
+try:
+    LARGE_REPO_FILES = int(os.getenv("AUTOCOMMIT_LARGE_REPO_FILES", "50000"))
+except ValueError:
+    LARGE_REPO_FILES = 50000
+
+# "auto" (by size), "on" or "off"
+LARGE_REPO_MODE = os.getenv("AUTOCOMMIT_LARGE_REPO", "auto").strip().lower()
+
+# Settings in the order they are applied. index.version only affects a newly
+# written index, so persist() also converts the existing one.
+LARGE_REPO_SETTINGS = {
+    "feature.manyFiles": "true",
+    "index.version": "4",
+    "core.untrackedCache": "true",
+    "core.fsmonitor": "true",
+}
+
+# Settings used for a single run (`git -c`). feature.manyFiles and
+# index.version change the index format on its next write (version 4, no
+# checksum), so only --tune-repo sets them, with the user's consent.
+RUN_SETTINGS = ("core.untrackedCache", "core.fsmonitor")
+
+# Runs of `git status` per measurement (the fastest counts, so a cold cache or
+# a starting fsmonitor daemon doesn't skew it)
+MEASURE_RUNS = 3
+
+
+def count_files() -> Optional[int]:
+    """Get the number of files in the index (None outside a repository or if unknown)."""
+    repo = find_repository()
+    return repo.index_entries() if repo else None
+
+
+def is_large_repo(files: Optional[int] = None) -> bool:
+    """Check whether large-repo mode applies to the current repository."""
+    if LARGE_REPO_MODE in ("on", "1", "true", "yes"):
+        return True
+    if LARGE_REPO_MODE in ("off", "0", "false", "no"):
+        return False
+    files = count_files() if files is None else files
+    return files is not None and files >= LARGE_REPO_FILES
+
+
+def supports_fsmonitor() -> bool:
+    """Check whether this git has the built-in file system monitor daemon."""
+    result = execute(["git", "version", "--build-options"])
+    return result.ok and "fsmonitor--daemon" in result.stdout
+
+
+def missing_settings() -> dict[str, str]:
+    """
+    Get the large-repo settings not configured already (in any config file).
+
+    Keys the user has set, to any value, are left alone (core.fsmonitor may
+    name a hook such as Watchman's).
+    """
+    result = execute(["git", "config", "--list", "-z"], merge_stderr=False)
+    if not result.ok:
+        return {}
+    configured = {entry.partition("\n")[0].lower() for entry in result.stdout.split("\0")}
+
+    settings = {}
+    for key, value in LARGE_REPO_SETTINGS.items():
+        if key.lower() in configured:
+            continue
+        if key == "core.fsmonitor" and not supports_fsmonitor():
+            continue
+        settings[key] = value
+    return settings
+
+
+def enable() -> dict[str, str]:
+    """
+    Run this tool's git commands with the large-repo settings, if the repository is large.
+
+    Only RUN_SETTINGS are used and nothing is written to the repository's
+    config. The untracked cache is stored in the index, though, and git
+    keeps using it until core.untrackedCache is set to false; the fsmonitor
+    daemon keeps running after the run.
+
+    Returns:
+        The settings now applied (empty if the repository is small or already configured)
+    """
+    files = count_files()
+    if not is_large_repo(files):
+        return {}
+    settings = {key: value for key, value in missing_settings().items() if key in RUN_SETTINGS}
+    if settings:
+        set_config_overrides(settings)
+        logger.debug(f"Large repository ({files if files is not None else '?'} files): running git with {settings}")
+    return settings
+
+
+def measure_status() -> Optional[float]:
+    """Time `git status` in seconds (fastest of MEASURE_RUNS, None if it fails)."""
+    fastest = None
+    for _ in range(MEASURE_RUNS):
+        invalidate()
+        result = execute(["git", "status", "--porcelain=v2", "-z"])
+        if not result.ok:
+            return None
+        fastest = result.duration if fastest is None else min(fastest, result.duration)
+    return fastest
+
+
+def persist(settings: dict[str, str]) -> bool:
+    """
+    Write large-repo settings to the repository's config and convert the index.
+
+    Args:
+        settings: Settings to write (usually from missing_settings())
+
+    Returns:
+        True if every setting was written
+    """
+    set_config_overrides({})
+    for key, value in settings.items():
+        if not execute(["git", "config", "--local", key, value]).ok:
+            logger.error(f"Could not set {key}={value}")
+            return False
+    if "index.version" in settings:
+        execute(["git", "update-index", "--index-version", settings["index.version"]])
+    if "core.untrackedCache" in settings:
+        execute(["git", "update-index", "--untracked-cache"])
+    return True
+
+
+def tune_repository() -> Tuple[dict[str, str], Optional[float], Optional[float]]:
+    """
+    Persist the large-repo settings and measure `git status` before and after.
+
+    Returns:
+        Tuple of (settings written, seconds before, seconds after)
+    """
+    settings = missing_settings()
+    if not settings:
+        return {}, None, None
+    before = measure_status()
+    if not persist(settings):
+        return {}, before, None
+    after = measure_status()
+    logger.info(f"Large-repo settings written: {', '.join(settings)}")
+    return settings, before, after
@@ -3,15 +3,22 @@
 import sys
 from typing import Optional
 from .git_ops import (
-    is_git_repo, init_git_repo, add_all, get_diff, commit, push,
-    get_current_branch, checkout_branch, get_diff_summary
+    RepoSnapshot, init_git_repo, add_all, get_diff, commit, push,
+    checkout_branch, get_tree_ids, get_staged_blobs, get_staged_changes
 )
-from .ai import generate_commit_message
+from .ai import generate_commit_messages, wait_for_background, CANDIDATE_COUNT, MAX_DIFF_BYTES
+from .history import find_history_message
+from .offline import generate_offline_message
 from .ui import (
     show_banner, show_step, show_spinner, show_panel, show_commit_preview,
     show_success, show_error, show_warning, show_info, confirm, prompt_input,
     show_summary, edit_with_editor, set_theme, show_footer
 )
+from .cache import cache_enabled, message_cache_key, get_cached_message, store_message
+from .circuit import CircuitOpen
+from .gitexec import end_run, start_run, timing_report
+from .largerepo import enable as enable_large_repo_mode
+from .deadline import Deadline, DeadlineExceeded
 from .logger import init_logger, get_logger
 
 
@@ -27,6 +34,9 @@ class AutoCommitWorkflow:
         quiet: bool = False,
         log_file: Optional[str] = None,
         theme: str = "hacker",
+        no_cache: bool = False,
+        ai_timeout: Optional[float] = None,
+        offline: bool = False,
     ):
         """
         Initialize workflow.
@@ -39,6 +49,10 @@ class AutoCommitWorkflow:
             quiet: Suppress non-essential output
             log_file: Path to log file
             theme: UI theme (hacker, minimal, developer)
+            no_cache: Don't reuse or store generated commit messages
+            ai_timeout: Overall time limit for AI generation in seconds
+                (defaults to AUTOCOMMIT_AI_DEADLINE or 60)
+            offline: Generate the message locally from file statistics, without AI
         """
         self.dry_run = dry_run
         self.skip_ai = skip_ai
@@ -47,6 +61,12 @@ class AutoCommitWorkflow:
         self.quiet = quiet
         self.log_file = log_file
         self.theme = theme
+        self.use_cache = not no_cache and cache_enabled()
+        self.ai_timeout = ai_timeout
+        self.offline = offline
+        self.cache_key: Optional[str] = None
+        self.candidates: list[str] = []
+        self.snapshot = RepoSnapshot()
         
         # Initialize logger
         init_logger(log_file, verbose=not quiet)
@@ -80,6 +100,8 @@ class AutoCommitWorkflow:
                 show_banner()
             
             self.logger.info("Starting auto-commit workflow")
+            start_run()
+            self._enable_large_repo_mode()
             
             # Step 0: Setup git repo if needed
             is_new_repo, remote_url = self._setup_repo()
@@ -92,17 +114,22 @@ class AutoCommitWorkflow:
             if not self._stage_changes():
                 return 0  # No changes to commit
             
-            # Get diff
-            diff_text = self._get_diff()
-            if not diff_text or diff_text.strip() == "":
-                if not self.quiet:
-                    show_info("No changes to commit")
-                return 0
+            # Reuse a message generated earlier for the same staged content
+            diff_text = ""
+            commit_message = self._get_cached_message()
             
-            # Generate commit message
-            commit_message = self._generate_commit_message(diff_text)
             if not commit_message:
-                return 1  # User cancelled or error
+                # Get diff
+                diff_text = self._get_diff()
+                if not diff_text or diff_text.strip() == "":
+                    if not self.quiet:
+                        show_info("No changes to commit")
+                    return 0
+                
+                # Generate commit message
+                commit_message = self._generate_commit_message(diff_text)
+                if not commit_message:
+                    return 1  # User cancelled or error
             
             # Preview and confirm commit message
             final_message = self._preview_commit_message(commit_message, diff_text)
@@ -120,6 +147,9 @@ class AutoCommitWorkflow:
                 if not self.quiet:
                     show_info("Dry run: Skipping push")
             
+            # Let per-file summaries made for the next run reach the cache
+            wait_for_background()
+            
             # Show summary
             if not self.quiet:
                 self._show_summary()
@@ -138,13 +168,26 @@ class AutoCommitWorkflow:
                 show_footer(success=False, message=str(e)[:50])
             self.logger.error(f"Workflow error: {str(e)}")
             return 1
+        finally:
+            self.logger.debug(f"Git timings: {timing_report()}")
+            end_run()
+    
+    def _enable_large_repo_mode(self) -> None:
+        """Use git's large-repository settings for this run if the repository needs them."""
+        settings = enable_large_repo_mode()
+        if settings and not self.quiet:
+            show_info(
+                f"Large repository: running git with {', '.join(settings)} "
+                "(run 'autocommit --tune-repo' to make this permanent)"
+            )
     
     def _setup_repo(self) -> tuple[bool, str]:
         """Setup git repository if needed."""
         if not self.quiet:
             show_step("Checking git repository", "running")
         
-        if is_git_repo():
+        self.snapshot = RepoSnapshot.capture()
+        if self.snapshot.is_repo:
             if not self.quiet:
                 show_step("Git repository found", "success")
             self._add_step("Git Repo Check", "success", "Repository exists")
@@ -174,6 +217,7 @@ class AutoCommitWorkflow:
             success, msg = init_git_repo(remote_url if remote_url else None)
         
         if success:
+            self.snapshot = RepoSnapshot.capture()
             if not self.quiet:
                 show_step("Git repository initialized", "success")
             self._add_step("Git Repo Setup", "success", msg)
@@ -189,8 +233,7 @@ class AutoCommitWorkflow:
         if not self.branch:
             return
         
-        current_branch = get_current_branch()
-        if current_branch == self.branch:
+        if self.snapshot.branch == self.branch:
             if not self.quiet:
                 show_info(f"Already on branch: {self.branch}")
             return
@@ -202,6 +245,8 @@ class AutoCommitWorkflow:
             success = checkout_branch(self.branch, create=True)
         
         if success:
+            # Branch, upstream and ahead/behind all changed
+            self.snapshot = RepoSnapshot.capture()
             if not self.quiet:
                 show_success(f"Switched to branch: {self.branch}")
             self._add_step("Branch Switch", "success", f"Switched to {self.branch}")
@@ -223,9 +268,9 @@ class AutoCommitWorkflow:
         
         if not self.quiet:
             with show_spinner("Staging all changes"):
-                success = add_all()
+                success = add_all(self.snapshot)
         else:
-            success = add_all()
+            success = add_all(self.snapshot)
         
         if success:
             if not self.quiet:
@@ -238,6 +283,23 @@ class AutoCommitWorkflow:
             self._add_step("Stage Changes", "error", "Failed to stage changes")
             return False
     
+    def _get_cached_message(self) -> Optional[str]:
+        """Look up a cached AI message for the staged tree (no diff needed)."""
+        if not self.use_cache or self.skip_ai:
+            return None
+        
+        tree_ids = get_tree_ids()
+        if not tree_ids:
+            return None
+        
+        self.cache_key = message_cache_key(*tree_ids)
+        commit_message = get_cached_message(self.cache_key)
+        if commit_message:
+            if not self.quiet:
+                show_step("Commit message loaded from cache", "success")
+            self._add_step("Generate Message", "success", f"Cached: {commit_message[:50]}")
+        return commit_message
+    
     def _get_diff(self) -> str:
         """Get diff of staged changes."""
         if not self.quiet:
@@ -245,9 +307,9 @@ class AutoCommitWorkflow:
         
         if not self.quiet:
             with show_spinner("Analyzing git diff"):
-                diff_text = get_diff()
+                diff_text = get_diff(max_bytes=MAX_DIFF_BYTES)
         else:
-            diff_text = get_diff()
+            diff_text = get_diff(max_bytes=MAX_DIFF_BYTES)
         
         if not self.quiet:
             show_step("Changes analyzed", "success")
@@ -273,18 +335,47 @@ class AutoCommitWorkflow:
                 return commit_message.strip()
             return None
         
-        # Generate with AI (silently in background, no callback)
+        # Recurring change patterns (version bumps, lockfile refreshes, ...)
+        # reuse the repository's own past message without calling the API
+        history_message = self._get_history_message(diff_text)
+        if history_message:
+            return history_message
+        
+        if self.offline:
+            return self._generate_offline_message("Offline")
+        
+        # Per-file blob ids let the AI reuse summaries of unchanged files
+        file_blobs = get_staged_blobs() if self.use_cache else None
+        # Every staged path, so files past the diff read limit are still named
+        changed_paths = [change[1] for change in get_staged_changes()]
+        
+        # One time budget for the whole generation phase
+        deadline = Deadline(self.ai_timeout) if self.ai_timeout else None
+        
+        # Alternatives are only useful if the user gets to pick in the preview
+        count = CANDIDATE_COUNT if self._interactive_preview() else 1
+        
+        # Generate with AI, showing the message live as it streams in
         try:
             if not self.quiet:
-                with show_spinner("Generating commit message with AI"):
-                    commit_message = generate_commit_message(diff_text, None)
+                with show_spinner("Generating commit message with AI") as spinner:
+                    self.candidates = generate_commit_messages(
+                        diff_text, spinner.update, file_blobs=file_blobs, deadline=deadline, count=count,
+                        changed_paths=changed_paths,
+                    )
             else:
-                commit_message = generate_commit_message(diff_text, None)
+                self.candidates = generate_commit_messages(
+                    diff_text, None, file_blobs=file_blobs, deadline=deadline, count=count,
+                    changed_paths=changed_paths,
+                )
+            commit_message = self.candidates[0]
             
             if not self.quiet:
                 show_step("Commit message generated", "success")
             
             self._add_step("Generate Message", "success", f"AI generated: {commit_message[:50]}")
+            if self.cache_key:
+                store_message(self.cache_key, commit_message)
             return commit_message
             
         except Exception as e:
@@ -293,10 +384,17 @@ class AutoCommitWorkflow:
                 show_error(f"Failed to generate commit message: {str(e)}")
             self._add_step("Generate Message", "error", str(e))
             
-            # Fallback to manual input
+            # A tripped deadline or circuit breaker, or nobody to ask, means
+            # the instant offline message is used instead of waiting for input
+            if isinstance(e, (DeadlineExceeded, CircuitOpen)) or self.quiet or self.yes:
+                commit_message = self._generate_offline_message("Offline fallback")
+                if commit_message:
+                    return commit_message
+            
+            # Fallback to manual input, suggesting the offline message
             if not self.quiet:
                 show_info("Falling back to manual input")
-                commit_message = prompt_input("Enter commit message manually")
+                commit_message = prompt_input("Enter commit message manually", generate_offline_message())
             else:
                 commit_message = input("Enter commit message manually: ")
             
@@ -304,6 +402,47 @@ class AutoCommitWorkflow:
                 return commit_message.strip()
             return None
     
+    def _get_history_message(self, diff_text: str) -> Optional[str]:
+        """Propose a past commit message if the staged change repeats a known pattern."""
+        if not self.use_cache:
+            return None
+        
+        # Without a preview nobody checks the message, so only patterns whose
+        # past subjects agree are reused
+        commit_message = find_history_message(get_staged_changes(), diff_text, strict=self.yes or self.quiet)
+        if commit_message:
+            if not self.quiet:
+                show_step("Commit message reused from history", "success")
+            self._add_step("Generate Message", "success", f"From history: {commit_message[:50]}")
+        return commit_message
+    
+    def _generate_offline_message(self, reason: str) -> Optional[str]:
+        """Build the commit message locally from the staged file statistics."""
+        commit_message = generate_offline_message()
+        if commit_message:
+            if not self.quiet:
+                show_step("Commit message generated offline", "success")
+            self._add_step("Generate Message", "success", f"{reason}: {commit_message[:50]}")
+        return commit_message
+    
+    def _interactive_preview(self) -> bool:
+        """Whether the user will be shown the preview menu."""
+        return not (self.yes or self.dry_run or self.quiet)
+    
+    def _regenerate_candidates(self, diff_text: str) -> list[str]:
+        """Fetch fresh suggestions for the preview (empty list on failure)."""
+        try:
+            diff_text = diff_text or get_diff(max_bytes=MAX_DIFF_BYTES)
+            deadline = Deadline(self.ai_timeout) if self.ai_timeout else None
+            with show_spinner("Generating new suggestions") as spinner:
+                return generate_commit_messages(
+                    diff_text, spinner.update, deadline=deadline, count=CANDIDATE_COUNT,
+                    changed_paths=[change[1] for change in get_staged_changes()],
+                )
+        except Exception as e:
+            show_error(f"Failed to generate new suggestions: {str(e)}")
+            return []
+    
     def _preview_commit_message(self, commit_message: str, diff_text: str) -> Optional[str]:
         """Preview and allow user to edit commit message."""
         if self.yes or self.dry_run:
@@ -317,8 +456,16 @@ class AutoCommitWorkflow:
             return commit_message
         
         # Show preview with options
-        diff_summary = get_diff_summary()
-        final_message = show_commit_preview(commit_message, diff_summary)
+        # Count what is actually staged (the snapshot predates staging); the
+        # listing is usually reused from the history lookup
+        staged = len(get_staged_changes())
+        diff_summary = f"{staged} file(s) changed" if staged else "No changes"
+        final_message = show_commit_preview(
+            commit_message,
+            diff_summary,
+            candidates=self.candidates,
+            regenerate=None if self.skip_ai else lambda: self._regenerate_candidates(diff_text),
+        )
         
         if not self.quiet:
             show_step("Commit message confirmed", "success")
@@ -358,12 +505,12 @@ class AutoCommitWorkflow:
         if not self.quiet:
             show_step("Pushing to remote", "running")
         
-        current_branch = get_current_branch()
+        branch = self.branch or self.snapshot.branch
         if not self.quiet:
             with show_spinner("Pushing to remote"):
-                success, msg = push(self.branch or current_branch, dry_run=self.dry_run)
+                success, msg = push(branch, dry_run=self.dry_run, snapshot=self.snapshot)
         else:
-            success, msg = push(self.branch or current_branch, dry_run=self.dry_run)
+            success, msg = push(branch, dry_run=self.dry_run, snapshot=self.snapshot)
         
         if success:
             if not self.quiet:
@@ -392,6 +539,9 @@ def run_auto_commit(
     quiet: bool = False,
     log_file: Optional[str] = None,
     theme: str = "hacker",
+    no_cache: bool = False,
+    ai_timeout: Optional[float] = None,
+    offline: bool = False,
 ) -> int:
     """
     Run the auto-commit workflow.
@@ -404,6 +554,9 @@ def run_auto_commit(
         quiet: Suppress non-essential output
         log_file: Path to log file
         theme: UI theme (hacker, minimal, developer)
+        no_cache: Don't reuse or store generated commit messages
+        ai_timeout: Overall time limit for AI generation in seconds
+        offline: Generate the message locally from file statistics, without AI
         
     Returns:
         Exit code (0 for success, 1 for error)
@@ -416,5 +569,8 @@ def run_auto_commit(
         quiet=quiet,
         log_file=log_file,
         theme=theme,
+        no_cache=no_cache,
+        ai_timeout=ai_timeout,
+        offline=offline,
     )
     return workflow.run()
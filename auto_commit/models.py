@@ -0,0 +1,223 @@
+"""Gemini model selection - remembers which models work for an API key and how fast they are."""
+
+import hashlib
+import math
+import os
+import time
+from typing import Optional
+from .logger import get_logger
+from .storage import read_json, update_json
+
+logger = get_logger()
+
+# Try common model names directly (faster than listing)
+# Static order (used until latency samples exist): faster/cheaper models first
+MODEL_NAMES = [
+    'gemini-1.5-flash',
+    'gemini-1.5-flash-latest',
+    'gemini-1.5-pro',
+    'gemini-1.5-pro-latest',
+    'gemini-1.0-pro',
+    'gemini-1.0-pro-latest',
+]
+
+# Relative answer quality, used when ordering by preference
+MODEL_QUALITY = {
+    'gemini-1.5-pro': 3,
+    'gemini-1.5-pro-latest': 3,
+    'gemini-1.5-flash': 2,
+    'gemini-1.5-flash-latest': 2,
+    'gemini-1.0-pro': 1,
+    'gemini-1.0-pro-latest': 1,
+}
+
+MODEL_CACHE_FILE = "models.json"
+MODEL_STATS_FILE = "model_stats.json"
+
+# How long a known-good or unavailable model is trusted (seconds)
+MODEL_CACHE_TTL = 24 * 60 * 60
+
+# Latency statistics: recent samples per model
+STATS_WINDOW = 50
+STATS_MAX_AGE = 3 * 24 * 60 * 60  # seconds
+STATS_MIN_SAMPLES = 3
+DEFAULT_LATENCY = 5.0  # seconds, assumed for models without samples
+
+# Latency vs quality preference (AUTOCOMMIT_MODEL_PREFERENCE):
+# "latency", "balanced", "quality", or a latency weight between 0 and 1
+PREFERENCE_WEIGHTS = {"latency": 1.0, "balanced": 0.5, "quality": 0.0}
+
+
+def api_key_id(api_key: str) -> str:
+    """Hash an API key so it is never written to disk."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _key_entry(data: dict, api_key: str) -> dict:
+    """Get the non-expired entry for an API key (empty if none)."""
+    entry = data.get(api_key_id(api_key))
+    if not isinstance(entry, dict) or time.time() - entry.get("time", 0) > MODEL_CACHE_TTL:
+        return {}
+    return entry
+
+
+def get_model_order(api_key: str) -> list[str]:
+    """
+    Get the models to try for an API key.
+
+    The last model that worked comes first; models known to be unavailable
+    for this key are left out until the cache entry expires.
+
+    Args:
+        api_key: Gemini API key
+
+    Returns:
+        List of model names in the order to try
+    """
+    entry = _key_entry(read_json(MODEL_CACHE_FILE), api_key)
+    known_good = entry.get("model")
+    unavailable = set(entry.get("unavailable", []))
+    available = [name for name in MODEL_NAMES if name not in unavailable]
+    if known_good and known_good not in available:
+        available.insert(0, known_good)
+
+    # Models with enough recent samples (and the known-good one) are ranked
+    # by measured latency and preference; the rest keep the static order
+    stats = get_model_stats()
+    ranked = [
+        name for name in available
+        if name == known_good or stats.get(name, {}).get("count", 0) >= STATS_MIN_SAMPLES
+    ]
+    weight = get_latency_weight()
+    ranked.sort(key=lambda name: _model_cost(name, stats.get(name), weight))
+    order = ranked + [name for name in available if name not in ranked]
+    if known_good:
+        logger.debug(f"Using cached model: {known_good}")
+    logger.debug(f"Model order: {', '.join(order)}")
+    return order
+
+
+def get_latency_weight() -> float:
+    """Get the latency weight (0 = quality only, 1 = latency only) from config."""
+    preference = os.getenv("AUTOCOMMIT_MODEL_PREFERENCE", "latency").strip().lower()
+    if preference in PREFERENCE_WEIGHTS:
+        return PREFERENCE_WEIGHTS[preference]
+    try:
+        return min(1.0, max(0.0, float(preference)))
+    except ValueError:
+        logger.warning(f"Unknown AUTOCOMMIT_MODEL_PREFERENCE: {preference}, using latency")
+        return 1.0
+
+
+def _model_cost(name: str, stats: Optional[dict], weight: float) -> float:
+    """Cost of trying a model first (lower is better)."""
+    if stats and stats.get("count"):
+        # Expected latency sits between p50 and p95; errors make a model
+        # cost a retry on the next one
+        expected = stats["p50"] + 0.5 * (stats["p95"] - stats["p50"])
+        expected /= max(0.05, 1.0 - stats["error_rate"])
+    else:
+        expected = DEFAULT_LATENCY
+    latency_cost = min(expected / (2 * DEFAULT_LATENCY), 1.0)
+    quality_cost = 1.0 - MODEL_QUALITY.get(name, 1) / max(MODEL_QUALITY.values())
+    return weight * latency_cost + (1.0 - weight) * quality_cost
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def get_model_stats() -> dict[str, dict]:
+    """
+    Summarize recent latency samples per model.
+
+    Returns:
+        Dict of model name to {"count", "p50", "p95", "error_rate"}; latency
+        percentiles only cover successful requests
+    """
+    now = time.time()
+    summary = {}
+    for name, samples in read_json(MODEL_STATS_FILE).items():
+        recent = [s for s in samples if now - s[0] <= STATS_MAX_AGE]
+        if not recent:
+            continue
+        latencies = [s[1] for s in recent if s[2]]
+        summary[name] = {
+            "count": len(recent),
+            "p50": _percentile(latencies, 0.5) if latencies else DEFAULT_LATENCY,
+            "p95": _percentile(latencies, 0.95) if latencies else DEFAULT_LATENCY,
+            "error_rate": 1.0 - len(latencies) / len(recent),
+        }
+    return summary
+
+
+def record_model_latency(model_name: str, latency: float, success: bool) -> None:
+    """
+    Record the outcome of one request to a model.
+
+    Args:
+        model_name: Model that was called
+        latency: Wall time of the request (seconds)
+        success: Whether the request produced a response
+    """
+    now = time.time()
+    try:
+        with update_json(MODEL_STATS_FILE) as data:
+            samples = data.get(model_name, [])
+            samples.append([now, round(latency, 3), success])
+            data[model_name] = [s for s in samples if now - s[0] <= STATS_MAX_AGE][-STATS_WINDOW:]
+    except OSError as e:
+        logger.debug(f"Could not write model stats: {str(e)}")
+
+
+def _update(api_key: str, update) -> None:
+    """Apply update(entry) to the cache entry of an API key."""
+    try:
+        with update_json(MODEL_CACHE_FILE) as data:
+            entry = _key_entry(data, api_key)
+            update(entry)
+            entry["time"] = entry.get("time") or time.time()
+            data[api_key_id(api_key)] = entry
+    except OSError as e:
+        logger.debug(f"Could not write model cache: {str(e)}")
+
+
+def record_model_success(api_key: str, model_name: str) -> None:
+    """Remember the model that answered for an API key."""
+    entry = _key_entry(read_json(MODEL_CACHE_FILE), api_key)
+    if entry.get("model") == model_name:
+        return
+
+    def update(entry: dict) -> None:
+        entry["model"] = model_name
+        entry["time"] = time.time()
+        entry["unavailable"] = [m for m in entry.get("unavailable", []) if m != model_name]
+
+    _update(api_key, update)
+
+
+def record_model_unavailable(api_key: str, model_name: str) -> None:
+    """Remember that a model does not exist for an API key."""
+    def update(entry: dict) -> None:
+        unavailable = entry.setdefault("unavailable", [])
+        if model_name not in unavailable:
+            unavailable.append(model_name)
+        if entry.get("model") == model_name:
+            entry.pop("model")
+
+    _update(api_key, update)
+
+
+def record_model_failure(api_key: str, model_name: str) -> None:
+    """Forget the known-good model after it failed, so the next run rediscovers."""
+    entry = _key_entry(read_json(MODEL_CACHE_FILE), api_key)
+    if entry.get("model") != model_name:
+        return
+
+    def update(entry: dict) -> None:
+        entry.pop("model", None)
+
+    _update(api_key, update)
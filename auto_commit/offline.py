@@ -0,0 +1,134 @@
+"""Deterministic commit message generation from staged file statistics (no network)."""
+
+import os
+import posixpath
+from typing import Optional
+from .git_ops import get_staged_changes
+
+# Conventional-commit subjects are kept short
+MAX_SUBJECT_LENGTH = 72
+
+TEST_DIRS = {"test", "tests", "__tests__", "spec", "specs", "testing"}
+DOC_DIRS = {"doc", "docs", "documentation"}
+DOC_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+DOC_NAMES = {"readme", "changelog", "license", "contributing", "authors", "notice"}
+CI_DIRS = (".github/workflows/", ".circleci/", ".gitlab/", ".buildkite/")
+CI_NAMES = {
+    ".gitlab-ci.yml", ".travis.yml", "jenkinsfile", "azure-pipelines.yml",
+    "appveyor.yml", "bitbucket-pipelines.yml", ".pre-commit-config.yaml",
+}
+DEPENDENCY_NAMES = {
+    "requirements.txt", "requirements-dev.txt", "pipfile", "pipfile.lock", "poetry.lock",
+    "pyproject.toml", "setup.py", "setup.cfg", "package.json", "package-lock.json",
+    "yarn.lock", "pnpm-lock.yaml", "go.mod", "go.sum", "cargo.toml", "cargo.lock",
+    "gemfile", "gemfile.lock", "composer.json", "composer.lock", "pom.xml", "build.gradle",
+}
+
+# Scope names that say nothing about the change
+GENERIC_SCOPES = {"src", "lib", "app", "source", "pkg"}
+
+
+def _category(path: str) -> Optional[str]:
+    """Get the commit type a path implies on its own (None for regular source)."""
+    lower = path.lower()
+    name = posixpath.basename(lower)
+    stem, extension = os.path.splitext(name)
+    parts = lower.split("/")
+
+    if lower.startswith(CI_DIRS) or name in CI_NAMES:
+        return "ci"
+    if name in DEPENDENCY_NAMES or (name.startswith("requirements") and extension == ".txt"):
+        return "build"
+    if (
+        any(part in TEST_DIRS for part in parts[:-1])
+        or stem.startswith("test_") or stem.endswith(("_test", ".test", ".spec", "_spec"))
+        or name == "conftest.py"
+    ):
+        return "test"
+    if any(part in DOC_DIRS for part in parts[:-1]) or extension in DOC_EXTENSIONS or stem in DOC_NAMES:
+        return "docs"
+    return None
+
+
+def _commit_type(changes: list) -> str:
+    """Infer the conventional-commit type from paths and line counts."""
+    categories = {_category(path) for _, path, _, _ in changes}
+    if len(categories) == 1 and None not in categories:
+        return categories.pop()
+
+    # Source changes: judge by what happened to the source files only
+    source = [c for c in changes if _category(c[1]) is None] or changes
+    if any(status == "A" for status, _, _, _ in source):
+        return "feat"
+    added = sum(c[2] for c in source)
+    deleted = sum(c[3] for c in source)
+    if all(status in ("D", "R") for status, _, _, _ in source) or deleted > 2 * added:
+        return "refactor"
+    if added >= 3 * max(deleted, 1):
+        return "feat"
+    return "fix" if added + deleted <= 10 else "chore"
+
+
+def _scope(changes: list, commit_type: str) -> str:
+    """Get the scope from the deepest directory shared by all changed files."""
+    if commit_type == "build":
+        return "deps"
+    if commit_type == "ci":
+        return ""  # CI directories (.github/workflows, ...) make poor scopes
+    directories = [posixpath.dirname(path) for _, path, _, _ in changes]
+    common = posixpath.commonpath(directories) if all(directories) else ""
+    for part in reversed(common.split("/")):
+        if part and part.lower() not in GENERIC_SCOPES | TEST_DIRS | DOC_DIRS:
+            return part
+    return ""
+
+
+def _verb(changes: list) -> str:
+    """Pick the verb from the mix of added, modified and deleted files."""
+    statuses = [status for status, _, _, _ in changes]
+    total = len(statuses)
+    if statuses.count("A") == total:
+        return "add"
+    if statuses.count("D") == total:
+        return "remove"
+    if statuses.count("R") == total:
+        return "rename"
+    added = sum(c[2] for c in changes)
+    deleted = sum(c[3] for c in changes)
+    if statuses.count("D") > total / 2 or (deleted > 3 * max(added, 1) and "A" not in statuses):
+        return "clean up"
+    return "update"
+
+
+def generate_offline_message(changes: Optional[list] = None) -> Optional[str]:
+    """
+    Build a conventional-commit subject from staged file statistics.
+
+    Type comes from the paths (tests, docs, CI, dependencies) or, for source
+    files, from the add/delete ratio; scope from the common directory; the
+    verb from how many files were added, modified or deleted.
+
+    Args:
+        changes: (status, path, added, deleted) tuples (defaults to the
+            staged changes from git)
+
+    Returns:
+        Commit message, or None if nothing is staged
+    """
+    if changes is None:
+        changes = get_staged_changes()
+    if not changes:
+        return None
+
+    commit_type = _commit_type(changes)
+    scope = _scope(changes, commit_type)
+    verb = _verb(changes)
+
+    names = [posixpath.basename(path) for _, path, _, _ in changes]
+    target = ", ".join(names) if len(names) <= 3 else f"{len(names)} files"
+
+    prefix = f"{commit_type}({scope})" if scope else commit_type
+    message = f"{prefix}: {verb} {target}"
+    if len(message) > MAX_SUBJECT_LENGTH:
+        message = f"{prefix}: {verb} {len(changes)} files"
+    return message
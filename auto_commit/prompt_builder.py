@@ -0,0 +1,408 @@
+"""Prompt building - parse staged diffs and pack the most informative hunks into a token budget."""
+
+import codecs
+import os
+import re
+from typing import Optional
+from .logger import get_logger
+from .tokens import estimate_tokens, truncate_to_tokens
+
+logger = get_logger()
+
+# Fixed instructions, sent as the model's system instruction rather than in
+# every prompt: identical across requests, so providers can cache them
+SYSTEM_INSTRUCTION = """You write git commit messages and change summaries from staged diffs.
+
+Diffs use a compact format: "### path" starts a file, followed by its status in parentheses \
+if it is new, deleted, binary or renamed; "@@ context" starts a hunk, with the enclosing \
+function or class as context when known; then every line starts with "+" (added), \
+"-" (removed) or " " (unchanged).
+
+Commit messages:
+- Are clear and descriptive
+- Follow conventional commit format if applicable
+- Have a subject line of at most 72 characters
+- Contain no explanations or meta-commentary, just the commit message itself"""
+
+# Header lines that carry no information for a commit message
+REDUNDANT_HEADER_PREFIXES = (
+    'index ',
+    'old mode ',
+    'new mode ',
+    'similarity index ',
+    'dissimilarity index ',
+    '--- ',
+    '+++ ',
+)
+
+# Files that change a lot but say little about intent
+LOCKFILE_NAMES = {
+    'package-lock.json',
+    'npm-shrinkwrap.json',
+    'yarn.lock',
+    'pnpm-lock.yaml',
+    'poetry.lock',
+    'Pipfile.lock',
+    'Cargo.lock',
+    'Gemfile.lock',
+    'composer.lock',
+    'go.sum',
+    'uv.lock',
+}
+
+GENERATED_DIRS = ('vendor/', 'node_modules/', 'dist/', 'build/', 'third_party/', '__pycache__/')
+
+SOURCE_EXTENSIONS = {
+    '.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.rs', '.java', '.kt', '.c', '.h',
+    '.cc', '.cpp', '.hpp', '.cs', '.rb', '.php', '.swift', '.scala', '.sh', '.sql',
+    '.vue', '.svelte', '.dart', '.lua', '.ex', '.exs',
+}
+
+DOC_EXTENSIONS = {'.md', '.rst', '.txt', '.adoc'}
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -\S+ \+\S+ @@ ?(.*)$')
+HUNK_RANGE_PATTERN = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+# Added lines that introduce a new symbol are the best signal of intent
+SYMBOL_PATTERN = re.compile(
+    r'^\+\s*(?:export\s+|public\s+|private\s+|protected\s+|static\s+|async\s+|pub\s+)*'
+    r'(?:def|class|function|func|fn|interface|struct|enum|trait|type|const|let|var|impl|module)\b'
+)
+
+
+class Hunk:
+    """A single `@@` hunk of a file diff."""
+
+    def __init__(self, header: str):
+        self.header = header
+        self.lines: list[str] = []
+
+    def text(self, compact: bool = False) -> str:
+        """
+        Return the hunk as diff text.
+
+        Args:
+            compact: Replace the line-number marker with "@@ context"
+        """
+        header = self.header
+        if compact:
+            match = HUNK_HEADER_PATTERN.match(header)
+            if match:
+                header = f"@@ {match.group(1)}".rstrip()
+        return '\n'.join([header] + self.lines)
+
+    def complete(self) -> bool:
+        """Check whether every line the header announces is present (the diff wasn't cut inside it)."""
+        match = HUNK_RANGE_PATTERN.match(self.header)
+        if not match:
+            return True
+        old_count = int(match.group(1) or 1)
+        new_count = int(match.group(2) or 1)
+        old_seen = sum(1 for line in self.lines if line[:1] in (' ', '-'))
+        new_seen = sum(1 for line in self.lines if line[:1] in (' ', '+'))
+        return old_seen >= old_count and new_seen >= new_count
+
+    def score(self, tokens: Optional[int] = None) -> float:
+        """
+        Score how much the hunk says about the change.
+
+        Args:
+            tokens: The hunk's estimated size, if already known
+        """
+        added = [line[1:] for line in self.lines if line.startswith('+')]
+        removed = [line[1:] for line in self.lines if line.startswith('-')]
+        if not added and not removed:
+            return 0.0
+
+        # Whitespace-only changes: same content once whitespace is ignored
+        if sorted(''.join(l.split()) for l in added) == sorted(''.join(l.split()) for l in removed):
+            return 0.1
+
+        score = float(len(added) + len(removed))
+        score += 5.0 * sum(1 for line in self.lines if SYMBOL_PATTERN.match(line))
+        # Prefer dense hunks over long mechanical ones
+        if tokens is None:
+            tokens = estimate_tokens(self.text())
+        return score / (1.0 + tokens / 200.0)
+
+
+class FileDiff:
+    """All hunks of one file in a diff."""
+
+    def __init__(self, header: str):
+        self.header = header
+        self.path = _path_from_header(header)
+        self.meta: list[str] = []
+        self.hunks: list[Hunk] = []
+
+    def header_text(self, compact: bool = False) -> str:
+        """
+        Return the file header.
+
+        Args:
+            compact: Encode the header as "### path (status)" instead of git's
+                diff --git, mode and rename lines
+        """
+        if not compact:
+            return '\n'.join([self.header] + self.meta)
+
+        status = []
+        other = []
+        for line in self.meta:
+            if line.startswith('new file mode'):
+                status.append('new')
+            elif line.startswith('deleted file mode'):
+                status.append('deleted')
+            elif line.startswith('rename from '):
+                status.append(f"renamed from {line[len('rename from '):]}")
+            elif line.startswith('copy from '):
+                status.append(f"copied from {line[len('copy from '):]}")
+            elif line.startswith('Binary files'):
+                status.append('binary')
+            elif not line.startswith(('rename to ', 'copy to ')):
+                other.append(line)
+        header = f"### {self.path}" + (f" ({', '.join(status)})" if status else "")
+        return '\n'.join([header] + other)
+
+    def complete(self) -> bool:
+        """Check whether none of the file's hunks was cut off."""
+        return all(hunk.complete() for hunk in self.hunks)
+
+    def weight(self) -> float:
+        """Weight hunks of this file by how informative the file type is."""
+        name = os.path.basename(self.path)
+        ext = os.path.splitext(name)[1].lower()
+        if name in LOCKFILE_NAMES or name.endswith('.lock'):
+            return 0.05
+        if name.endswith(('.min.js', '.min.css', '.map')) or any(
+            self.path.startswith(d) or f'/{d}' in self.path for d in GENERATED_DIRS
+        ):
+            return 0.1
+        if any(line.startswith('Binary files') for line in self.meta):
+            return 0.1
+        if ext in SOURCE_EXTENSIONS:
+            return 1.0
+        if ext in DOC_EXTENSIONS:
+            return 0.6
+        return 0.5
+
+
+def _path_from_header(header: str) -> str:
+    """Extract the new path from a `diff --git a/... b/...` line."""
+    quoted = header.rfind(' "b/')
+    if header.endswith('"') and quoted > 0:
+        # Paths with special characters are C-quoted, non-ASCII bytes as octal escapes
+        return _unquote_path(header[quoted + 4:-1])
+    match = re.match(r'^diff --git "?a/(.*?)"? "?b/(.*?)"?$', header)
+    if match:
+        return match.group(2)
+    return header[len('diff --git '):]
+
+
+def _unquote_path(path: str) -> str:
+    """Decode the escapes of a C-quoted path (as git prints it without -z)."""
+    try:
+        return codecs.escape_decode(path.encode('ascii', 'backslashreplace'))[0].decode('utf-8')
+    except (UnicodeDecodeError, ValueError):
+        return path
+
+
+def diff_paths(diff_text: str) -> set[str]:
+    """Get the (new) paths of the files in diff text, without parsing hunks."""
+    return {
+        _path_from_header(line) for line in diff_text.split('\n') if line.startswith('diff --git ')
+    }
+
+
+def parse_diff(diff_text: str) -> list[FileDiff]:
+    """
+    Parse unified diff text into files and hunks.
+
+    Redundant header lines (index, mode changes, ---/+++ paths) are dropped.
+
+    Args:
+        diff_text: Output of `git diff`
+
+    Returns:
+        List of FileDiff objects in diff order
+    """
+    files: list[FileDiff] = []
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+
+    for line in diff_text.split('\n'):
+        if line.startswith('diff --git '):
+            current = FileDiff(line)
+            files.append(current)
+            hunk = None
+        elif current is None:
+            continue
+        elif line.startswith('@@'):
+            hunk = Hunk(line)
+            current.hunks.append(hunk)
+        elif hunk is not None:
+            hunk.lines.append(line)
+        elif not line.startswith(REDUNDANT_HEADER_PREFIXES):
+            current.meta.append(line)
+
+    return files
+
+
+def render_files(files: list[FileDiff], selected: Optional[set] = None, compact: bool = False) -> str:
+    """
+    Render parsed files back to diff text.
+
+    Args:
+        files: Parsed files
+        selected: Optional set of (file index, hunk index) pairs to include;
+            files without selected hunks are skipped
+        compact: Use the compact prompt encoding (not parseable by parse_diff)
+
+    Returns:
+        Diff text
+    """
+    parts = []
+    for i, file_diff in enumerate(files):
+        hunks = [
+            hunk for j, hunk in enumerate(file_diff.hunks)
+            if selected is None or (i, j) in selected
+        ]
+        if selected is not None and not hunks and (i, -1) not in selected:
+            continue
+        parts.append(file_diff.header_text(compact))
+        parts.extend(hunk.text(compact) for hunk in hunks)
+    return '\n'.join(parts)
+
+
+def build_diff_prompt(diff_text: str, max_tokens: int, also_changed: Optional[list[str]] = None) -> str:
+    """
+    Build a compact diff that fits into the prompt token budget.
+
+    The result uses the compact encoding (see SYSTEM_INSTRUCTION). Hunks are
+    ranked by informativeness (source over lockfiles, new symbols over
+    whitespace churn) and packed greedily until the budget is full. Files
+    that did not make it are listed by name at the end.
+
+    Args:
+        diff_text: The staged diff
+        max_tokens: Token budget for the diff part of the prompt (estimate_tokens units)
+        also_changed: Optional paths of changed files missing from diff_text,
+            listed with the files that did not make it
+
+    Returns:
+        Diff text for the prompt
+    """
+    files = parse_diff(diff_text)
+    if not files:
+        # Not a git diff we understand, fall back to a plain cut
+        return truncate_to_tokens(diff_text, max_tokens)
+
+    # Every part is estimated once: the estimate of parts joined by line
+    # breaks is their sum plus the line breaks, so a huge diff isn't
+    # estimated again as a whole
+    header_costs = [estimate_tokens(file_diff.header_text(True)) for file_diff in files]
+    hunk_costs = [[estimate_tokens(hunk.text(True)) for hunk in file_diff.hunks] for file_diff in files]
+    parts = sum(1 + len(costs) for costs in hunk_costs)
+    full_cost = sum(header_costs) + sum(map(sum, hunk_costs)) + parts - 1
+    if full_cost <= max_tokens and not also_changed:
+        compact = render_files(files, compact=True)
+        _log_savings(render_files(files), compact)
+        return compact
+
+    candidates = []
+    for i, file_diff in enumerate(files):
+        weight = file_diff.weight()
+        if not file_diff.hunks:
+            # Header-only entries (binary files, pure renames)
+            candidates.append((0.5 * weight, i, -1, header_costs[i]))
+        for j, hunk in enumerate(file_diff.hunks):
+            candidates.append((hunk.score(hunk_costs[i][j]) * weight, i, j, hunk_costs[i][j]))
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+
+    selected = set()
+    headers_used = set()
+    used = 0
+    for _, i, j, cost in candidates:
+        if i not in headers_used:
+            cost += header_costs[i]
+        if used + cost > max_tokens:
+            continue
+        selected.add((i, j))
+        headers_used.add(i)
+        used += cost
+
+    if not selected:
+        # Not even one hunk fits - keep the head of the best one
+        _, i, j, _ = candidates[0]
+        head = files[i].header_text(True)
+        if j >= 0:
+            head += '\n' + files[i].hunks[j].text(True)
+        return truncate_to_tokens(head, max_tokens)
+
+    result = render_files(files, selected, compact=True)
+    _log_savings(render_files(files, selected), result)
+    omitted = [files[i].path for i in range(len(files)) if i not in headers_used] + (also_changed or [])
+    if omitted:
+        note = f"\n\n... (diff reduced; also changed: {', '.join(omitted)})"
+        if estimate_tokens(note) > max_tokens - used:
+            note = f"\n\n... (diff reduced; {len(omitted)} more file(s) changed)"
+        result += note
+
+    logger.debug(
+        f"Packed {len(selected)}/{len(candidates)} hunks into ~{used} tokens "
+        f"(full diff ~{full_cost} tokens)"
+    )
+    return result
+
+
+def _log_savings(verbose: str, compact: str) -> None:
+    """Report the tokens the compact encoding saved over git's own format."""
+    verbose_tokens = estimate_tokens(verbose)
+    compact_tokens = estimate_tokens(compact)
+    saved = verbose_tokens - compact_tokens
+    logger.debug(
+        f"Prompt diff: ~{compact_tokens} tokens, compact headers saved ~{saved} "
+        f"({saved / max(verbose_tokens, 1):.0%})"
+    )
+
+
+def split_diff(diff_text: str, max_tokens: int, max_chunks: int) -> list[str]:
+    """
+    Split a diff into per-directory chunks for map-reduce summarization.
+
+    Files are grouped by their top-level directory; groups that exceed the
+    budget are split per file, and every chunk is packed with
+    build_diff_prompt so oversized files still fit. When there are more
+    chunks than ``max_chunks``, the smallest groups are merged.
+
+    Args:
+        diff_text: The staged diff
+        max_tokens: Token budget per chunk
+        max_chunks: Maximum number of chunks
+
+    Returns:
+        List of diff texts
+    """
+    files = parse_diff(diff_text)
+    if not files:
+        return [build_diff_prompt(diff_text, max_tokens)]
+
+    groups: dict[str, list[FileDiff]] = {}
+    for file_diff in files:
+        top = file_diff.path.split('/', 1)[0] if '/' in file_diff.path else '.'
+        groups.setdefault(top, []).append(file_diff)
+
+    chunks: list[list[FileDiff]] = []
+    for group in groups.values():
+        if estimate_tokens(render_files(group)) <= max_tokens:
+            chunks.append(group)
+        else:
+            chunks.extend([file_diff] for file_diff in group)
+
+    # Rank chunks by how much they change, and fold the tail into one chunk
+    chunks.sort(key=lambda chunk: -sum(len(h.lines) for f in chunk for h in f.hunks))
+    if len(chunks) > max_chunks:
+        rest = [file_diff for chunk in chunks[max_chunks - 1:] for file_diff in chunk]
+        chunks = chunks[:max_chunks - 1] + [rest]
+
+    return [build_diff_prompt(render_files(chunk), max_tokens) for chunk in chunks]
@@ -0,0 +1,326 @@
+"""Pluggable generation backends and provider selection."""
+
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from .circuit import record_failure, record_success
+from .deadline import Deadline, DeadlineExceeded, call_with_timeout
+from .logger import get_logger
+from .prompt_builder import SYSTEM_INSTRUCTION
+from .ratelimit import RateLimited, retry_after_hint
+from .storage import read_json, update_json
+from .tokens import record_size_error, record_token_count, size_error
+
+logger = get_logger()
+
+# Provider choice (AUTOCOMMIT_PROVIDER): "gemini", "http", or "auto" for the
+# fastest healthy configured provider
+DEFAULT_PROVIDER = "gemini"
+
+# OpenAI-compatible chat-completions server (Ollama, llama.cpp, vLLM, LM Studio, ...)
+HTTP_BASE_URL = os.getenv("AUTOCOMMIT_HTTP_URL", "")  # e.g. http://localhost:11434/v1
+HTTP_MODEL = os.getenv("AUTOCOMMIT_HTTP_MODEL", "llama3.1")
+HTTP_API_KEY = os.getenv("AUTOCOMMIT_HTTP_API_KEY", "")
+HTTP_TIMEOUT = 30  # seconds per request
+# Context window assumed for the HTTP model until a size error says otherwise
+try:
+    HTTP_CONTEXT_TOKENS = int(os.getenv("AUTOCOMMIT_HTTP_CONTEXT", "8192"))
+except ValueError:
+    HTTP_CONTEXT_TOKENS = 8192
+
+# Automatic selection: health check timeout and how long the pick is reused
+PROVIDER_CACHE_FILE = "providers.json"
+HEALTH_TIMEOUT = 3.0  # seconds
+SELECTION_TTL = 10 * 60  # seconds
+
+_PROVIDERS: dict[str, Callable[[], "Provider"]] = {}
+
+
+class Provider:
+    """
+    A backend that turns prompts into text.
+
+    Subclasses implement configured(), ping() and request().
+    """
+
+    name = ""
+
+    def configured(self) -> bool:
+        """Whether the provider has the settings it needs."""
+        raise NotImplementedError
+
+    @property
+    def circuit_key(self) -> str:
+        """Identity used by the circuit breaker for this backend."""
+        return self.name
+
+    @property
+    def token_model(self) -> str:
+        """Model that prompts will most likely go to (token calibration key)."""
+        return self.name
+
+    @property
+    def input_token_limit(self) -> Optional[int]:
+        """Input limit to assume while the model's is unknown (None: no limit)."""
+        return None
+
+    def ping(self, timeout: float) -> None:
+        """
+        Check that the backend answers.
+
+        Raises:
+            Exception: If it is unreachable or unhealthy
+        """
+        raise NotImplementedError
+
+    def request(
+        self,
+        prompt: str,
+        max_output_tokens: int,
+        deadline: Deadline,
+        first_line: bool = False,
+        on_partial: Optional[Callable[[str], None]] = None,
+        candidate_count: int = 1,
+    ) -> list[str]:
+        """
+        Send a prompt and return the text of every usable candidate.
+
+        Args:
+            prompt: Prompt to send
+            max_output_tokens: Maximum number of tokens to generate
+            deadline: Overall time budget
+            first_line: Only the first line is needed: stream and stop early
+            on_partial: Optional callback receiving the streamed first line so far
+            candidate_count: Number of candidates to ask for
+
+        Returns:
+            Candidate texts (at least one)
+        """
+        raise NotImplementedError
+
+
+def register_provider(name: str, factory: Callable[[], Provider]) -> None:
+    """Make a provider available under a name."""
+    _PROVIDERS[name] = factory
+
+
+def get_provider(name: Optional[str] = None) -> Provider:
+    """
+    Get the provider to generate with.
+
+    Args:
+        name: Provider name (defaults to AUTOCOMMIT_PROVIDER, then "gemini");
+            "auto" picks the fastest healthy configured provider
+
+    Returns:
+        Provider instance
+    """
+    name = (name or os.getenv("AUTOCOMMIT_PROVIDER", DEFAULT_PROVIDER)).strip().lower()
+    if name == "auto":
+        return select_fastest_provider()
+    if name not in _PROVIDERS:
+        logger.warning(f"Unknown AUTOCOMMIT_PROVIDER: {name}, using {DEFAULT_PROVIDER}")
+        name = DEFAULT_PROVIDER
+    return _PROVIDERS[name]()
+
+
+def select_fastest_provider() -> Provider:
+    """
+    Pick the configured provider that answers a health check fastest.
+
+    The pick is cached for SELECTION_TTL; providers are pinged concurrently.
+    Falls back to the default provider if none is healthy.
+    """
+    candidates = {name: factory() for name, factory in _PROVIDERS.items()}
+    candidates = {name: p for name, p in candidates.items() if p.configured()}
+
+    cached = read_json(PROVIDER_CACHE_FILE)
+    if cached.get("provider") in candidates and time.time() - cached.get("time", 0) <= SELECTION_TTL:
+        return candidates[cached["provider"]]
+
+    def measure(provider: Provider) -> Optional[float]:
+        started = time.monotonic()
+        try:
+            call_with_timeout(provider.ping, HEALTH_TIMEOUT, HEALTH_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Provider {provider.name} unhealthy: {str(e)[:100]}")
+            return None
+        return time.monotonic() - started
+
+    latencies = {}
+    if candidates:
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            latencies = dict(zip(candidates, executor.map(measure, candidates.values())))
+    healthy = {name: latency for name, latency in latencies.items() if latency is not None}
+    if not healthy:
+        logger.warning(f"No healthy provider found, using {DEFAULT_PROVIDER}")
+        return _PROVIDERS[DEFAULT_PROVIDER]()
+
+    name = min(healthy, key=healthy.get)
+    logger.info(f"Selected provider {name} ({healthy[name] * 1000:.0f}ms health check)")
+    try:
+        with update_json(PROVIDER_CACHE_FILE) as data:
+            data.update({"provider": name, "time": time.time(), "latencies": healthy})
+    except OSError as e:
+        logger.debug(f"Could not write provider cache: {str(e)}")
+    return candidates[name]
+
+
+class HttpChatProvider(Provider):
+    """OpenAI-compatible chat-completions server, e.g. Ollama on localhost or the LAN."""
+
+    name = "http"
+
+    def __init__(self, base_url: str = "", model: str = "", api_key: str = ""):
+        """
+        Initialize provider.
+
+        Args:
+            base_url: API base URL up to /v1 (defaults to AUTOCOMMIT_HTTP_URL)
+            model: Model name (defaults to AUTOCOMMIT_HTTP_MODEL)
+            api_key: Optional bearer token (defaults to AUTOCOMMIT_HTTP_API_KEY)
+        """
+        self.base_url = (base_url or HTTP_BASE_URL).rstrip("/")
+        self.model = model or HTTP_MODEL
+        self.api_key = api_key or HTTP_API_KEY
+
+    def configured(self) -> bool:
+        return bool(self.base_url)
+
+    @property
+    def circuit_key(self) -> str:
+        return f"http:{self.base_url}"
+
+    @property
+    def token_model(self) -> str:
+        return self.model
+
+    @property
+    def input_token_limit(self) -> Optional[int]:
+        return HTTP_CONTEXT_TOKENS
+
+    def ping(self, timeout: float) -> None:
+        with urllib.request.urlopen(self._request("/models"), timeout=timeout) as response:
+            response.read()
+
+    def request(
+        self,
+        prompt: str,
+        max_output_tokens: int,
+        deadline: Deadline,
+        first_line: bool = False,
+        on_partial: Optional[Callable[[str], None]] = None,
+        candidate_count: int = 1,
+    ) -> list[str]:
+        if not self.configured():
+            raise ValueError("AUTOCOMMIT_HTTP_URL is not set (e.g. http://localhost:11434/v1)")
+
+        body = {
+            "model": self.model,
+            "messages": [
+                # Same leading system message every time, so servers with prefix caching reuse it
+                {"role": "system", "content": SYSTEM_INSTRUCTION},
+                {"role": "user", "content": prompt},
+            ],
+            "max_tokens": max_output_tokens,
+            "temperature": 0.7,
+            "stream": first_line,
+        }
+        if candidate_count > 1:
+            body["n"] = candidate_count  # Servers that ignore n return one choice
+
+        timeout = deadline.timeout(HTTP_TIMEOUT)
+        logger.ai_request(f"{self.model} @ {self.base_url}", len(prompt))
+        try:
+            texts = call_with_timeout(
+                self._send, timeout, body, timeout, on_partial, candidate_count, deadline=deadline,
+            )
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", errors="replace")[:500]
+            too_large = size_error(Exception(detail)) if e.code in (400, 413) else None
+            if too_large:
+                record_size_error(self.model, f"{SYSTEM_INSTRUCTION}\n\n{prompt}", too_large)
+                raise too_large
+            detail = detail[:200]
+            if e.code == 429:
+                raise RateLimited(f"HTTP provider rate limited: {detail}", retry_after_hint(e))
+            if e.code >= 500:
+                record_failure(self.circuit_key, deadline)
+            raise Exception(f"HTTP provider error {e.code} from {self.base_url}: {detail}")
+        except DeadlineExceeded:
+            raise
+        except TimeoutError:
+            # The wait was capped by the overall deadline: out of time, not an outage
+            if deadline.expired():
+                raise deadline.exceeded()
+            record_failure(self.circuit_key, deadline)
+            raise TimeoutError(f"HTTP provider at {self.base_url} timed out after {timeout:g} seconds")
+        except (urllib.error.URLError, OSError) as e:
+            # Connection refused, DNS failure, socket timeout on connect
+            if deadline.expired():
+                raise deadline.exceeded()
+            record_failure(self.circuit_key, deadline)
+            reason = getattr(e, "reason", e)
+            raise Exception(f"HTTP provider unreachable at {self.base_url}: {reason}")
+
+        record_success(self.circuit_key)
+        texts = [text.strip() for text in texts if text.strip()]
+        if not texts:
+            raise Exception(f"HTTP provider at {self.base_url} returned an empty response")
+        return texts
+
+    def _request(self, path: str, body: Optional[dict] = None) -> urllib.request.Request:
+        """Build a request to an API path."""
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        return urllib.request.Request(self.base_url + path, data=data, headers=headers)
+
+    def _send(
+        self,
+        body: dict,
+        timeout: float,
+        on_partial: Optional[Callable[[str], None]],
+        candidate_count: int,
+    ) -> list[str]:
+        """POST a chat completion and collect the text per choice."""
+        with urllib.request.urlopen(self._request("/chat/completions", body), timeout=timeout) as response:
+            if not body["stream"]:
+                result = json.loads(response.read().decode("utf-8"))
+                usage = result.get("usage") or {}
+                if usage.get("prompt_tokens"):
+                    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                    logger.debug(f"HTTP provider usage: {usage['prompt_tokens']} prompt token(s), {cached} cached")
+                    counted = "\n\n".join(message["content"] for message in body["messages"])
+                    record_token_count(self.model, counted, usage["prompt_tokens"])
+                choices = sorted(result.get("choices", []), key=lambda c: c.get("index", 0))
+                return [(c.get("message") or {}).get("content") or "" for c in choices]
+
+            # Server-sent events: "data: {json}" lines, ending with "data: [DONE]"
+            texts: dict[int, str] = {}
+            for raw in response:
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    index = choice.get("index", 0)
+                    delta = (choice.get("delta") or {}).get("content") or ""
+                    texts[index] = texts.get(index, "") + delta
+
+                first = texts.get(min(texts), "").lstrip() if texts else ""
+                if on_partial and first:
+                    on_partial(first.split("\n", 1)[0].strip())
+                if len(texts) >= candidate_count and all("\n" in t.lstrip() for t in texts.values()):
+                    break  # Subject lines complete; closing the response abandons the stream
+            return [texts[i] for i in sorted(texts)]
+
+
+register_provider(HttpChatProvider.name, HttpChatProvider)
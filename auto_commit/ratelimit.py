@@ -0,0 +1,163 @@
+"""Client-side rate limiting for the (often shared) Gemini API key."""
+
+import os
+import random
+import re
+import time
+from typing import Optional
+from .deadline import Deadline
+from .logger import get_logger
+from .models import api_key_id
+from .storage import update_json
+
+logger = get_logger()
+
+RATE_LIMIT_FILE = "ratelimit.json"
+
+# Token bucket shared by every process using the same key
+# AUTOCOMMIT_RATE_LIMIT is in requests per minute (0 disables the limiter).
+# By default only the shared built-in key is limited; setting it explicitly
+# limits the user's own key too.
+RATE_LIMIT_EXPLICIT = bool(os.getenv("AUTOCOMMIT_RATE_LIMIT"))
+try:
+    RATE_LIMIT_RPM = float(os.getenv("AUTOCOMMIT_RATE_LIMIT", "15"))
+except ValueError:
+    RATE_LIMIT_RPM = 15.0
+RATE_LIMIT_BURST = 5
+
+# Retries of the same model after a quota error
+QUOTA_RETRIES = 3
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 30.0  # seconds
+
+QUOTA_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit", "too many requests")
+
+
+class RateLimited(Exception):
+    """Raised when the API quota stays exhausted after retrying."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Check whether an API error means the key's quota is exhausted."""
+    if isinstance(error, RateLimited) or getattr(error, "code", None) == 429:
+        return True
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in QUOTA_MARKERS)
+
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    """
+    Extract the server's retry hint from an API error, if any.
+
+    Understands HTTP Retry-After headers, gRPC RetryInfo (retry_delay) and
+    the "Please retry in 12.3s" wording used in Gemini error messages.
+
+    Returns:
+        Seconds to wait, or None
+    """
+    # requests-style errors carry a response; urllib's HTTPError carries headers itself
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if headers is not None:
+        value = headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+
+    error_str = str(error)
+    match = re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', error_str)
+    if match:
+        return float(match.group(1))
+    match = re.search(r'retry in ([\d.]+)\s*s', error_str, re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given retry number (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def is_limited(shared: bool) -> bool:
+    """Check whether requests with a key go through the limiter."""
+    return RATE_LIMIT_RPM > 0 and (shared or RATE_LIMIT_EXPLICIT)
+
+
+def acquire(api_key: str, deadline: Optional[Deadline] = None, shared: bool = True) -> None:
+    """
+    Take one request token for an API key, waiting for the bucket to refill.
+
+    The bucket lives in the cache directory, so concurrent autocommit
+    processes share it. A server retry hint reported by any process blocks
+    all of them until it has passed.
+
+    Args:
+        api_key: Gemini API key
+        deadline: Optional deadline; waiting past it raises DeadlineExceeded
+        shared: Whether the key is the built-in one shared by all users
+            (a user's own key is only limited if AUTOCOMMIT_RATE_LIMIT is set)
+    """
+    if not is_limited(shared):
+        return
+    if deadline is None:
+        deadline = Deadline()
+
+    rate = RATE_LIMIT_RPM / 60.0
+    key = api_key_id(api_key)
+    while True:
+        now = time.time()
+        try:
+            with update_json(RATE_LIMIT_FILE) as data:
+                bucket = data.get(key) or {"tokens": RATE_LIMIT_BURST, "updated": now}
+                tokens = min(RATE_LIMIT_BURST, bucket["tokens"] + (now - bucket["updated"]) * rate)
+                blocked_until = bucket.get("blocked_until", 0)
+                if now >= blocked_until and tokens >= 1:
+                    wait = 0.0
+                    tokens -= 1
+                else:
+                    wait = max(blocked_until - now, (1 - tokens) / rate)
+                data[key] = {"tokens": tokens, "updated": now, "blocked_until": blocked_until}
+        except OSError as e:
+            logger.debug(f"Rate limiter unavailable: {str(e)}")
+            return
+
+        if wait <= 0:
+            return
+        logger.info(f"Rate limit: waiting {wait:.1f}s for request quota")
+        deadline.sleep(wait)
+
+
+def report_rate_limited(api_key: str, retry_after: Optional[float], shared: bool = True) -> None:
+    """
+    Record a quota error so every process backs off.
+
+    Args:
+        api_key: Gemini API key
+        retry_after: Server retry hint in seconds, if any
+        shared: Whether the key is the built-in one (see acquire)
+    """
+    if not is_limited(shared):
+        return
+    now = time.time()
+    try:
+        with update_json(RATE_LIMIT_FILE) as data:
+            bucket = data.get(api_key_id(api_key)) or {"tokens": 0.0, "updated": now}
+            rate = RATE_LIMIT_RPM / 60.0
+            bucket["tokens"] = min(RATE_LIMIT_BURST, bucket["tokens"] + (now - bucket["updated"]) * rate)
+            if retry_after:
+                # The server said exactly when to come back
+                bucket["blocked_until"] = max(bucket.get("blocked_until", 0), now + retry_after)
+            else:
+                # No hint: drain the bucket so every process slows down
+                bucket["tokens"] = 0.0
+            bucket["updated"] = now
+            data[api_key_id(api_key)] = bucket
+    except OSError as e:
+        logger.debug(f"Rate limiter unavailable: {str(e)}")
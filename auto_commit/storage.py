@@ -0,0 +1,118 @@
+"""Small on-disk JSON stores shared by concurrent autocommit processes."""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from .logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # Unix
+    msvcrt = None
+
+logger = get_logger()
+
+# Cache directory, override with AUTOCOMMIT_CACHE_DIR
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "autocommit",
+)
+
+
+def get_cache_dir() -> Path:
+    """Get (and create) the cache directory."""
+    cache_dir = Path(os.getenv("AUTOCOMMIT_CACHE_DIR", DEFAULT_CACHE_DIR))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Hold an exclusive lock on ``path`` + '.lock' (no-op if locking is unavailable)."""
+    lock_path = path.with_name(path.name + ".lock")
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _load(path: Path) -> dict:
+    """Load a JSON object from path, treating missing or corrupt files as empty."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path: Path, data: dict) -> None:
+    """Write JSON to a temp file and rename it over path."""
+    fd, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(name: str) -> dict:
+    """
+    Read a JSON store without locking.
+
+    Writers replace the file atomically, so readers always see a complete file.
+
+    Args:
+        name: File name inside the cache directory
+
+    Returns:
+        Stored dict (empty if missing or unreadable)
+    """
+    try:
+        return _load(get_cache_dir() / name)
+    except OSError:
+        return {}
+
+
+@contextmanager
+def update_json(name: str):
+    """
+    Read-modify-write a JSON store under an exclusive lock.
+
+    Usage:
+        with update_json("store.json") as data:
+            data["key"] = "value"
+
+    Args:
+        name: File name inside the cache directory
+
+    Raises:
+        OSError: If the cache directory is not writable
+    """
+    path = get_cache_dir() / name
+    with _file_lock(path):
+        data = _load(path)
+        yield data
+        _write_atomic(path, data)
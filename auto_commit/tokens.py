@@ -0,0 +1,207 @@
+"""Local token estimation, calibrated per model against the API's own token counts."""
+
+import re
+from typing import Optional
+from .logger import get_logger
+from .storage import read_json, update_json
+
+logger = get_logger()
+
+TOKENS_FILE = "tokens.json"
+
+# Input limits of models we know; others are learned from size errors
+KNOWN_INPUT_LIMITS = {
+    "gemini-1.0-pro": 30720,
+    "gemini-pro": 30720,
+}
+
+# Calibration: each measured count moves the model's ratio this far towards it
+CALIBRATION_WEIGHT = 0.3
+RATIO_BOUNDS = (0.25, 4.0)
+
+# Share of the model's input limit left free for estimation error
+LIMIT_MARGIN = 0.1
+MIN_BUDGET = 256
+
+WORD_PATTERN = re.compile(r'[A-Za-z]+')
+NUMBER_PATTERN = re.compile(r'\d+')
+SYMBOL_PATTERN = re.compile(r'[^\w\s]')
+# Letters outside ASCII (CJK, accents, ...) usually cost a token each
+NON_ASCII_LETTER_PATTERN = re.compile(r'[^\W\dA-Za-z_]')
+
+# Gemini: "The input token count (1200000) exceeds the maximum number of tokens allowed (1048576)"
+# OpenAI-compatible: "This model's maximum context length is 8192 tokens. However, you requested 9000 tokens"
+GEMINI_SIZE_PATTERN = re.compile(r'input token count \(?(\d+)\)? exceeds .*?allowed \(?(\d+)', re.IGNORECASE)
+OPENAI_SIZE_PATTERN = re.compile(
+    r'maximum context length is (\d+) tokens.*?(?:requested|resulted in|have) (\d+)', re.IGNORECASE | re.DOTALL
+)
+SIZE_MARKERS = (
+    "context_length_exceeded", "context length", "maximum number of tokens",
+    "too many tokens", "prompt is too long", "request too large",
+)
+
+# Calibration read once per process; writes update it in place
+_calibration: Optional[dict] = None
+
+
+class PromptTooLarge(Exception):
+    """Raised when a model rejected a prompt for exceeding its input limit."""
+
+    def __init__(self, message: str, limit: Optional[int] = None, actual: Optional[int] = None):
+        super().__init__(message)
+        self.limit = limit
+        self.actual = actual
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of text without calling the API.
+
+    Counts word pieces, digit groups, symbols, non-ASCII letters and line
+    breaks separately, so minified code, CJK text and long identifiers are
+    not judged by a single characters-per-token ratio. The result is in
+    estimate units; multiply by token_ratio() for a model's real count.
+    """
+    if not text:
+        return 0
+    words = sum((len(word) + 5) // 6 for word in WORD_PATTERN.findall(text))
+    numbers = sum((len(number) + 2) // 3 for number in NUMBER_PATTERN.findall(text))
+    symbols = len(SYMBOL_PATTERN.findall(text))
+    letters = len(NON_ASCII_LETTER_PATTERN.findall(text))
+    return words + numbers + symbols + letters + text.count('\n')
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to the longest prefix estimated within max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def _entry(model: Optional[str]) -> dict:
+    """Get the stored calibration of a model."""
+    global _calibration
+    if _calibration is None:
+        _calibration = read_json(TOKENS_FILE)
+    return _calibration.get(model or "", {})
+
+
+def _update(model: str, **values) -> None:
+    """Store calibration values for a model."""
+    global _calibration
+    try:
+        with update_json(TOKENS_FILE) as data:
+            entry = data.get(model) or {}
+            entry.update(values)
+            data[model] = entry
+            _calibration = dict(data)
+    except OSError as e:
+        logger.debug(f"Could not write token calibration: {str(e)}")
+        _entry(model)
+        _calibration.setdefault(model, {}).update(values)
+
+
+def token_ratio(model: Optional[str]) -> float:
+    """Get the model's real tokens per estimate unit (1.0 until calibrated)."""
+    return _entry(model).get("ratio", 1.0)
+
+
+def input_token_limit(model: Optional[str], default: Optional[int] = None) -> Optional[int]:
+    """Get the model's input token limit: learned, known, or the given default."""
+    return _entry(model).get("limit") or KNOWN_INPUT_LIMITS.get(model or "") or default
+
+
+def record_token_count(model: str, text: str, actual: int) -> None:
+    """
+    Calibrate a model's estimate against a token count the API reported.
+
+    Args:
+        model: Model name
+        text: Exactly the text that was counted
+        actual: The API's token count for it
+    """
+    estimate = estimate_tokens(text)
+    if not model or not estimate or not actual:
+        return
+    low, high = RATIO_BOUNDS
+    sample = min(high, max(low, actual / estimate))
+    entry = _entry(model)
+    ratio = entry.get("ratio", sample) * (1 - CALIBRATION_WEIGHT) + sample * CALIBRATION_WEIGHT
+    _update(model, ratio=round(ratio, 4), samples=entry.get("samples", 0) + 1)
+    logger.debug(f"Token calibration for {model}: {actual} actual / {estimate} estimated, ratio {ratio:.2f}")
+
+
+def record_input_limit(model: str, limit: int) -> None:
+    """Remember a model's input token limit (learned from a size error)."""
+    if model and limit:
+        _update(model, limit=int(limit))
+
+
+def size_error(error: Exception) -> Optional[PromptTooLarge]:
+    """
+    Recognize an API error that rejects a prompt as too large.
+
+    Returns:
+        PromptTooLarge with the limit and prompt size if the error states
+        them, or None if the error is about something else
+    """
+    error_str = str(error)
+    match = GEMINI_SIZE_PATTERN.search(error_str)
+    if match:
+        return PromptTooLarge(error_str[:200], limit=int(match.group(2)), actual=int(match.group(1)))
+    match = OPENAI_SIZE_PATTERN.search(error_str)
+    if match:
+        return PromptTooLarge(error_str[:200], limit=int(match.group(1)), actual=int(match.group(2)))
+    if any(marker in error_str.lower() for marker in SIZE_MARKERS):
+        return PromptTooLarge(error_str[:200])
+    return None
+
+
+def record_size_error(model: str, text: str, error: PromptTooLarge) -> None:
+    """
+    Learn from a rejected prompt so the next budget fits.
+
+    The stated prompt size calibrates the estimate; without a stated
+    limit, the model is assumed to take half of what was sent.
+    """
+    if error.actual:
+        record_token_count(model, text, error.actual)
+    limit = error.limit or int(estimate_tokens(text) * token_ratio(model) / 2)
+    record_input_limit(model, min(limit, input_token_limit(model) or limit))
+    logger.warning(f"Prompt too large for {model} (limit {limit} tokens), shrinking the budget")
+
+
+def prompt_budget(
+    model: Optional[str],
+    fixed_text: str,
+    max_output_tokens: int,
+    max_tokens: int,
+    default_limit: Optional[int] = None,
+) -> int:
+    """
+    Get the budget for the variable part of a prompt (usually the diff).
+
+    Args:
+        model: Model the prompt goes to
+        fixed_text: Everything else sent (system instruction and prompt template)
+        max_output_tokens: Tokens reserved for the answer
+        max_tokens: Upper bound in real tokens (keeps requests fast)
+        default_limit: Input limit to assume if the model's is unknown
+
+    Returns:
+        Budget in estimate units, i.e. for use with estimate_tokens()
+    """
+    ratio = token_ratio(model)
+    budget = max_tokens
+    limit = input_token_limit(model, default_limit)
+    if limit:
+        available = limit * (1 - LIMIT_MARGIN) - max_output_tokens - estimate_tokens(fixed_text) * ratio
+        budget = min(budget, available)
+    return max(MIN_BUDGET, int(budget / ratio))
@@ -4,8 +4,9 @@ import sys
 import os
 import subprocess
 from datetime import datetime
-from typing import Optional, Literal
+from typing import Callable, Optional, Literal
 from rich.console import Console
+from rich.markup import escape
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.prompt import Confirm, Prompt
@@ -117,17 +118,33 @@ def show_spinner(message: str):
         def __init__(self, msg: str):
             self.msg = msg
             self.progress = None
+            self.task = None
         
         def __enter__(self):
             self.progress = Progress(
                 SpinnerColumn(spinner_name="dots", style=get_color("info")),
-                TextColumn(f"[{get_color('info')}]{self.msg}[/{get_color('info')}]"),
+                TextColumn("{task.description}"),
                 console=console,
                 transient=True,
             )
+            self.task = self.progress.add_task(self._describe(""))
             self.progress.start()
             return self
         
+        def update(self, detail: str) -> None:
+            """Show live detail (e.g. a streamed message) next to the spinner."""
+            if self.progress and self.task is not None:
+                self.progress.update(self.task, description=self._describe(detail))
+        
+        def _describe(self, detail: str) -> str:
+            description = f"[{get_color('info')}]{self.msg}[/{get_color('info')}]"
+            if detail:
+                width = max(10, console.width - len(self.msg) - 8)
+                if len(detail) > width:
+                    detail = detail[:width - 1] + "…"
+                description += f" [dim]{escape(detail)}[/dim]"
+            return description
+        
         def __exit__(self, exc_type, exc_val, exc_tb):
             if self.progress:
                 self.progress.stop()
@@ -151,22 +168,70 @@ def show_panel(content: str, title: str = "", border_style: Optional[str] = None
     console.print(panel)
 
 
-def show_commit_preview(commit_message: str, diff_summary: str = "") -> str:
+def show_commit_preview(
+    commit_message: str,
+    diff_summary: str = "",
+    candidates: Optional[list[str]] = None,
+    regenerate: Optional[Callable[[], list[str]]] = None,
+) -> str:
     """
     Show commit message preview and allow user interaction.
     
+    Args:
+        commit_message: Suggested commit message
+        diff_summary: Summary of the staged changes
+        candidates: Alternative suggestions the user can cycle through
+        regenerate: Optional function fetching new suggestions, called only
+            once every candidate has been shown
+    
     Returns:
         Final commit message (user may edit or accept)
     """
-    # Minimal preview - just show the message
-    console.print(f"\n[{get_color('accent')}]{commit_message}[/{get_color('accent')}]")
+    candidates = list(candidates or [commit_message])
+    if commit_message not in candidates:
+        candidates.insert(0, commit_message)
+    index = candidates.index(commit_message)
     
-    # Simplified options
-    choice = Prompt.ask(
-        f"[{get_color('info')}](1) Accept  (2) Edit  (3) Manual  (4) Cancel[/{get_color('info')}]",
-        choices=["1", "2", "3", "4"],
-        default="1",
-    )
+    while True:
+        commit_message = candidates[index]
+        
+        # Minimal preview - just show the message
+        position = f"  [dim]({index + 1}/{len(candidates)})[/dim]" if len(candidates) > 1 else ""
+        console.print(f"\n[{get_color('accent')}]{escape(commit_message)}[/{get_color('accent')}]{position}")
+        
+        # Simplified options; (5) shows the next suggestion, fetching more once all were seen
+        if index + 1 < len(candidates):
+            next_label = "Next"
+        elif regenerate:
+            next_label = "Regenerate"
+        elif len(candidates) > 1:
+            next_label = "Next"
+        else:
+            next_label = ""
+        options = "(1) Accept  (2) Edit  (3) Manual  (4) Cancel"
+        choices = ["1", "2", "3", "4"]
+        if next_label:
+            options += f"  (5) {next_label}"
+            choices.append("5")
+        choice = Prompt.ask(
+            f"[{get_color('info')}]{options}[/{get_color('info')}]",
+            choices=choices,
+            default="1",
+        )
+        
+        if choice != "5":
+            break
+        if index + 1 < len(candidates):
+            index += 1
+        elif regenerate:
+            fresh = [m for m in regenerate() if m and m not in candidates]
+            if fresh:
+                candidates.extend(fresh)
+                index += 1
+            else:
+                show_warning("No new suggestions")
+        else:
+            index = 0
     
     if choice == "1":
         return commit_message
@@ -4,6 +4,7 @@ import subprocess
 import sys
 import os
 from typing import Optional, Tuple
+from .gitexec import execute
 from .logger import get_logger
 
 logger = get_logger()
@@ -41,13 +42,11 @@ def check_for_updates(repo_url: Optional[str] = None) -> Tuple[bool, str]:
     
     try:
         # Check remote for latest commit
-        result = subprocess.run(
-            ["git", "ls-remote", repo_url, "HEAD"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
+        result = execute(["git", "ls-remote", repo_url, "HEAD"], timeout=10, merge_stderr=False)
         
+        if result.timed_out:
+            logger.warning("Update check timed out")
+            return False, get_installed_version()
         if result.returncode != 0:
             logger.warning(f"Failed to check for updates: {result.stderr}")
             return False, get_installed_version()
@@ -62,9 +61,6 @@ def check_for_updates(repo_url: Optional[str] = None) -> Tuple[bool, str]:
         # In a full implementation, you'd compare commit hashes or tags
         return True, latest_commit[:8]
         
-    except subprocess.TimeoutExpired:
-        logger.warning("Update check timed out")
-        return False, get_installed_version()
     except Exception as e:
         logger.warning(f"Error checking for updates: {str(e)}")
         return False, get_installed_version()
@@ -4,6 +4,8 @@ import argparse
 import sys
 from auto_commit.main import run_auto_commit
 from auto_commit.updater import update_from_git, check_for_updates, get_repo_url, get_installed_version
+from auto_commit.git_ops import is_git_repo
+from auto_commit.largerepo import tune_repository
 from auto_commit.ui import show_info, show_success, show_error, show_warning, set_theme
 from auto_commit import __version__
 
@@ -22,6 +24,10 @@ Examples:
   autocommit --branch feature   # Commit to specific branch
   autocommit --quiet --log log.txt  # Quiet mode with logging
   autocommit --theme minimal    # Use minimal theme
+  autocommit --no-cache         # Regenerate instead of reusing a cached message
+  autocommit --ai-timeout 15    # Give AI generation at most 15 seconds
+  autocommit --offline          # Instant message from file statistics, no AI
+  autocommit --tune-repo        # Speed up git in a huge repository for good
 
 For more information, visit: https://github.com/your-repo/gitpilot
         """,
@@ -80,6 +86,31 @@ For more information, visit: https://github.com/your-repo/gitpilot
         help="UI theme: minimal (default), hacker, or developer",
     )
     
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always generate a fresh commit message instead of reusing a cached one",
+    )
+    
+    parser.add_argument(
+        "--ai-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Overall time limit for AI generation before falling back (default: 60)",
+    )
+    
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Generate the commit message instantly from file statistics, without AI",
+    )
+    
+    parser.add_argument(
+        "--tune-repo",
+        action="store_true",
+        help="Write git's large-repository settings to this repository's config and time git status",
+    )
+    
     parser.add_argument(
         "--version",
         "-v",
@@ -129,6 +160,23 @@ For more information, visit: https://github.com/your-repo/gitpilot
             show_success("You're running the latest version")
         sys.exit(0)
     
+    if args.tune_repo:
+        set_theme(args.theme)
+        if not is_git_repo():
+            show_error("Not a git repository")
+            sys.exit(1)
+        settings, before, after = tune_repository()
+        if not settings:
+            if before is None:
+                show_success("Repository already configured, nothing to change")
+                sys.exit(0)
+            show_error("Could not write the settings. Check logs for details.")
+            sys.exit(1)
+        show_success(f"Enabled: {', '.join(f'{key}={value}' for key, value in settings.items())}")
+        if before is not None and after is not None:
+            show_info(f"git status: {before * 1000:.0f} ms before, {after * 1000:.0f} ms after")
+        sys.exit(0)
+    
     # Run the workflow (only if we get here, --help and --version have been handled)
     exit_code = run_auto_commit(
         dry_run=args.dry_run,
@@ -138,6 +186,9 @@ For more information, visit: https://github.com/your-repo/gitpilot
         quiet=args.quiet,
         log_file=args.log,
         theme=args.theme,
+        no_cache=args.no_cache,
+        ai_timeout=args.ai_timeout,
+        offline=args.offline,
     )
     
     sys.exit(exit_code)
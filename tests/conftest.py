@@ -0,0 +1,79 @@
+"""Shared fixtures: an isolated cache directory, throwaway git repositories and a stub provider."""
+
+import subprocess
+
+import pytest
+
+from auto_commit import gitexec, providers, tokens
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep caches, calibration and git memoization out of the user's environment and other tests."""
+    monkeypatch.setenv("AUTOCOMMIT_CACHE_DIR", str(tmp_path / "cache"))
+    for name, value in {
+        "GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com",
+        "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com",
+        "GIT_CONFIG_NOSYSTEM": "1", "HOME": str(tmp_path / "home"),
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(tokens, "_calibration", None)
+    # Tests change repositories behind the executor's back, so nothing is
+    # memoized unless a test starts a run itself
+    gitexec.end_run()
+    yield
+    gitexec.end_run()
+
+
+def git(*args: str) -> str:
+    """Run git in the current directory and return its output."""
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    """An empty repository on branch main, made the current directory."""
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    monkeypatch.chdir(repo)
+    git("init", "-q", "-b", "main")
+    return repo
+
+
+def commit_file(path: str, content: str, message: str) -> None:
+    """Write a file and commit it."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    git("add", "--", path)
+    git("commit", "-q", "-m", message)
+
+
+class StubProvider(providers.Provider):
+    """A provider answering through a test-supplied function."""
+
+    name = "stub"
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def configured(self) -> bool:
+        return True
+
+    def ping(self, timeout: float) -> None:
+        pass
+
+    def request(self, prompt, max_output_tokens, deadline, first_line=False, on_partial=None, candidate_count=1):
+        self.prompts.append(prompt)
+        return self.answer(prompt, deadline)
+
+
+@pytest.fixture
+def use_provider(monkeypatch):
+    """Route generation to a StubProvider answering with the given function."""
+    def install(answer):
+        stub = StubProvider(answer)
+        monkeypatch.setitem(providers._PROVIDERS, "stub", lambda: stub)
+        monkeypatch.setenv("AUTOCOMMIT_PROVIDER", "stub")
+        return stub
+    return install
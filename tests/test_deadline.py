@@ -0,0 +1,102 @@
+"""The end-to-end generation deadline and the offline fallback it triggers."""
+
+import time
+
+import pytest
+
+from auto_commit import ai, main
+from auto_commit.circuit import CIRCUIT_FILE
+from auto_commit.deadline import Deadline, DeadlineExceeded, call_with_timeout
+from auto_commit.models import api_key_id
+from auto_commit.storage import read_json
+
+
+def circuit_failures() -> int:
+    return read_json(CIRCUIT_FILE).get(api_key_id("stub"), {}).get("failures", 0)
+
+
+def small_diff() -> str:
+    return "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-a = 1\n+a = 2\n"
+
+
+def test_deadline_caps_each_step_and_raises_once_spent():
+    deadline = Deadline(0.2)
+    assert deadline.timeout(30) <= 0.2
+    time.sleep(0.25)
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(30)
+
+
+def test_call_with_timeout_gives_up_on_a_slow_call():
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        call_with_timeout(time.sleep, 0.2, 5)
+    assert time.monotonic() - started < 2
+
+
+def test_cancelled_deadline_stops_the_wait_early():
+    deadline = Deadline(10)
+    deadline.cancel()
+    with pytest.raises(DeadlineExceeded):
+        call_with_timeout(time.sleep, 5, 5, deadline=deadline)
+
+
+def test_generation_past_the_deadline_raises_deadline_exceeded(use_provider):
+    def answer(prompt, deadline):
+        deadline.sleep(5)
+        return ["feat: too late"]
+
+    use_provider(answer)
+    with pytest.raises(DeadlineExceeded, match="deadline exceeded"):
+        ai.generate_commit_messages(small_diff(), deadline=Deadline(0.3))
+    assert circuit_failures() == 1
+
+
+def test_deadline_in_a_map_chunk_is_not_reported_as_a_chunk_failure(use_provider):
+    def answer(prompt, deadline):
+        raise DeadlineExceeded("Time budget of 1s exhausted")
+
+    use_provider(answer)
+    diff = "".join(
+        f"diff --git a/dir{i}/big.py b/dir{i}/big.py\n--- a/dir{i}/big.py\n+++ b/dir{i}/big.py\n"
+        f"@@ -1 +1 @@\n-old\n+{'value ' * 20000}\n"
+        for i in range(3)
+    )
+    with pytest.raises(DeadlineExceeded):
+        ai.generate_commit_messages(diff, deadline=Deadline(30))
+
+
+def test_candidates_come_from_one_request(use_provider):
+    stub = use_provider(lambda prompt, deadline: ["feat: one", "feat: two", "feat: one"])
+    messages = ai.generate_commit_messages(small_diff(), deadline=Deadline(10), count=3)
+
+    assert messages == ["feat: one", "feat: two"]
+    assert len(stub.prompts) == 1
+
+
+@pytest.fixture
+def workflow(monkeypatch):
+    """An interactive workflow (not --yes, not quiet) with the cache off."""
+    monkeypatch.setattr(main, "generate_offline_message", lambda: "chore: offline message")
+    return main.AutoCommitWorkflow(no_cache=True, theme="minimal")
+
+
+def test_interactive_run_falls_back_offline_when_the_deadline_trips(workflow, monkeypatch):
+    def generate(*args, **kwargs):
+        raise DeadlineExceeded("AI generation deadline exceeded")
+
+    monkeypatch.setattr(main, "generate_commit_messages", generate)
+    monkeypatch.setattr(main, "prompt_input", lambda *args: pytest.fail("should not ask for a message"))
+
+    assert workflow._generate_commit_message(small_diff()) == "chore: offline message"
+
+
+def test_interactive_run_asks_for_a_message_on_other_errors(workflow, monkeypatch):
+    def generate(*args, **kwargs):
+        raise Exception("Failed to generate commit message: bad response")
+
+    monkeypatch.setattr(main, "generate_commit_messages", generate)
+    monkeypatch.setattr(main, "prompt_input", lambda prompt, default=None: "fix: typed by hand")
+
+    assert workflow._generate_commit_message(small_diff()) == "fix: typed by hand"
@@ -0,0 +1,88 @@
+"""The central git executor: memoization scope, timeouts and output handling."""
+
+import os
+import stat
+import sys
+
+from auto_commit import gitexec
+
+from conftest import commit_file, git
+
+
+def status() -> str:
+    return gitexec.execute(["git", "status", "--porcelain"]).stdout
+
+
+def test_nothing_is_memoized_outside_a_run(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    assert status() == ""
+
+    with open("a.txt", "w", encoding="utf-8") as f:
+        f.write("changed\n")
+    assert status() == " M a.txt\n"
+
+
+def test_a_run_memoizes_until_it_ends(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    gitexec.start_run()
+    assert status() == ""
+
+    with open("a.txt", "w", encoding="utf-8") as f:
+        f.write("changed\n")
+    assert status() == ""  # Changed behind the executor's back
+
+    gitexec.end_run()
+    assert status() == " M a.txt\n"
+
+
+def test_a_mutating_command_clears_the_memo(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    gitexec.start_run()
+    assert status() == ""
+
+    with open("a.txt", "w", encoding="utf-8") as f:
+        f.write("changed\n")
+    gitexec.execute(["git", "add", "a.txt"])
+    assert status() == "M  a.txt\n"
+
+
+def test_default_timeouts(monkeypatch):
+    monkeypatch.setattr(gitexec, "_interactive", lambda: False)
+    assert gitexec._default_timeout("commit") == 0
+    assert gitexec._default_timeout("push") == gitexec.GIT_NETWORK_TIMEOUT
+    assert gitexec._default_timeout("checkout") == gitexec.GIT_TIMEOUT
+
+    monkeypatch.setattr(gitexec, "_interactive", lambda: True)
+    assert gitexec._default_timeout("push") == 0
+    assert gitexec._default_timeout("fetch") == gitexec.GIT_NETWORK_TIMEOUT
+
+
+def test_non_interactive_push_cannot_prompt(git_repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(gitexec, "_interactive", lambda: False)
+    git("init", "-q", "--bare", str(tmp_path / "remote.git"))
+    git("remote", "add", "origin", str(tmp_path / "remote.git"))
+    commit_file("a.txt", "a\n", "feat: add a")
+    hook = os.path.join(".git", "hooks", "pre-push")
+    with open(hook, "w", encoding="utf-8") as f:
+        f.write('#!/bin/sh\necho "prompt=$GIT_TERMINAL_PROMPT"\n')
+    os.chmod(hook, os.stat(hook).st_mode | stat.S_IEXEC)
+
+    result = gitexec.execute(["git", "push", "origin", "main"])
+    assert result.ok
+    assert "prompt=0" in result.stdout
+
+
+def test_stream_survives_a_flood_of_stderr(monkeypatch):
+    monkeypatch.setattr(gitexec, "GIT_TIMEOUT", 10)
+    script = "import sys; sys.stderr.write('warning\\n' * 200000); sys.stdout.write('done')"
+    data, truncated, success = gitexec.stream([sys.executable, "-c", script])
+
+    assert (data, truncated, success) == (b"done", False, True)
+
+
+def test_stream_reports_stderr_of_a_failed_command(caplog):
+    script = "import sys; sys.stderr.write('fatal: bad revision'); sys.exit(128)"
+    data, truncated, success = gitexec.stream([sys.executable, "-c", script])
+
+    assert not success
+    assert "fatal: bad revision" in caplog.text
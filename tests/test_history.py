@@ -0,0 +1,71 @@
+"""Reuse of past commit messages for recurring change patterns."""
+
+from auto_commit import history
+
+from conftest import commit_file
+
+VERSION_DIFF = (
+    "diff --git a/VERSION b/VERSION\n--- a/VERSION\n+++ b/VERSION\n"
+    "@@ -1 +1 @@\n-1.2.0\n+1.3.0\n"
+)
+
+
+def test_subject_template_masks_versions_and_numbers():
+    assert history.subject_template("Bump version to v1.4.0") == "bump version to <version>"
+    assert history.subject_template("Fix issue #123") == "fix issue ##"
+
+
+def test_is_recurring():
+    assert history.is_recurring([("M", "package-lock.json"), ("M", "locales/de/messages.po")])
+    assert not history.is_recurring([("M", "package-lock.json"), ("M", "src/main.py")])
+    assert not history.is_recurring([])
+
+
+def test_apply_template_carries_the_new_version():
+    assert history.apply_template("Bump version to 1.2.0", VERSION_DIFF) == "Bump version to 1.3.0"
+    assert history.apply_template("Release v1.2.0", VERSION_DIFF) == "Release v1.3.0"
+    assert history.apply_template("Update docs", VERSION_DIFF) == "Update docs"
+
+
+def test_varied_messages_for_the_same_file_are_not_reused(git_repo):
+    commit_file("main.py", "a = 1\n", "feat: add main")
+    commit_file("main.py", "a = 2\n", "fix: handle empty input")
+    commit_file("main.py", "a = 3\n", "refactor: split the parser")
+
+    assert history.find_history_message([("M", "main.py")]) is None
+
+
+def test_consistent_messages_are_reused(git_repo):
+    commit_file("VERSION", "1.0.0\n", "chore: add version file")
+    commit_file("VERSION", "1.1.0\n", "Bump version to 1.1.0")
+    commit_file("VERSION", "1.2.0\n", "Bump version to 1.2.0")
+
+    message = history.find_history_message([("M", "VERSION")], VERSION_DIFF)
+    assert message == "Bump version to 1.3.0"
+    assert history.find_history_message([("M", "VERSION")], VERSION_DIFF, strict=True) == message
+
+
+def test_recurring_files_match_by_path_except_in_strict_mode(git_repo):
+    commit_file("poetry.lock", "one\n", "chore: add lockfile")
+    commit_file("poetry.lock", "two\n", "Update dependencies")
+    commit_file("poetry.lock", "three\n", "chore(deps): refresh the lockfile")
+
+    changes = [("M", "poetry.lock")]
+    assert history.find_history_message(changes) == "chore(deps): refresh the lockfile"
+    assert history.find_history_message(changes, strict=True) is None
+
+
+def test_a_pattern_seen_once_is_not_reused(git_repo):
+    commit_file("setup.py", "one\n", "chore: add setup")
+    commit_file("other.py", "x\n", "feat: add other")
+
+    assert history.find_history_message([("M", "setup.py")]) is None
+
+
+def test_index_picks_up_new_commits(git_repo):
+    commit_file("VERSION", "1.0.0\n", "chore: add version file")
+    commit_file("VERSION", "1.1.0\n", "Bump version to 1.1.0")
+    assert history.find_history_message([("M", "VERSION")]) is None
+
+    commit_file("VERSION", "1.2.0\n", "Bump version to 1.2.0")
+    assert history.find_history_message([("M", "VERSION")], VERSION_DIFF) == "Bump version to 1.3.0"
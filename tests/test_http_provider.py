@@ -0,0 +1,198 @@
+"""OpenAI-compatible HTTP provider against a local stand-in server."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from auto_commit import ai, providers
+from auto_commit.circuit import CIRCUIT_FILE
+from auto_commit.deadline import Deadline, DeadlineExceeded
+from auto_commit.models import api_key_id
+from auto_commit.prompt_builder import SYSTEM_INSTRUCTION
+from auto_commit.ratelimit import RateLimited
+from auto_commit.storage import read_json
+from auto_commit.tokens import PromptTooLarge
+
+
+class ChatServer:
+    """A chat-completions server answering with whatever the test sets up."""
+
+    def __init__(self):
+        self.requests = []
+        self.status = 200
+        self.headers = {}
+        self.choices = ["feat: add login form\n\nBody text"]
+        self.error = ""
+        self.delay = 0.0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._reply(200, {"data": [{"id": "stub"}]})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append(body)
+                time.sleep(server.delay)
+                if server.status != 200:
+                    self._reply(server.status, {"error": {"message": server.error}}, server.headers)
+                elif body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._reply(200, {
+                        "choices": [
+                            {"index": i, "message": {"content": text}} for i, text in enumerate(server.choices)
+                        ],
+                        "usage": {"prompt_tokens": 120},
+                    })
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for piece in ("feat: ", "add login", " form\n", "Body text"):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    chat_server = ChatServer()
+    yield chat_server
+    chat_server.close()
+
+
+@pytest.fixture
+def provider(server):
+    return providers.HttpChatProvider(base_url=server.url, model="stub-model")
+
+
+def circuit_failures(provider):
+    return read_json(CIRCUIT_FILE).get(api_key_id(provider.circuit_key), {}).get("failures", 0)
+
+
+def test_request_sends_system_instruction_first(server, provider):
+    texts = provider.request("Write a commit message", 100, Deadline(10))
+
+    assert texts == ["feat: add login form\n\nBody text"]
+    messages = server.requests[0]["messages"]
+    assert messages[0] == {"role": "system", "content": SYSTEM_INSTRUCTION}
+    assert messages[1] == {"role": "user", "content": "Write a commit message"}
+    assert server.requests[0]["model"] == "stub-model"
+
+
+def test_request_asks_for_several_candidates(server, provider):
+    server.choices = ["feat: one", "feat: two", "feat: three"]
+    texts = provider.request("prompt", 100, Deadline(10), candidate_count=3)
+
+    assert texts == ["feat: one", "feat: two", "feat: three"]
+    assert server.requests[0]["n"] == 3
+
+
+def test_streaming_stops_at_the_subject_line(server, provider):
+    partials = []
+    texts = provider.request("prompt", 100, Deadline(10), first_line=True, on_partial=partials.append)
+
+    assert texts[0].split("\n")[0] == "feat: add login form"
+    assert partials[-1] == "feat: add login form"
+    assert server.requests[0]["stream"] is True
+
+
+def test_context_length_error_raises_prompt_too_large(server, provider):
+    server.status = 400
+    server.error = "This model's maximum context length is 8192 tokens. However, you requested 9000 tokens"
+    with pytest.raises(PromptTooLarge) as excinfo:
+        provider.request("prompt", 100, Deadline(10))
+
+    assert excinfo.value.limit == 8192
+    assert circuit_failures(provider) == 0
+
+
+def test_rate_limit_carries_the_retry_hint(server, provider):
+    server.status = 429
+    server.headers = {"Retry-After": "7"}
+    with pytest.raises(RateLimited) as excinfo:
+        provider.request("prompt", 100, Deadline(10))
+
+    assert excinfo.value.retry_after == 7
+
+
+def test_server_error_counts_towards_the_circuit_breaker(server, provider):
+    server.status = 503
+    with pytest.raises(Exception, match="HTTP provider error 503"):
+        provider.request("prompt", 100, Deadline(10))
+
+    assert circuit_failures(provider) == 1
+
+
+def test_slow_server_past_the_deadline_raises_deadline_exceeded(server, provider):
+    server.delay = 1.5
+    with pytest.raises(DeadlineExceeded):
+        provider.request("prompt", 100, Deadline(0.5))
+
+    assert circuit_failures(provider) == 0
+
+
+def test_slow_server_past_the_request_timeout_is_a_failure(server, provider, monkeypatch):
+    server.delay = 1.5
+    monkeypatch.setattr(providers, "HTTP_TIMEOUT", 0.5)
+    with pytest.raises(TimeoutError) as excinfo:
+        provider.request("prompt", 100, Deadline(10))
+
+    assert not isinstance(excinfo.value, DeadlineExceeded)
+    assert circuit_failures(provider) == 1
+
+
+def test_unreachable_server_is_a_failure(server, provider):
+    server.close()
+    with pytest.raises(Exception, match="unreachable"):
+        provider.request("prompt", 100, Deadline(10))
+
+    assert circuit_failures(provider) == 1
+
+
+def test_a_failing_generation_counts_once_however_many_requests_it_sends(server, monkeypatch):
+    server.status = 503
+    monkeypatch.setattr(providers, "HTTP_BASE_URL", server.url)
+    monkeypatch.setenv("AUTOCOMMIT_PROVIDER", "http")
+    diff = "".join(
+        f"diff --git a/dir{i}/big.py b/dir{i}/big.py\n--- a/dir{i}/big.py\n+++ b/dir{i}/big.py\n"
+        f"@@ -1 +1 @@\n-old\n+{'value ' * 20000}\n"
+        for i in range(3)
+    )
+    with pytest.raises(Exception, match="every diff chunk failed"):
+        ai.generate_commit_messages(diff, deadline=Deadline(30))
+
+    assert len(server.requests) == 3
+    assert circuit_failures(providers.HttpChatProvider()) == 1
+
+
+def test_health_check_pings_the_models_endpoint(server, provider):
+    provider.ping(timeout=2)
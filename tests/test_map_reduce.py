@@ -0,0 +1,127 @@
+"""Map-reduce generation against a local stub of the model API."""
+
+import threading
+
+import pytest
+
+from auto_commit import ai
+from auto_commit.circuit import CircuitOpen
+from auto_commit.deadline import DeadlineExceeded
+from auto_commit.ratelimit import RateLimited
+
+
+def large_diff(directories: int, words: int = 3000) -> str:
+    """A diff with one big file per directory, so each directory is a chunk."""
+    return "".join(
+        f"diff --git a/dir{i}/module.py b/dir{i}/module.py\n"
+        f"--- a/dir{i}/module.py\n+++ b/dir{i}/module.py\n"
+        f"@@ -1 +1 @@\n-old\n+{'value ' * words}\n"
+        for i in range(directories)
+    )
+
+
+class StubModel:
+    """Answers map prompts with a per-chunk summary and the reduce prompt with a subject."""
+
+    def __init__(self, fail_on=None, error=None):
+        self.prompts = []
+        self.fail_on = fail_on
+        self.error = error
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt, max_output_tokens=100, first_line=False):
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            raise self.error
+        if prompt.startswith("Combine"):
+            return "refactor: restructure every module"
+        directory = next(part for part in prompt.split() if part.startswith("dir"))
+        return f"update {directory.split('/')[0]}"
+
+
+def test_map_reduce_summarizes_chunks_then_reduces():
+    model = StubModel()
+    message = ai.generate_commit_message_map_reduce(large_diff(4), model, chunk_tokens=1000)
+
+    assert message == "refactor: restructure every module"
+    assert len(model.prompts) == 5  # Four chunks and one reduce
+    reduce_prompt = model.prompts[-1]
+    for i in range(4):
+        assert f"- update dir{i}" in reduce_prompt
+
+
+def test_map_reduce_drops_a_chunk_that_fails_on_its_own():
+    model = StubModel(fail_on="dir1/", error=ValueError("unparsable response"))
+    message = ai.generate_commit_message_map_reduce(large_diff(3), model, chunk_tokens=1000)
+
+    assert message == "refactor: restructure every module"
+    assert "update dir1" not in model.prompts[-1]
+
+
+@pytest.mark.parametrize("error", [
+    DeadlineExceeded("Time budget of 1s exhausted"),
+    RateLimited("quota exhausted", retry_after=5),
+    CircuitOpen(30),
+])
+def test_map_reduce_propagates_errors_shared_by_every_chunk(error):
+    model = StubModel(fail_on="dir2/", error=error)
+    with pytest.raises(type(error)):
+        ai.generate_commit_message_map_reduce(large_diff(3), model, chunk_tokens=1000)
+
+
+def test_map_reduce_fails_when_every_chunk_fails():
+    model = StubModel(fail_on="dir", error=ValueError("unparsable response"))
+    with pytest.raises(Exception, match="every diff chunk failed"):
+        ai.generate_commit_message_map_reduce(large_diff(2), model, chunk_tokens=1000)
+
+
+def test_map_reduce_runs_chunks_concurrently():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def request(prompt, max_output_tokens=100, first_line=False):
+        nonlocal running, peak
+        if prompt.startswith("Combine"):
+            return "feat: everything"
+        with lock:
+            running += 1
+            peak = max(peak, running)
+            if peak >= 3:
+                release.set()
+        release.wait(2)
+        with lock:
+            running -= 1
+        return "summary"
+
+    ai.generate_commit_message_map_reduce(large_diff(3), request, max_workers=3, chunk_tokens=1000)
+    assert peak == 3
+
+
+def test_reduce_prompt_names_files_beyond_the_read_diff():
+    model = StubModel()
+    changed = [f"dir{i}/module.py" for i in range(3)] + ["zzz/late.py"]
+    message = ai.generate_commit_message_map_reduce(
+        large_diff(3), model, chunk_tokens=1000, changed_paths=changed
+    )
+
+    assert message == "refactor: restructure every module"
+    assert "Also changed (diff too long to read): zzz/late.py" in model.prompts[-1]
+    assert "dir0/module.py" not in model.prompts[-1]
+
+
+def test_a_single_summary_is_still_reduced_with_unread_files():
+    model = StubModel()
+    ai.generate_commit_message_map_reduce(
+        large_diff(1), model, chunk_tokens=1000, changed_paths=["dir0/module.py", "zzz/late.py"]
+    )
+
+    assert model.prompts[-1].startswith("Combine")
+    assert "zzz/late.py" in model.prompts[-1]
+
+
+def test_quoted_paths_match_the_staged_paths():
+    diff = 'diff --git "a/t\\303\\251st \\"q\\".txt" "b/t\\303\\251st \\"q\\".txt"\n@@ -1 +1 @@\n-a\n+b\n'
+    assert ai._unread_paths(diff, ['tést "q".txt']) == []
@@ -0,0 +1,54 @@
+"""Diff parsing and packing the most informative hunks into a token budget."""
+
+from auto_commit.prompt_builder import build_diff_prompt, diff_paths, parse_diff, render_files
+from auto_commit.tokens import estimate_tokens
+
+
+def file_diff(path: str, lines: int, word: str = "value") -> str:
+    body = "".join(f"-old {word} {i}\n+new {word} {i}\n" for i in range(lines))
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,{lines} +1,{lines} @@ def run():\n{body}"
+
+
+def test_small_diff_is_sent_whole_in_compact_form():
+    diff = file_diff("src/app.py", 3)
+    prompt = build_diff_prompt(diff, 1000)
+
+    assert prompt == render_files(parse_diff(diff), compact=True)
+    assert prompt.startswith("### src/app.py\n@@ def run():")
+
+
+def test_part_estimates_add_up_to_the_whole():
+    files = parse_diff(file_diff("a.py", 20) + file_diff("b.md", 5))
+    parts = [text for f in files for text in [f.header_text(True)] + [h.text(True) for h in f.hunks]]
+
+    assert estimate_tokens('\n'.join(parts)) == sum(map(estimate_tokens, parts)) + len(parts) - 1
+
+
+def test_packing_prefers_source_over_lockfiles_and_names_the_rest():
+    diff = file_diff("poetry.lock", 200, "hash") + file_diff("src/app.py", 20)
+    prompt = build_diff_prompt(diff, 600)
+
+    assert "### src/app.py" in prompt
+    assert "### poetry.lock" not in prompt
+    assert "also changed: poetry.lock" in prompt
+
+
+def test_quoted_paths_are_decoded():
+    header = 'diff --git "a/t\\303\\251st \\"q\\".txt" "b/t\\303\\251st \\"q\\".txt"'
+    assert diff_paths(header + "\n@@ -1 +1 @@\n-a\n+b\n") == {'tést "q".txt'}
+    assert diff_paths("diff --git a/with space.py b/with space.py\n") == {"with space.py"}
+
+
+def test_files_missing_from_the_diff_are_named():
+    prompt = build_diff_prompt(file_diff("src/app.py", 3), 1000, also_changed=["zzz/late.py"])
+
+    assert "### src/app.py" in prompt
+    assert prompt.endswith("(diff reduced; also changed: zzz/late.py)")
+
+
+def test_a_late_source_file_outranks_earlier_bulk_changes():
+    bulk = "".join(file_diff(f"assets/data{i}.json", 400, "entry") for i in range(40))
+    diff = bulk + file_diff("zzz/service.py", 5)
+    assert len(diff.encode()) > 200 * 1024  # Past the raw cut the diff used to get
+
+    assert "### zzz/service.py" in build_diff_prompt(diff, 2000)
@@ -0,0 +1,98 @@
+"""RepoSnapshot parsing of `git status --porcelain=v2 --branch -z` and capture from a real repository."""
+
+import os
+
+from auto_commit.git_ops import RepoSnapshot
+
+from conftest import commit_file, git
+
+OID = "1" * 40
+
+
+def parse(*records: str) -> RepoSnapshot:
+    snapshot = RepoSnapshot()
+    snapshot._parse_status("\0".join(records) + "\0")
+    return snapshot
+
+
+def test_branch_headers():
+    snapshot = parse(
+        f"# branch.oid {OID}",
+        "# branch.head feature/login",
+        "# branch.upstream origin/feature/login",
+        "# branch.ab +2 -3",
+    )
+
+    assert snapshot.head == OID
+    assert snapshot.branch == "feature/login"
+    assert snapshot.upstream == "origin/feature/login"
+    assert (snapshot.ahead, snapshot.behind) == (2, 3)
+
+
+def test_initial_commit_and_detached_head():
+    snapshot = parse("# branch.oid (initial)", "# branch.head (detached)")
+
+    assert snapshot.head is None
+    assert snapshot.branch is None
+    assert snapshot.upstream is None
+
+
+def test_ordinary_records_count_index_and_worktree_changes():
+    snapshot = parse(
+        f"1 M. N... 100644 100644 100644 {OID} {OID} staged.py",
+        f"1 .M N... 100644 100644 100644 {OID} {OID} src/with space.py",
+        f"1 MM N... 100644 100644 100644 {OID} {OID} both.py",
+    )
+
+    assert (snapshot.staged, snapshot.unstaged, snapshot.changed) == (2, 2, 3)
+    assert snapshot.unstaged_paths == ["src/with space.py", "both.py"]
+
+
+def test_rename_record_consumes_the_original_path():
+    snapshot = parse(
+        f"2 R. N... 100644 100644 100644 {OID} {OID} R100 new name.py",
+        "old name.py",
+        "? notes.txt",
+    )
+
+    assert (snapshot.staged, snapshot.untracked, snapshot.changed) == (1, 1, 2)
+    assert snapshot.unstaged_paths == ["notes.txt"]
+
+
+def test_unmerged_and_untracked_records():
+    snapshot = parse(
+        f"u UU N... 100644 100644 100644 100644 {OID} {OID} {OID} conflict.py",
+        "? new dir/file.txt",
+    )
+
+    assert (snapshot.conflicted, snapshot.untracked, snapshot.changed) == (1, 1, 2)
+    assert snapshot.unstaged_paths == ["conflict.py", "new dir/file.txt"]
+
+
+def test_capture_outside_a_repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+
+    assert RepoSnapshot.capture().is_repo is False
+
+
+def test_capture_reads_status_and_config(git_repo):
+    commit_file("a.py", "a = 1\n", "feat: add a")
+    commit_file("b.py", "b = 1\n", "feat: add b")
+    git("remote", "add", "origin", "https://example.com/repo.git")
+    git("mv", "b.py", "renamed.py")
+    with open("a.py", "w", encoding="utf-8") as f:
+        f.write("a = 2\n")
+    os.mkdir("docs")
+    with open(os.path.join("docs", "read me.md"), "w", encoding="utf-8") as f:
+        f.write("# Docs\n")
+
+    snapshot = RepoSnapshot.capture()
+
+    assert snapshot.is_repo
+    assert snapshot.branch == "main"
+    assert snapshot.head == git("rev-parse", "HEAD").strip()
+    assert snapshot.remote_url == "https://example.com/repo.git"
+    assert (snapshot.staged, snapshot.unstaged, snapshot.untracked) == (1, 1, 1)
+    # Untracked directories are listed once, as git add takes them
+    assert sorted(snapshot.unstaged_paths) == ["a.py", "docs/"]
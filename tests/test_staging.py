@@ -0,0 +1,64 @@
+"""Staging from the status listing: add_all() and stage_paths()."""
+
+import os
+
+from auto_commit.git_ops import RepoSnapshot, add_all, get_staged_changes
+
+from conftest import commit_file, git
+
+
+def write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def staged_paths() -> list[str]:
+    return sorted(git("diff", "--cached", "--name-only").split())
+
+
+def test_add_all_stages_new_modified_and_deleted_files(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    commit_file("gone.txt", "x\n", "feat: add gone")
+    write("a.txt", "changed\n")
+    os.remove("gone.txt")
+    write("new.txt", "new\n")
+    write("sub/s.txt", "s\n")
+    write(".gitignore", "*.log\n")
+    write("debug.log", "ignored\n")
+
+    assert add_all()
+    assert staged_paths() == [".gitignore", "a.txt", "gone.txt", "new.txt", "sub/s.txt"]
+
+
+def test_add_all_stages_untracked_files_when_status_hides_them(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    git("config", "status.showUntrackedFiles", "no")
+    write("a.txt", "changed\n")
+    write("new.txt", "new\n")
+    write("sub/s.txt", "s\n")
+
+    snapshot = RepoSnapshot.capture()
+    assert snapshot.untracked == 2
+    assert add_all(snapshot)
+    assert staged_paths() == ["a.txt", "new.txt", "sub/s.txt"]
+
+
+def test_add_all_without_a_snapshot_ignores_the_setting_too(git_repo):
+    commit_file("a.txt", "a\n", "feat: add a")
+    git("config", "status.showUntrackedFiles", "no")
+    write("new.txt", "new\n")
+
+    assert add_all()
+    assert [change[1] for change in get_staged_changes()] == ["new.txt"]
+
+
+def test_add_all_stays_inside_the_current_directory(git_repo, monkeypatch):
+    commit_file("a.txt", "a\n", "feat: add a")
+    write("a.txt", "changed\n")
+    write("sub/s.txt", "s\n")
+    snapshot = RepoSnapshot.capture()
+
+    monkeypatch.chdir(git_repo / "sub")
+    assert add_all(snapshot)
+    assert staged_paths() == ["sub/s.txt"]
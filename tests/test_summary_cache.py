@@ -0,0 +1,76 @@
+"""Per-file change summaries: made for the next run, reused by it, and never cached from partial diffs."""
+
+import re
+
+from auto_commit import ai
+from auto_commit.cache import file_summary_key, get_file_summaries
+from auto_commit.deadline import Deadline
+
+
+def file_diff(path: str, lines: int = 2, cut: int = 0) -> str:
+    body = "".join(f"-old {i}\n+new {i}\n" for i in range(lines))
+    if cut:
+        body = body[:body.rindex("-old", 0, len(body) - cut)]  # The read limit cut the hunk short
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,{lines} +1,{lines} @@\n{body}"
+
+
+def answer(prompt, deadline):
+    if prompt.startswith("Summarize the change to each file"):
+        paths = re.findall(r"^### (\S+)", prompt, re.MULTILINE)
+        return ["\n".join(f"{path}: update {path}" for path in paths)]
+    return ["feat: update modules"]
+
+
+def blobs(paths, version="1"):
+    return {path: ("a" * 40, version * 40) for path in paths}
+
+
+def cached_paths(file_blobs):
+    keys = {file_summary_key(path, *ids): path for path, ids in file_blobs.items()}
+    return sorted(keys[key] for key in get_file_summaries(list(keys)))
+
+
+def test_first_run_sends_one_request_and_caches_summaries_for_the_next(use_provider):
+    stub = use_provider(answer)
+    paths = [f"src/module{i}.py" for i in range(12)]
+    file_blobs = blobs(paths)
+
+    messages = ai.generate_commit_messages(
+        "".join(map(file_diff, paths)), file_blobs=file_blobs, deadline=Deadline(10)
+    )
+    assert messages == ["feat: update modules"]
+    assert stub.prompts[0].startswith("Write the commit message for this diff")
+
+    ai.wait_for_background()
+    assert cached_paths(file_blobs) == sorted(paths)
+
+    # The next run changes one file: the others come from the cache
+    stub.prompts.clear()
+    file_blobs["src/module0.py"] = ("a" * 40, "2" * 40)
+    ai.generate_commit_messages("".join(map(file_diff, paths)), file_blobs=file_blobs, deadline=Deadline(10))
+    assert len(stub.prompts) == 1
+    assert stub.prompts[0].startswith("Write the commit message for a change to several files")
+    assert "- src/module5.py: update src/module5.py" in stub.prompts[0]
+
+
+def test_summaries_of_cut_off_files_are_not_cached(use_provider):
+    use_provider(answer)
+    paths = [f"src/module{i}.py" for i in range(11)]
+    diff = "".join(map(file_diff, paths)) + file_diff("src/last.py", 5, cut=10)
+    file_blobs = blobs(paths + ["src/last.py"])
+
+    ai.generate_commit_messages(diff, file_blobs=file_blobs, deadline=Deadline(10))
+    ai.wait_for_background()
+
+    assert cached_paths(file_blobs) == sorted(paths)
+
+
+def test_small_commits_do_not_use_the_summary_cache(use_provider):
+    stub = use_provider(answer)
+    paths = ["a.py", "b.py"]
+
+    ai.generate_commit_messages("".join(map(file_diff, paths)), file_blobs=blobs(paths), deadline=Deadline(10))
+    ai.wait_for_background()
+
+    assert len(stub.prompts) == 1
+    assert cached_paths(blobs(paths)) == []